@@ -0,0 +1,182 @@
+import time
+import random
+import asyncio
+import aiohttp
+
+from obittools.misc_utils import USER_AGENT_STRING
+from obittools.fetch import extract_title
+from obittools.probing import build_url, classify_probe, probe_result, hit_status_message, MISS_STATUS_MESSAGE
+
+
+# outcomes/status codes that mean "slow down"
+BACKOFF_STATUS_CODES = (429, 502, 503)
+BACKOFF_OUTCOMES = ("blocked", "challenge", "bad_gateway")
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = min(self.tokens, self.capacity)
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease control of concurrency and request rate.
+
+    every clean response nudges the concurrency limit up by ~1 per window of `limit` responses and the
+    rate up by rate_step; a backoff signal (access denied, 429, 502, ...) halves both. Backoffs within
+    `cooldown` seconds of the last one are counted once, since concurrent requests fail together.
+    """
+
+    def __init__(self, bucket, initial_limit=4, min_limit=1, max_limit=64, min_rate=0.2, max_rate=50.0,
+                 rate_step=0.05, decrease=0.5, cooldown=5.0):
+        self.bucket = bucket
+        self.limit = float(initial_limit)
+        self.min_limit, self.max_limit = min_limit, max_limit
+        self.min_rate, self.max_rate = min_rate, max_rate
+        self.rate_step = rate_step
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.last_backoff = 0.0
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.backoffs = 0
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        await self.bucket.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+        self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.rate_step))
+
+    def on_backoff(self):
+        now = time.monotonic()
+        if now - self.last_backoff < self.cooldown:
+            return
+        self.last_backoff = now
+        self.backoffs += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease)
+        self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+
+    def state(self):
+        return {"concurrency": int(self.limit), "rate": round(self.bucket.rate, 2), "backoffs": self.backoffs}
+
+
+async def fetch_probe(session, obit_id, timeout):
+    url = build_url(obit_id)
+    async with session.get(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        page_source = await response.text(errors="replace")
+        return response.status, str(response.url), extract_title(page_source), page_source
+
+
+async def probe_ids(ids, on_result, on_escalate=None, rate=2.0, initial_concurrency=4, max_concurrency=64,
+                    max_tries=5, timeout=20, status_every=1000):
+    """
+    probe obituary ids concurrently, adapting concurrency and request rate to the server's responses
+    :param ids: iterable of obituary ids
+    :param on_result: callable(result dict, page_source or None) called as each id finishes; page_source is only
+                      passed for hits. result dicts have the same shape as random_sample.check_url's
+    :param on_escalate: optional callable(obit_id) for ids that did not redirect over plain http (the redirect may
+                        need javascript); they are handed off for a browser probe instead of being reported
+    :param rate: initial requests per second
+    :param initial_concurrency: initial number of requests in flight
+    :param max_concurrency: upper bound for the concurrency limit (also the number of worker tasks)
+    :param max_tries: attempts per id before it is reported as an error
+    :param status_every: print controller state every this many finished ids
+    :return: dict of controller state and outcome counts
+    """
+    bucket = TokenBucket(rate)
+    controller = AIMDController(bucket, initial_limit=initial_concurrency, max_limit=max_concurrency)
+    queue = asyncio.Queue()
+    for obit_id in ids:
+        queue.put_nowait((obit_id, 0))
+    counts = {"hit": 0, "miss": 0, "error": 0, "escalated": 0}
+    finished = 0
+
+    async def worker(session):
+        nonlocal finished
+        while True:
+            try:
+                obit_id, tries = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            status_code, current_url, current_title, page_source, error = None, "", "", None, None
+            try:
+                async with controller:
+                    status_code, current_url, current_title, page_source = await fetch_probe(session, obit_id, timeout)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = str(e) or type(e).__name__
+
+            outcome = None if error else classify_probe(obit_id, current_url, current_title)
+            if status_code in BACKOFF_STATUS_CODES or outcome in BACKOFF_OUTCOMES or error:
+                if status_code in BACKOFF_STATUS_CODES or outcome in BACKOFF_OUTCOMES:
+                    controller.on_backoff()
+                if tries + 1 < max_tries:
+                    # retry later with jittered exponential backoff, without holding a slot
+                    await asyncio.sleep(min(60, 2 ** tries) * (0.5 + random.random()))
+                    queue.put_nowait((obit_id, tries + 1))
+                    continue
+                message = error or outcome or f"http {status_code}"
+                counts["error"] += 1
+                on_result(probe_result(obit_id, current_url, current_title, "ERROR", message), None)
+            else:
+                controller.on_success()
+                if outcome == "no_redirect" and on_escalate is not None:
+                    counts["escalated"] += 1
+                    on_escalate(obit_id)
+                elif outcome == "hit":
+                    counts["hit"] += 1
+                    on_result(probe_result(obit_id, current_url, current_title, "0",
+                                           hit_status_message(obit_id, current_url)), page_source)
+                else:
+                    counts["miss"] += 1
+                    message = "no redirect" if outcome == "no_redirect" else MISS_STATUS_MESSAGE
+                    on_result(probe_result(obit_id, current_url, current_title, "ERROR", message), None)
+            finished += 1
+            if status_every and finished % status_every == 0:
+                print(f"{finished} probed {counts} {controller.state()}")
+
+    connector = aiohttp.TCPConnector(limit=max_concurrency, ttl_dns_cache=300)
+    headers = {"User-Agent": USER_AGENT_STRING, "Accept": "text/html"}
+    async with aiohttp.ClientSession(connector=connector, headers=headers) as session:
+        # workers re-check the queue after retries, so keep going until nothing is left or pending
+        while not queue.empty():
+            await asyncio.gather(*(worker(session) for _ in range(max_concurrency)))
+
+    summary = dict(counts)
+    summary.update(controller.state())
+    return summary
@@ -0,0 +1,57 @@
+"""
+Browser settings shared by the scrapers.
+
+Obituary pages only need their HTML and the embedded hypernova/redux JSON, but a plain page load
+also pulls images, fonts, ad auctions, analytics beacons and video players. With resource blocking
+on, the driver's network layer (CDP Network.setBlockedURLs) refuses those requests by URL pattern
+before they are sent.
+"""
+
+
+BLOCKED_RESOURCE_PATTERNS = {
+    "images": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico", "*.bmp",
+               "*/images/*", "*cloudinary.com*", "*imgix.net*"],
+    "fonts": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*fonts.googleapis.com*", "*fonts.gstatic.com*",
+              "*use.typekit.net*"],
+    # the page json's adMap / rightRailAds / promoCardAd slots are filled from these
+    "ads": ["*doubleclick.net*", "*googlesyndication.com*", "*googletagservices.com*", "*adservice.google.*",
+            "*amazon-adsystem.com*", "*adnxs.com*", "*pubmatic.com*", "*rubiconproject.com*", "*openx.net*",
+            "*casalemedia.com*", "*criteo.*", "*taboola.com*", "*outbrain.com*", "*moatads.com*",
+            "*adsafeprotected.com*", "*3lift.com*", "*sharethrough.com*", "*indexww.com*", "*/prebid*",
+            "*/gpt.js*", "*/pubads_impl*"],
+    "analytics": ["*google-analytics.com*", "*googletagmanager.com*", "*/gtag/js*", "*segment.com*", "*segment.io*",
+                  "*hotjar.com*", "*newrelic.com*", "*nr-data.net*", "*scorecardresearch.com*", "*quantserve.com*",
+                  "*chartbeat.*", "*connect.facebook.net*", "*facebook.com/tr*", "*bat.bing.com*",
+                  "*clarity.ms*", "*optimizely.com*", "*branch.io*", "*permutive.com*"],
+    "video": ["*.mp4", "*.webm", "*.m3u8", "*.ts?*", "*viddler.com*", "*jwplayer*", "*jwpcdn.com*", "*jwpltx.com*",
+              "*brightcove*", "*youtube.com/embed*", "*ytimg.com*", "*vimeo.com*", "*connatix.com*"],
+}
+DEFAULT_BLOCKED_CLASSES = tuple(BLOCKED_RESOURCE_PATTERNS)
+
+
+def blocked_url_patterns(classes=DEFAULT_BLOCKED_CLASSES):
+    """
+    :param classes: resource classes to block, keys of BLOCKED_RESOURCE_PATTERNS
+    :return: list of url patterns for Network.setBlockedURLs
+    """
+    patterns = []
+    for resource_class in classes:
+        if resource_class not in BLOCKED_RESOURCE_PATTERNS:
+            raise ValueError(f"unknown resource class: {resource_class}")
+        patterns.extend(BLOCKED_RESOURCE_PATTERNS[resource_class])
+    return patterns
+
+
+def apply_resource_blocking(driver, classes=DEFAULT_BLOCKED_CLASSES):
+    """
+    block the given resource classes for every later page load of driver (chromium only)
+    """
+    # SB contexts wrap the webdriver in .driver
+    driver = getattr(driver, "driver", driver)
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked_url_patterns(classes)})
+
+
+def clear_resource_blocking(driver):
+    driver = getattr(driver, "driver", driver)
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": []})
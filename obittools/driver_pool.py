@@ -0,0 +1,194 @@
+import queue
+import random
+import threading
+import contextlib
+from time import sleep
+from seleniumbase import Driver, SB
+
+from obittools.driver_config import apply_resource_blocking
+
+
+INVALID_SESSION_MESSAGE = "invalid session id"
+
+
+def needs_reset(error_message):
+    """
+    :param error_message: str(exception) from a driver call
+    :return: True if the driver that raised it should be thrown away
+    """
+    return INVALID_SESSION_MESSAGE in error_message.lower() or "access denied" in error_message.lower()
+
+
+def make_driver_factory(block_resources=None, **driver_kwargs):
+    """
+    :param block_resources: optional resource classes to block on every new driver (see obittools.driver_config)
+    :param driver_kwargs: keyword arguments for seleniumbase.Driver
+    :return: factory returning (driver, close function)
+    """
+    def factory():
+        driver = Driver(**driver_kwargs)
+        if block_resources:
+            try:
+                apply_resource_blocking(driver, block_resources)
+            except Exception:
+                driver.quit()
+                raise
+        return driver, driver.quit
+    return factory
+
+
+def make_sb_factory(start_url=None, **sb_kwargs):
+    """
+    factory for seleniumbase SB contexts (needed for CDP mode and captcha clicks)
+    :param start_url: if given, CDP mode is activated on this url when the context opens
+    :param sb_kwargs: keyword arguments for seleniumbase.SB
+    :return: factory returning (sb, close function)
+    """
+    def factory():
+        stack = contextlib.ExitStack()
+        sb = stack.enter_context(SB(**sb_kwargs))
+        if start_url is not None:
+            sb.activate_cdp_mode(url=start_url)
+            sb.sleep(2)
+        return sb, stack.close
+    return factory
+
+
+def driver_is_alive(driver):
+    # SB contexts wrap the webdriver in .driver
+    driver = getattr(driver, "driver", driver)
+    try:
+        driver.current_url
+        return True
+    except Exception:
+        return False
+
+
+class DriverLease:
+    """A driver checked out of a DriverPool. Call reset() to have it discarded instead of reused."""
+
+    def __init__(self, driver, close, pages_served=0):
+        self.driver = driver
+        self.close = close
+        self.pages_served = pages_served
+        self.discard = False
+
+    def reset(self):
+        self.discard = True
+
+
+class DriverPool:
+    """
+    Keeps up to `size` browser drivers alive and hands them out to worker threads.
+
+    drivers are started lazily, health-checked before every lease, recycled after max_pages page
+    loads, and replaced whenever a lease is reset (access denied, invalid session, ...).
+    """
+
+    def __init__(self, size, max_pages=200, driver_factory=None, health_check=driver_is_alive,
+                 launch_jitter=0, block_resources=None, **driver_kwargs):
+        """
+        :param size: maximum number of live drivers (usually the number of threads)
+        :param max_pages: quit and replace a driver after it has loaded this many pages
+        :param driver_factory: callable returning (driver, close function); defaults to seleniumbase.Driver(**driver_kwargs)
+        :param health_check: callable(driver) -> bool run before a pooled driver is handed out
+        :param launch_jitter: sleep up to this many seconds before starting a browser so launches don't pile up
+        :param block_resources: resource classes (images, fonts, ads, analytics, video) the default factory's drivers
+                                refuse to load; ignored when driver_factory is given
+        """
+        self.size = size
+        self.max_pages = max_pages
+        self.driver_factory = driver_factory or make_driver_factory(block_resources=block_resources, **driver_kwargs)
+        self.health_check = health_check
+        self.launch_jitter = launch_jitter
+        self.idle = queue.LifoQueue()
+        self.live = 0
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(size)
+        self.closed = False
+        self.launched, self.recycled, self.resets = 0, 0, 0
+
+    def _launch(self):
+        if self.launch_jitter:
+            sleep(random.random() * self.launch_jitter)
+        driver, close = self.driver_factory()
+        with self.lock:
+            self.live += 1
+            self.launched += 1
+        return DriverLease(driver, close)
+
+    def _quit(self, lease):
+        try:
+            lease.close()
+        except Exception as e:
+            print(f"Error quitting driver: {e}")
+        with self.lock:
+            self.live -= 1
+
+    def acquire(self):
+        if self.closed:
+            raise RuntimeError("driver pool is closed")
+        self.slots.acquire()
+        try:
+            while True:
+                try:
+                    lease = self.idle.get_nowait()
+                except queue.Empty:
+                    return self._launch()
+                if self.health_check(lease.driver):
+                    lease.discard = False
+                    return lease
+                self._quit(lease)
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, lease):
+        lease.pages_served += 1
+        try:
+            if lease.discard or self.closed:
+                with self.lock:
+                    self.resets += 1
+                self._quit(lease)
+            elif lease.pages_served >= self.max_pages:
+                with self.lock:
+                    self.recycled += 1
+                self._quit(lease)
+            else:
+                self.idle.put(lease)
+        finally:
+            self.slots.release()
+
+    @contextlib.contextmanager
+    def lease(self):
+        """
+        with pool.lease() as lease:
+            lease.driver.get(url)
+        exceptions that indicate a dead or blocked session reset the lease automatically
+        """
+        lease = self.acquire()
+        try:
+            yield lease
+        except Exception as e:
+            if needs_reset(str(e)):
+                lease.reset()
+            raise
+        finally:
+            self.release(lease)
+
+    def close(self):
+        self.closed = True
+        while True:
+            try:
+                self._quit(self.idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self):
+        return {"launched": self.launched, "recycled": self.recycled, "resets": self.resets, "live": self.live}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,118 @@
+"""
+Worker processes that each own one long-lived browser.
+
+Work items are split into batches on a shared queue. Every worker starts a single-driver
+DriverPool, processes batches until it receives a stop sentinel, and always closes its browser on
+the way out (normal exit, exception or SIGTERM). Results stream back to the parent as they finish,
+and each worker reports its own throughput when it exits.
+"""
+
+import sys
+import time
+import queue
+import signal
+import multiprocessing
+
+from obittools.driver_pool import DriverPool
+
+
+def _exit_on_sigterm(signum, frame):
+    # turn SIGTERM into SystemExit so the worker's finally block quits the browser
+    sys.exit(0)
+
+
+class WorkerStats:
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.items, self.errors = 0, 0
+        self.busy_seconds = 0.0
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+        self.driver_stats = {}
+
+    def as_dict(self):
+        per_minute = 60 * self.items / self.wall_seconds if self.wall_seconds else 0.0
+        mean = self.busy_seconds / self.items if self.items else 0.0
+        return {"worker": self.worker_id, "items": self.items, "errors": self.errors,
+                "items_per_minute": round(per_minute, 2), "mean_seconds": round(mean, 2), **self.driver_stats}
+
+
+def driver_worker(worker_id, task_queue, result_queue, process_item, pool_kwargs):
+    """
+    worker process body
+    :param process_item: picklable callable(item, driver_pool) -> result
+    :param pool_kwargs: keyword arguments for this worker's DriverPool(1, ...)
+    """
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    stats = WorkerStats(worker_id)
+    driver_pool = DriverPool(1, **pool_kwargs)
+    try:
+        while True:
+            batch = task_queue.get()
+            if batch is None:
+                break
+            for item in batch:
+                start = time.perf_counter()
+                try:
+                    result = process_item(item, driver_pool)
+                    error = None
+                except Exception as e:
+                    result, error = None, str(e)
+                    stats.errors += 1
+                stats.items += 1
+                stats.busy_seconds += time.perf_counter() - start
+                result_queue.put(("result", worker_id, item, result, error))
+    finally:
+        driver_pool.close()
+        stats.wall_seconds = time.perf_counter() - stats.started
+        stats.driver_stats = driver_pool.stats()
+        result_queue.put(("exit", worker_id, stats.as_dict(), None, None))
+
+
+def run_driver_workers(items, process_item, workers=4, batch_size=8, **pool_kwargs):
+    """
+    process items over `workers` processes that each keep one browser alive for their whole lifetime
+    :param items: list of work items (picklable)
+    :param process_item: picklable top-level callable(item, driver_pool) -> result
+    :param batch_size: items handed to a worker at a time
+    :param pool_kwargs: DriverPool arguments (max_pages, launch_jitter, seleniumbase Driver kwargs, ...)
+    :return: generator of (item, result, error) in completion order; error is the exception message if
+             process_item raised. per-worker throughput is printed once all workers have exited.
+    """
+    context = multiprocessing.get_context()
+    task_queue, result_queue = context.Queue(), context.Queue()
+    for start in range(0, len(items), batch_size):
+        task_queue.put(items[start:start + batch_size])
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = [context.Process(target=driver_worker, args=(worker_id, task_queue, result_queue, process_item,
+                                                             pool_kwargs), daemon=False)
+                 for worker_id in range(workers)]
+    for process in processes:
+        process.start()
+
+    worker_stats = {}
+    try:
+        while len(worker_stats) < workers:
+            try:
+                kind, worker_id, payload, result, error = result_queue.get(timeout=10)
+            except queue.Empty:
+                # a worker killed outright (e.g. by the OOM killer) never sends its exit message
+                for worker_id, process in enumerate(processes):
+                    if worker_id not in worker_stats and not process.is_alive():
+                        print(f"worker {worker_id} died with exit code {process.exitcode}")
+                        worker_stats[worker_id] = {"worker": worker_id, "died": process.exitcode}
+                continue
+            if kind == "exit":
+                worker_stats[worker_id] = payload
+            else:
+                yield payload, result, error
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join(timeout=30)
+        for worker_id in sorted(worker_stats):
+            print(worker_stats[worker_id])
@@ -1,5 +1,6 @@
+import re
 import json
-from bs4 import BeautifulSoup # check?
+from bs4 import BeautifulSoup, NavigableString, Comment # check?
 
 
 # key: personSchema
@@ -15,7 +16,75 @@ from bs4 import BeautifulSoup # check?
 # values: related to funeral event
 
 
-def get_schema_section(html_text):
+HYPERNOVA_ATTRIBUTE = 'data-hypernova-key="ObituaryPage"'
+REDUX_START_MARKER = '<!--REDUX DATA-->'
+REDUX_END_MARKER = '<!--VIDDLER-->'
+# a script only ends at "</script" followed by whitespace, "/" or ">"; json strings can contain "</script&gt;"
+SCRIPT_END_PATTERN = re.compile(r'</script[\s/>]', re.IGNORECASE)
+
+
+def find_hypernova_script_span(html_text, start=0):
+    """
+    locate the contents of the <script data-hypernova-key="ObituaryPage"> block by string offsets
+    :param html_text: raw page html
+    :param start: offset to start searching from
+    :return: (begin, end) offsets of the script contents, or None if no such script exists
+    """
+    position = html_text.find(HYPERNOVA_ATTRIBUTE, start)
+    while position != -1:
+        tag_start = html_text.rfind('<', 0, position)
+        # the rendered <div> carries the same attribute, so only accept it on a <script> tag
+        if tag_start != -1 and html_text[tag_start:tag_start + 7].lower() == '<script':
+            tag_end = html_text.find('>', position)
+            if tag_end == -1:
+                return None
+            script_end = SCRIPT_END_PATTERN.search(html_text, tag_end)
+            if script_end is None:
+                return None
+            return tag_end + 1, script_end.start()
+        position = html_text.find(HYPERNOVA_ATTRIBUTE, position + len(HYPERNOVA_ATTRIBUTE))
+    return None
+
+
+def find_redux_span(html_text):
+    """
+    locate the region between <!--REDUX DATA--> and the next <!--VIDDLER--> marker
+    :param html_text: raw page html
+    :return: (begin, end) offsets of the region, or None if the page has no redux marker
+    """
+    begin = html_text.find(REDUX_START_MARKER)
+    if begin == -1:
+        return None
+    begin += len(REDUX_START_MARKER)
+    end = html_text.find(REDUX_END_MARKER, begin)
+    if end == -1:
+        end = len(html_text)
+    return begin, end
+
+
+def get_schema_section_fast(html_text):
+    """
+    scanner-based version of get_schema_section that never builds a soup
+    :param html_text: raw page html
+    :return: parsed metadata json, or None if the fast path could not find it
+    """
+    span = find_hypernova_script_span(html_text)
+    if span is not None:
+        try:
+            # script contents are wrapped in <!-- -->
+            return json.loads(html_text[span[0] + 4:span[1] - 3])
+        except json.JSONDecodeError:
+            return None
+    span = find_redux_span(html_text)
+    if span is not None:
+        try:
+            return json.loads(html_text[span[0]:span[1]].strip())
+        except json.JSONDecodeError:
+            return None
+    return None
+
+
+def get_schema_section_soup(html_text):
     soup = BeautifulSoup(html_text, 'html.parser')
     json_schemas = soup.find('script', {'data-hypernova-key': 'ObituaryPage'})
     if json_schemas:
@@ -38,6 +107,17 @@ def get_schema_section(html_text):
         return None
 
 
+def get_schema_section(html_text):
+    json_schemas = get_schema_section_fast(html_text)
+    if json_schemas is not None:
+        return json_schemas
+    if 'ObituaryPage' not in html_text and REDUX_START_MARKER not in html_text:
+        # nothing the soup parser could find either
+        return None
+    # fall back to the soup parser for unusual markup (quoting, casing, malformed json)
+    return get_schema_section_soup(html_text)
+
+
 def parse_page_metadata_from_schemas_in_html(page_html):
     json_metadata_object = get_schema_section(page_html)
     if not json_metadata_object:
@@ -119,45 +199,76 @@ def parse_page_metadata_from_schemas_in_html(page_html):
     return json_metadata_object, results_dict
 
 
-def load_obit_text_and_metadata_from_html(page_html):
+BLOCK_TAGS = ('p', 'div', 'li', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'section')
+
+
+def rendered_text(element):
+    """
+    approximate a browser's visible text for an element (what selenium's element.text returns):
+    <br> and block elements start new lines, runs of whitespace collapse, blank lines are dropped
+    """
+    parts = []
+    for node in element.descendants:
+        if isinstance(node, NavigableString):
+            if not isinstance(node, Comment):
+                parts.append(str(node))
+        elif node.name == 'br':
+            parts.append('\n')
+        elif node.name in BLOCK_TAGS:
+            parts.append('\n')
+    lines = (' '.join(line.split()) for line in ''.join(parts).split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+def load_obit_text_and_metadata_from_html(page_html, rendered=False):
+    """
+    parse an obituary page's visible text and funeral home details
+    :param page_html: page source
+    :param rendered: extract text the way the browser renders it (line breaks kept, whitespace collapsed), matching
+                     what the driver's element.text returns; by default the raw concatenated text is used
+    :return: dict, or None if the page has no obituary text
+    """
     soup = BeautifulSoup(page_html, 'html.parser')
+    get_text = rendered_text if rendered else (lambda element: element.text)
 
     obit_data = {}
 
     # get features
     name = soup.find('h2', {'data-component': 'NameHeadingText'})
     if name:
-        name = name.text
+        name = get_text(name)
     else:
         name = 'unknown'
 
     # note that text is wrapped in <p> tags
     text = soup.find('div', {'data-component': 'ObituaryText'})
     if text:  # first kind of page
-        text = text.text
+        text = get_text(text)
     else:
         text = soup.find('div', {'data-component': 'ObituaryParagraph'})
         if text:
-            text = text.text
+            text = get_text(text)
         else:
             return None
 
+    funeral_home = 'unknown'
     attribute_box = soup.find('div', {'data-component': 'AttributeValuesBox'})
     if not attribute_box:
         e = soup.find('a', {'data-component': 'FuneralHomeDirectoryLink'})
         if e:
+            funeral_home = get_text(e)
             funeral_home_link = e.text
-            funeral_location = soup.find('p', {'data-component': 'MemorialEventsFuneralHomeAddress'}).text
+            address = soup.find('p', {'data-component': 'MemorialEventsFuneralHomeAddress'})
+            funeral_location = get_text(address) if address else 'unknown'
         else:
             funeral_home_link = 'unknown'
             funeral_location = 'unknown'
     else:
         a_els = attribute_box.find_all('a')
         if a_els:
-            funeral_home = attribute_box.find_all('a')[0].text
-            funeral_home_link = attribute_box.find_all('a')[0]['href']
-            p_els = attribute_box.find_all('p')
-            funeral_location = '\n'.join([e.text for e in attribute_box.find_all('p')])
+            funeral_home = get_text(a_els[0])
+            funeral_home_link = a_els[0]['href']
+            funeral_location = '\n'.join([get_text(e) for e in attribute_box.find_all('p')])
         else:
             funeral_home_link = 'unknown'
             funeral_location = 'unknown'
@@ -173,6 +284,7 @@ def load_obit_text_and_metadata_from_html(page_html):
 
     obit_data['name'] = name
     obit_data['text'] = text
+    obit_data['funeral_home_name'] = funeral_home
     obit_data['funeral_home_link'] = funeral_home_link
     obit_data['funeral_location'] = funeral_location
     if lifespan and len(lifespan) == 2:
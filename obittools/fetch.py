@@ -0,0 +1,133 @@
+import re
+import html
+import time
+import threading
+
+from obittools.misc_utils import make_session
+from obittools.probing import classify_probe, is_blocked_title, is_challenge_title
+
+
+TITLE_PATTERN = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+# status codes where the plain http answer can't be trusted and a real browser should retry
+ESCALATE_STATUS_CODES = (403, 429, 503)
+# markers that the server actually rendered the obituary instead of leaving it to javascript
+RENDERED_PAGE_MARKERS = ('data-hypernova-key="ObituaryPage"', "<!--REDUX DATA-->", "window.__PRELOADED_STATE__",
+                         "window.__INITIAL_STATE__")
+
+
+def extract_title(page_source):
+    match = TITLE_PATTERN.search(page_source)
+    return html.unescape(match.group(1)).strip() if match else ""
+
+
+class FetchResult:
+    def __init__(self, tier, current_url, current_title, page_source, status_code=None):
+        self.tier = tier
+        self.current_url = current_url
+        self.current_title = current_title
+        self.page_source = page_source
+        self.status_code = status_code
+
+
+class TierStats:
+    def __init__(self):
+        self.requests, self.hits, self.escalations, self.errors = 0, 0, 0, 0
+        self.seconds = 0.0
+
+    def as_dict(self):
+        mean = self.seconds / self.requests if self.requests else 0.0
+        return {"requests": self.requests, "hits": self.hits, "escalations": self.escalations, "errors": self.errors,
+                "mean_seconds": round(mean, 3)}
+
+
+class TieredFetcher:
+    """
+    Fetch probe pages over plain http first and only fall back to a browser when needed.
+
+    the http tier follows the redirect chain with a pooled requests session; the browser tier
+    (a DriverPool) is only used for block/challenge pages, http errors, or pages that did not
+    redirect and carry no server-rendered obituary (i.e. javascript-only content).
+    """
+
+    def __init__(self, driver_pool=None, pool_size=16, timeout=20, use_http=True, browser_wait=None):
+        """
+        :param driver_pool: DriverPool for the browser tier; None disables escalation
+        :param pool_size: http connections kept alive (match the number of threads)
+        :param use_http: set False to send everything straight to the browser
+        :param browser_wait: optional callable(driver) run after driver.get, e.g. a WebDriverWait
+        """
+        self.driver_pool = driver_pool
+        self.session = make_session(pool_size=pool_size)
+        self.timeout = timeout
+        self.use_http = use_http
+        self.browser_wait = browser_wait
+        self.stats = {"http": TierStats(), "browser": TierStats()}
+        self.lock = threading.Lock()
+
+    def _record(self, tier, seconds, hit=False, escalated=False, error=False):
+        with self.lock:
+            stats = self.stats[tier]
+            stats.requests += 1
+            stats.seconds += seconds
+            stats.hits += int(hit)
+            stats.escalations += int(escalated)
+            stats.errors += int(error)
+
+    def fetch_http(self, url):
+        response = self.session.get(url, timeout=self.timeout, allow_redirects=True)
+        return FetchResult("http", response.url, extract_title(response.text), response.text, response.status_code)
+
+    def fetch_browser(self, url):
+        with self.driver_pool.lease() as lease:
+            driver = lease.driver
+            driver.get(url)
+            if self.browser_wait is not None:
+                self.browser_wait(driver)
+            result = FetchResult("browser", driver.current_url, driver.title, driver.page_source)
+            if is_blocked_title(result.current_title):
+                lease.reset()
+        return result
+
+    def needs_browser(self, obit_id, result):
+        if result.status_code in ESCALATE_STATUS_CODES:
+            return True
+        if is_blocked_title(result.current_title) or is_challenge_title(result.current_title):
+            return True
+        if classify_probe(obit_id, result.current_url, result.current_title) == "no_redirect":
+            # no server-side redirect: only trust it if the page itself was rendered on the server
+            return not any(marker in result.page_source for marker in RENDERED_PAGE_MARKERS)
+        return False
+
+    def fetch(self, url, obit_id):
+        """
+        :return: FetchResult from the cheapest tier that gave a usable answer
+        """
+        if self.use_http:
+            start = time.perf_counter()
+            try:
+                result = self.fetch_http(url)
+            except Exception as e:
+                self._record("http", time.perf_counter() - start, escalated=self.driver_pool is not None, error=True)
+                if self.driver_pool is None:
+                    raise
+                print(f"{obit_id} http tier failed, escalating: {e}")
+            else:
+                escalate = self.driver_pool is not None and self.needs_browser(obit_id, result)
+                hit = classify_probe(obit_id, result.current_url, result.current_title) == "hit"
+                self._record("http", time.perf_counter() - start, hit=hit and not escalate, escalated=escalate)
+                if not escalate:
+                    return result
+
+        start = time.perf_counter()
+        try:
+            result = self.fetch_browser(url)
+        except Exception:
+            self._record("browser", time.perf_counter() - start, error=True)
+            raise
+        hit = classify_probe(obit_id, result.current_url, result.current_title) == "hit"
+        self._record("browser", time.perf_counter() - start, hit=hit)
+        return result
+
+    def report(self):
+        with self.lock:
+            return {tier: stats.as_dict() for tier, stats in self.stats.items()}
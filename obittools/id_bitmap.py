@@ -0,0 +1,168 @@
+"""
+Checkpoint store for random ID sampling.
+
+Two file-backed bitmaps over the ID space (one bit per id, ~7.5 MB each for 60M ids) record which
+ids have been probed and which were hits. They are memory-mapped, so every mark is a single bit set
+and a flush is an msync. The ids of the round in progress are kept next to them, which lets an
+interrupted run resume mid-round and lets new rounds draw only ids that were never probed.
+"""
+
+import os
+import json
+import mmap
+import time
+import random
+import numpy as np
+
+
+MAX_ID = 60000000
+PROBED_FILE_NAME = "probed.bitmap"
+HITS_FILE_NAME = "hits.bitmap"
+ROUND_FILE_NAME = "round.json"
+
+
+class IdBitmap:
+    """A memory-mapped set of non-negative integer ids below size."""
+
+    def __init__(self, path, size=MAX_ID + 1):
+        self.path = path
+        self.size = size
+        n_bytes = (size + 7) // 8
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self.file = open(path, mode)
+        if os.fstat(self.file.fileno()).st_size < n_bytes:
+            self.file.truncate(n_bytes)
+        self.map = mmap.mmap(self.file.fileno(), n_bytes)
+
+    def add(self, obit_id):
+        obit_id = int(obit_id)
+        self.map[obit_id >> 3] |= 1 << (obit_id & 7)
+
+    def __contains__(self, obit_id):
+        obit_id = int(obit_id)
+        return 0 <= obit_id < self.size and bool(self.map[obit_id >> 3] & (1 << (obit_id & 7)))
+
+    def bits(self, begin=0, end=None):
+        """
+        :return: numpy bool array, element i is True if begin + i is in the set
+        """
+        end = self.size if end is None else min(end, self.size)
+        first_byte, last_byte = begin >> 3, (end + 7) >> 3
+        raw = np.frombuffer(self.map, dtype=np.uint8, count=last_byte - first_byte, offset=first_byte)
+        unpacked = np.unpackbits(raw, bitorder="little").astype(bool)
+        start = begin - (first_byte << 3)
+        return unpacked[start:start + end - begin]
+
+    def count(self, begin=0, end=None):
+        return int(self.bits(begin, end).sum())
+
+    def ids(self, begin=0, end=None):
+        return (np.flatnonzero(self.bits(begin, end)) + begin).tolist()
+
+    def flush(self):
+        self.map.flush()
+
+    def close(self):
+        if not self.map.closed:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+
+class SamplingCheckpoint:
+    """
+    Probed/hit bitmaps plus the current round's ids for one collection.
+
+    results are marked as they arrive and flushed every flush_every marks or flush_seconds seconds,
+    so at most that much work is repeated after a crash.
+    """
+
+    def __init__(self, checkpoint_dir, max_id=MAX_ID, flush_every=1000, flush_seconds=30):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.checkpoint_dir = checkpoint_dir
+        self.probed = IdBitmap(os.path.join(checkpoint_dir, PROBED_FILE_NAME), max_id + 1)
+        self.hits = IdBitmap(os.path.join(checkpoint_dir, HITS_FILE_NAME), max_id + 1)
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def mark(self, obit_id, hit):
+        self.probed.add(obit_id)
+        if hit:
+            self.hits.add(obit_id)
+        self.unflushed += 1
+        if self.unflushed >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.probed.flush()
+        self.hits.flush()
+        self.unflushed = 0
+        self.last_flush = time.monotonic()
+
+    def _write_round(self, state):
+        # written to a temp file and renamed so a crash never leaves a half-written round
+        round_path = os.path.join(self.checkpoint_dir, ROUND_FILE_NAME)
+        with open(round_path + ".tmp", "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(round_path + ".tmp", round_path)
+
+    def start_round(self, round_number, ids):
+        self._write_round({"round": round_number, "ids": list(ids)})
+
+    def finish_round(self, round_number):
+        """
+        record that the round's log has been finalized, so a restart starts the next round instead of
+        retrying this one's errors under a new log
+        """
+        self._write_round({"round": round_number, "ids": [], "complete": True})
+
+    def load_round(self):
+        """
+        :return: (round number, ids of that round not yet probed), or (None, []) if there is no round to resume;
+                 a finished round comes back with no ids
+        """
+        round_path = os.path.join(self.checkpoint_dir, ROUND_FILE_NAME)
+        if not os.path.exists(round_path):
+            return None, []
+        with open(round_path, "r") as f:
+            state = json.load(f)
+        if state.get("complete"):
+            return state["round"], []
+        return state["round"], [obit_id for obit_id in state["ids"] if obit_id not in self.probed]
+
+    def sample_unprobed(self, begin, end, k, rng=random):
+        """
+        draw k distinct ids from range(begin, end) that have never been probed
+        rejection sampling while the range is mostly unprobed, otherwise sample from the enumerated remainder
+        """
+        available = (end - begin) - self.probed.count(begin, end)
+        if available <= k:
+            remaining = (np.flatnonzero(~self.probed.bits(begin, end)) + begin).tolist()
+            rng.shuffle(remaining)
+            return remaining
+        if available > 2 * k:
+            chosen = set()
+            attempts, max_attempts = 0, 10 * k + 1000
+            while len(chosen) < k and attempts < max_attempts:
+                obit_id = rng.randrange(begin, end)
+                if obit_id not in self.probed:
+                    chosen.add(obit_id)
+                attempts += 1
+            if len(chosen) == k:
+                return list(chosen)
+        remaining = np.flatnonzero(~self.probed.bits(begin, end)) + begin
+        return rng.sample(remaining.tolist(), k)
+
+    def close(self):
+        self.probed.close()
+        self.hits.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,153 @@
+"""
+Character-level grammar for the fixed-shape JSON labels a local model is asked for, and the token masks that keep
+generation inside it.
+
+For fields ['birth_year', 'cause_of_death'] the only accepted output is
+
+    {"birth_year": <year or null>, "cause_of_death": <string or null>}
+    </output>
+
+Years are exactly four digits starting with 1 or 2; strings are double-quoted, without backslashes or control
+characters. Keys and punctuation are fixed, so the model only chooses the values and every finished output parses
+with json.loads. States are small tuples, so the allowed tokens for each state are computed once and cached.
+"""
+
+import bisect
+
+
+YEAR = 'year'
+STRING = 'string'
+END_TAG = '</output>'
+DONE = ('done',)
+
+
+class LabelGrammar:
+    """
+    :param fields: label names, in output order
+    :param kinds: YEAR or STRING for each field
+    """
+
+    def __init__(self, fields, kinds, end='\n' + END_TAG):
+        self.fields = tuple(fields)
+        self.kinds = tuple(kinds)
+        self.key = (self.fields, self.kinds, end)
+        # literal text before each value, then the closing text; position 2i is literal i, 2i + 1 is value i
+        self.literals = [('{"' if i == 0 else ', "') + f'{field}": ' for i, field in enumerate(self.fields)]
+        self.literals.append('}' + end)
+        self.start = self._at(0)
+
+    def _at(self, position):
+        if position > 2 * len(self.fields):
+            return DONE
+        return (position, 'lit', 0) if position % 2 == 0 else (position, 'start', 0)
+
+    def step(self, state, ch):
+        """
+        :return: state after reading ch, or None if ch is not allowed here
+        """
+        if state == DONE:
+            return None
+        position, mode, k = state
+        if mode == 'lit':
+            text = self.literals[position // 2]
+            if ch != text[k]:
+                return None
+            return self._at(position + 1) if k + 1 == len(text) else (position, 'lit', k + 1)
+        if mode == 'start':
+            kind = self.kinds[position // 2]
+            if ch == 'n':
+                return (position, 'null', 1)
+            if kind == YEAR and ch in '12':
+                return (position, 'digits', 1)
+            if kind == STRING and ch == '"':
+                return (position, 'str', 0)
+            return None
+        if mode == 'null':
+            if ch != 'null'[k]:
+                return None
+            return self._at(position + 1) if k + 1 == 4 else (position, 'null', k + 1)
+        if mode == 'digits':
+            if ch not in '0123456789':
+                return None
+            return self._at(position + 1) if k + 1 == 4 else (position, 'digits', k + 1)
+        # inside a string
+        if ch == '"':
+            return self._at(position + 1)
+        if ch == '\\' or ch < ' ':
+            return None
+        return state
+
+    def run(self, state, text):
+        for ch in text:
+            state = self.step(state, ch)
+            if state is None:
+                return None
+        return state
+
+    def max_tokens(self, max_string_tokens):
+        """
+        upper bound on generated tokens for a complete output when every token adds at least one character and
+        strings are closed after max_string_tokens tokens
+        """
+        values = sum(4 if kind == YEAR else max_string_tokens + 2 for kind in self.kinds)
+        return sum(len(text) for text in self.literals) + values + 1
+
+
+def is_string_content(state):
+    return state is not None and state != DONE and state[1] == 'str'
+
+
+class TokenMasks:
+    """
+    Allowed token ids per grammar state, for one tokenizer.
+
+    :param vocab: decoded text of each token id, in context (see llm_labeler.OutputDecoding)
+    :param special_ids: ids that are never allowed inside the output (eos is added by the caller once it is done)
+    """
+
+    def __init__(self, vocab, special_ids=()):
+        self.vocab = vocab
+        special_ids = set(special_ids)
+        usable = [(text, i) for i, text in enumerate(vocab) if text and i not in special_ids]
+        self.by_text = {}
+        self.by_first = {}
+        for text, i in usable:
+            self.by_text.setdefault(text, []).append(i)
+            self.by_first.setdefault(text[0], []).append(i)
+        usable.sort()
+        self.sorted_texts = [text for text, _ in usable]
+        self.sorted_ids = [i for _, i in usable]
+        # tokens that can appear anywhere inside a string without ending it, and tokens that contain its closing quote
+        self.plain = [i for text, i in usable if '"' not in text and '\\' not in text and min(text) >= ' ']
+        self.quoted = [i for text, i in usable if '"' in text]
+        self.cache = {}
+
+    def allowed(self, grammar, state, close=False):
+        """
+        :param close: inside a string, only allow tokens that close it
+        :return: list of token ids whose text is valid from state
+        """
+        key = (grammar.key, state, close)
+        if key not in self.cache:
+            self.cache[key] = self._allowed(grammar, state, close)
+        return self.cache[key]
+
+    def _allowed(self, grammar, state, close):
+        if state == DONE:
+            return []
+        position, mode, k = state
+        if mode == 'lit':
+            text = grammar.literals[position // 2][k:]
+            ids = [i for n in range(1, len(text) + 1) for i in self.by_text.get(text[:n], ())]
+            # tokens that finish the literal and run on into the next value
+            start = bisect.bisect_right(self.sorted_texts, text)
+            for j in range(start, len(self.sorted_texts)):
+                if not self.sorted_texts[j].startswith(text):
+                    break
+                if grammar.run(state, self.sorted_texts[j]) is not None:
+                    ids.append(self.sorted_ids[j])
+            return ids
+        if mode == 'str' and not close:
+            return self.plain + [i for i in self.quoted if grammar.run(state, self.vocab[i]) is not None]
+        firsts = ['"'] if close else [ch for ch in self.by_first if grammar.step(state, ch) is not None]
+        return [i for ch in firsts for i in self.by_first.get(ch, ()) if grammar.run(state, self.vocab[i]) is not None]
@@ -2,6 +2,7 @@ import pandas as pd
 import time
 import requests
 import numpy as np
+from requests.adapters import HTTPAdapter
 
 
 USER_AGENT_STRING = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
@@ -17,6 +18,21 @@ def make_request(url, user_agent=None):
     return page
 
 
+def make_session(user_agent=None, pool_size=16):
+    """
+    pooled requests session with the same headers as make_request; reuse it across calls to keep connections alive
+    :param pool_size: max connections kept open per host (match the number of threads using the session)
+    """
+    if not user_agent:
+        user_agent = USER_AGENT_STRING
+    session = requests.Session()
+    session.headers.update({'User-Agent': user_agent, 'Accept': 'text/html'})
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
 def get_big_msas_and_states():
     path = "/data/laviniad/obits/aux/cbsa-met-est2023-pop.csv"
     df = pd.read_csv(path)
@@ -0,0 +1,100 @@
+import re
+
+
+# matches an opening <script>/<div> tag (attribute values may contain '>') or a closing </div>
+TAG_PATTERN = re.compile(r"""<(script|div)\b((?:[^>"']|"[^"]*"|'[^']*')*)>|</div\s*>""", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r"""([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+SCRIPT_END_PATTERN = re.compile(r"</script", re.IGNORECASE)
+
+PRELOADED_STATE_MARKER = "window.__PRELOADED_STATE__"
+INITIAL_STATE_MARKER = "window.__INITIAL_STATE__"
+
+
+def parse_attributes(attribute_text):
+    """
+    :param attribute_text: everything between the tag name and the closing '>'
+    :return: dict of lowercased attribute name -> value (None for bare attributes)
+    """
+    attributes = {}
+    for match in ATTRIBUTE_PATTERN.finditer(attribute_text):
+        value = match.group(2)
+        if value is not None and value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attributes.setdefault(match.group(1).lower(), value)
+    return attributes
+
+
+def classify_page(html_text):
+    """
+    identify the layout of a saved obituary page in one linear scan of the raw html
+
+    script spans cover the script contents; div spans cover the whole element including its tags,
+    so they can be handed straight to BeautifulSoup.
+    :param html_text: raw page html
+    :return: (page format, dict of block name -> (begin, end) offsets); format is one of
+             "hypernova_rendered", "redux_preloaded", "redux_initial", "person_94", "person_125", "missing"
+    """
+    metadata_spans, rendered_spans = [], []
+    preloaded_spans, initial_spans = [], []
+    person_spans = {"94": [], "125": []}
+
+    # open divs we care about, as (depth at which they were opened, list to append the span to, start offset)
+    open_blocks = []
+    depth = 0
+    position = 0
+    while True:
+        match = TAG_PATTERN.search(html_text, position)
+        if match is None:
+            break
+        position = match.end()
+        tag_name = match.group(1)
+
+        if tag_name is None:  # </div>
+            depth -= 1
+            if open_blocks and open_blocks[-1][0] == depth:
+                _, spans, start = open_blocks.pop()
+                spans.append((start, match.end()))
+            continue
+
+        if tag_name.lower() == "script":
+            end_match = SCRIPT_END_PATTERN.search(html_text, position)
+            content_end = end_match.start() if end_match else len(html_text)
+            attributes = parse_attributes(match.group(2))
+            if attributes.get("data-hypernova-key") == "ObituaryPage" and attributes.get("type") == "application/json":
+                metadata_spans.append((position, content_end))
+            elif "type" not in attributes and "src" not in attributes and "id" not in attributes:
+                if html_text.find(PRELOADED_STATE_MARKER, position, content_end) != -1:
+                    preloaded_spans.append((position, content_end))
+                if html_text.find(INITIAL_STATE_MARKER, position, content_end) != -1:
+                    initial_spans.append((position, content_end))
+            # script contents are raw text, never markup
+            position = content_end
+            continue
+
+        # <div>
+        attribute_text = match.group(2)
+        if attribute_text.rstrip().endswith("/"):
+            continue
+        if "ObituaryPage" in attribute_text or "Person" in attribute_text:
+            attributes = parse_attributes(attribute_text)
+            if attributes.get("data-hypernova-key") == "ObituaryPage":
+                open_blocks.append((depth, rendered_spans, match.start()))
+            elif "Person" in (attributes.get("class") or "").split() and attributes.get("data-reactid") in person_spans:
+                open_blocks.append((depth, person_spans[attributes["data-reactid"]], match.start()))
+        depth += 1
+
+    # unclosed blocks run to the end of the document, as they would for html.parser
+    for _, spans, start in open_blocks:
+        spans.append((start, len(html_text)))
+
+    if len(metadata_spans) == 1 and len(rendered_spans) == 1:
+        return "hypernova_rendered", {"metadata": metadata_spans[0], "rendered": rendered_spans[0]}
+    if len(preloaded_spans) == 1:
+        return "redux_preloaded", {"script": preloaded_spans[0]}
+    if len(initial_spans) == 1:
+        return "redux_initial", {"script": initial_spans[0]}
+    if len(person_spans["94"]) == 1:
+        return "person_94", {"person": person_spans["94"][0]}
+    if len(person_spans["125"]) == 1:
+        return "person_125", {"person": person_spans["125"][0]}
+    return "missing", {}
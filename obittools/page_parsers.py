@@ -0,0 +1,279 @@
+import json
+from bs4 import BeautifulSoup, SoupStrainer
+
+from obittools.records import ObitMetadataRow
+from obittools.page_format import classify_page
+
+
+# the only parts of the rendered hypernova <div> that parse_page_hypernova_rendered reads
+RENDERED_PAGE_STRAINER = SoupStrainer("div", attrs={"data-component": ["ObituaryParagraph", "NonAffiliateSympathyCta"]})
+
+PAGE_FORMATS = ["hypernova_rendered", "redux_preloaded", "redux_initial", "person_94", "person_125", "missing"]
+
+
+def parse_page_hypernova_rendered(obit_id, metadata_script_text, rendered_page_block):
+    metadata_row = ObitMetadataRow(obit_id, "hypernova_rendered")
+
+    obit_text_blocks = rendered_page_block.find_all("div", {"data-component": "ObituaryParagraph"})
+    if len(obit_text_blocks) > 1:
+        print(f"ERROR: {obit_id} has more than one obituary paragraph")
+    elif len(obit_text_blocks) == 1:
+        metadata_row.obituary_paragraph = obit_text_blocks[0].get_text(separator=" ")
+    cta_blocks = rendered_page_block.find_all("div", {"data-component": "NonAffiliateSympathyCta"})
+    if len(cta_blocks) > 1:
+        print(f"ERROR: {obit_id} has more than one non-affiliate cta")
+    elif len(cta_blocks) == 1:
+        metadata_row.sympathy_cta = cta_blocks[0].get_text(separator=" ")
+
+    metadata_dict = json.loads(metadata_script_text[4:-3])
+
+    if "contentModules" in metadata_dict:
+        if "name" in metadata_dict["contentModules"]:
+            if "firstName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.first_name = metadata_dict["contentModules"]["name"]["firstName"]
+            if "lastName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.last_name = metadata_dict["contentModules"]["name"]["lastName"]
+            if "middleName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.middle_name = metadata_dict["contentModules"]["name"]["middleName"]
+            if "fullName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.full_name = metadata_dict["contentModules"]["name"]["fullName"]
+            if "nickName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.nick_name = metadata_dict["contentModules"]["name"]["nickName"]
+            if "maidenName" in metadata_dict["contentModules"]["name"]:
+                metadata_row.maiden_name = metadata_dict["contentModules"]["name"]["maidenName"]
+            if "prefix" in metadata_dict["contentModules"]["name"]:
+                metadata_row.prefix = metadata_dict["contentModules"]["name"]["prefix"]
+            if "suffix" in metadata_dict["contentModules"]["name"]:
+                metadata_row.suffix = metadata_dict["contentModules"]["name"]["suffix"]
+            if "additionalSuffix" in metadata_dict["contentModules"]["name"]:
+                metadata_row.additional_suffix = metadata_dict["contentModules"]["name"]["additionalSuffix"]
+            if "additionalPrefix" in metadata_dict["contentModules"]["name"]:
+                metadata_row.additional_prefix = metadata_dict["contentModules"]["name"]["additionalPrefix"]
+
+    if "affiliatedSource" in metadata_dict:
+        metadata_row.affiliated_source = metadata_dict["affiliatedSource"]
+
+
+    if "schemas" in metadata_dict:
+        if "personSchema" in metadata_dict["schemas"]:
+            if "birthDate" in metadata_dict["schemas"]["personSchema"]:
+                metadata_row.birth_date = metadata_dict["schemas"]["personSchema"]["birthDate"]
+            if "deathDate" in metadata_dict["schemas"]["personSchema"]:
+                metadata_row.death_date = metadata_dict["schemas"]["personSchema"]["deathDate"]
+            if "address" in metadata_dict["schemas"]["personSchema"]:
+                if "country" in metadata_dict["schemas"]["personSchema"]["address"]:
+                    metadata_row.address_country = metadata_dict["schemas"]["personSchema"]["address"]["country"]
+                if "locality" in metadata_dict["schemas"]["personSchema"]["address"]:
+                    metadata_row.address_locality = metadata_dict["schemas"]["personSchema"]["address"]["locality"]
+                if "region" in metadata_dict["schemas"]["personSchema"]["address"]:
+                    metadata_row.address_region = metadata_dict["schemas"]["personSchema"]["address"]["region"]
+                if "postalCode" in metadata_dict["schemas"]["personSchema"]["address"]:
+                    metadata_row.address_postal_code = metadata_dict["schemas"]["personSchema"]["address"]["postalCode"]
+
+    if "customDimensions" in metadata_dict:
+        if "ObitwriterSource" in metadata_dict["customDimensions"]:
+            metadata_row.obitwriter_source = metadata_dict["customDimensions"]["ObitwriterSource"]
+        if "AdStatus" in metadata_dict["customDimensions"]:
+            metadata_row.ad_status = metadata_dict["customDimensions"]["AdStatus"]
+        if "Affiliate" in metadata_dict["customDimensions"]:
+            metadata_row.affiliate = metadata_dict["customDimensions"]["Affiliate"]
+        if "AffiliateType" in metadata_dict["customDimensions"]:
+            metadata_row.affiliate_type = metadata_dict["customDimensions"]["AffiliateType"]
+        if "AnalyticPageCategory" in metadata_dict["customDimensions"]:
+            metadata_row.analytic_page_category = metadata_dict["customDimensions"]["AnalyticPageCategory"]
+        if "DaysToFirstService" in metadata_dict["customDimensions"]:
+            metadata_row.days_to_first_service = metadata_dict["customDimensions"]["DaysToFirstService"]
+        if "DaysToLastService" in metadata_dict["customDimensions"]:
+            metadata_row.days_to_last_service = metadata_dict["customDimensions"]["DaysToLastService"]
+        if "FirstToFile" in metadata_dict["customDimensions"]:
+            metadata_row.first_to_file = metadata_dict["customDimensions"]["FirstToFile"]
+        if "MergedObitParents" in metadata_dict["customDimensions"]:
+            metadata_row.merged_obit_parents = metadata_dict["customDimensions"]["MergedObitParents"]
+        if "NoticeType" in metadata_dict["customDimensions"]:
+            metadata_row.notice_type = metadata_dict["customDimensions"]["NoticeType"]
+        if "ObitPublishDate" in metadata_dict["customDimensions"]:
+            metadata_row.obit_publish_date = metadata_dict["customDimensions"]["ObitPublishDate"]
+        if "PageName" in metadata_dict["customDimensions"]:
+            metadata_row.page_name = metadata_dict["customDimensions"]["PageName"]
+        if "ProductName" in metadata_dict["customDimensions"]:
+            metadata_row.product_name = metadata_dict["customDimensions"]["ProductName"]
+
+    if "donationsViewType" in metadata_dict:
+        metadata_row.donations_view_type = metadata_dict["donationsViewType"]
+    if "isAdFree" in metadata_dict:
+        metadata_row.is_ad_free = metadata_dict["isAdFree"]
+    if "isConsumerDirectObituary" in metadata_dict:
+        metadata_row.is_consumer_direct_obituary = metadata_dict["isConsumerDirectObituary"]
+    if "legacyProPlanType" in metadata_dict:
+        metadata_row.legacy_pro_plan_type = metadata_dict["legacyProPlanType"]
+
+    if "partner" in metadata_dict:
+        if "city" in metadata_dict["partner"]:
+            metadata_row.partner_city = metadata_dict["partner"]["city"]
+        if "state" in metadata_dict["partner"]:
+            metadata_row.partner_state = metadata_dict["partner"]["state"]
+        if "country" in metadata_dict["partner"]:
+            metadata_row.partner_country = metadata_dict["partner"]["country"]
+        if "display_name" in metadata_dict["partner"]:
+            metadata_row.partner_display_name = metadata_dict["partner"]["display_name"]
+
+    return metadata_row
+
+def redux_helper(metadata_row, metadata_dict):
+    if "displayText" in metadata_dict:
+        if "fullSanitized" in metadata_dict["displayText"]:
+            metadata_row.obituary_paragraph = metadata_dict["displayText"]["fullSanitized"]
+        elif "text" in metadata_dict["displayText"]:
+            metadata_row.obituary_paragraph = metadata_dict["displayText"]["text"]
+    if "name" in metadata_dict:
+        if "first" in metadata_dict["name"]:
+            metadata_row.first_name = metadata_dict["name"]["first"]
+        if "last" in metadata_dict["name"]:
+            metadata_row.last_name = metadata_dict["name"]["last"]
+        if "middle" in metadata_dict["name"]:
+            metadata_row.middle_name = metadata_dict["name"]["middle"]
+        if "nick" in metadata_dict["name"]:
+            metadata_row.nick_name = metadata_dict["name"]["nick"]
+        if "maiden" in metadata_dict["name"]:
+            metadata_row.maiden_name = metadata_dict["name"]["maiden"]
+        if "prefix" in metadata_dict["name"]:
+            metadata_row.prefix = metadata_dict["name"]["prefix"]
+        if "suffix" in metadata_dict["name"]:
+            metadata_row.suffix = metadata_dict["name"]["suffix"]
+        if "full" in metadata_dict["name"]:
+            metadata_row.full_name = metadata_dict["name"]["full"]
+    if "dateOfBirth" in metadata_dict:
+        metadata_row.birth_date = metadata_dict["dateOfBirth"]
+    if "dateOfDeath" in metadata_dict:
+        metadata_row.death_date = metadata_dict["dateOfDeath"]
+    if "fromToYears" in metadata_dict:
+        metadata_row.from_to_years = metadata_dict["fromToYears"]
+    if "location" in metadata_dict:
+        if "country" in metadata_dict["location"]:
+            metadata_row.address_country = metadata_dict["location"]["country"]
+        if "city" in metadata_dict["location"]:
+            metadata_row.address_locality = metadata_dict["location"]["city"]
+        if "state" in metadata_dict["location"]:
+            metadata_row.address_region = metadata_dict["location"]["state"]
+        elif "stateCode" in metadata_dict["location"]:
+            metadata_row.address_region = metadata_dict["location"]["stateCode"]
+    if "church" in metadata_dict:
+        metadata_row.church = metadata_dict["church"]
+    if "customDimensions" in metadata_dict:
+        if "firstToFile" in metadata_dict["customDimensions"]:
+            metadata_row.first_to_file = metadata_dict["customDimensions"]["firstToFile"]
+    # if "affiliates" in metadata_dict:
+    #     active_affiliates = [affiliate for affiliate in metadata_dict["affiliates"] if affiliate["active"] == "Active"]
+    #     if len(active_affiliates) != 1:
+    #         print(f"{obit_id} has {len(active_affiliates)} active affiliates")
+    if "obituaries" in metadata_dict and len(metadata_dict["obituaries"]) > 0:
+        affiliates = " / ".join([obituary["gaSitename"] for obituary in metadata_dict["obituaries"]])
+        metadata_row.affiliate = affiliates
+        dates_created = [obituary["dateCreated"] for obituary in metadata_dict["obituaries"]]
+        metadata_row.obit_publish_date = dates_created[0]
+    return metadata_row
+
+def parse_redux_preloaded(obit_id, metadata_script_text):
+    metadata_dict = json.loads(metadata_script_text.split(".__PRELOADED_STATE__ = ")[1].strip()[:-1])
+    metadata_row = redux_helper(ObitMetadataRow(obit_id, "redux_preloaded"), metadata_dict["personStore"]["person"])
+    return metadata_row
+
+def parse_redux_initial(obit_id, metadata_script_text):
+    metadata_dict = json.loads(metadata_script_text.strip()[27:-1])
+    metadata_row = redux_helper(ObitMetadataRow(obit_id, "redux_initial"), metadata_dict["personStore"])
+    return metadata_row
+
+def parse_person_94(obit_id, person_block):
+    metadata_row = ObitMetadataRow(obit_id, "person_94")
+    name_blocks = person_block.find_all("h1", {"class": "name", "data-reactid": "119"})
+    if len(name_blocks) == 1:
+        metadata_row.full_name = name_blocks[0].get_text()
+    date_blocks = person_block.find_all("span", {"class": "date", "data-reactid": "120"})
+    if len(date_blocks) == 1:
+        metadata_row.from_to_years = date_blocks[0].get_text()
+    obituary_blocks = person_block.find_all("div", {"class": "container", "data-reactid": "556"})
+    if len(obituary_blocks) == 1:
+
+        urls = " ".join([a_block['href'] for a_block in obituary_blocks[0].find_all("a", href=True)])
+        for a_block in obituary_blocks[0].find_all("a", href=True):
+            a_block.decompose()
+        metadata_row.obituary_paragraph = obituary_blocks[0].get_text() + urls
+    return metadata_row
+
+def parse_person_125(obit_id, person_block):
+    metadata_row = ObitMetadataRow(obit_id, "person_125")
+    name_blocks = person_block.find_all("h1", {"class": "name", "data-reactid": "119"})
+    if len(name_blocks) == 1:
+        metadata_row.full_name = name_blocks[0].get_text()
+    date_blocks = person_block.find_all("span", {"class": "date", "data-reactid": "120"})
+    if len(date_blocks) == 1:
+        metadata_row.from_to_years = date_blocks[0].get_text()
+    obituary_blocks = person_block.find_all("div", {"class": "container", "data-reactid": "536"})
+    if len(obituary_blocks) == 1:
+        urls = " ".join([a_block['href'] for a_block in obituary_blocks[0].find_all("a", href=True)])
+        for a_block in obituary_blocks[0].find_all("a", href=True):
+            a_block.decompose()
+        metadata_row.obituary_paragraph = obituary_blocks[0].get_text() + urls
+    return metadata_row
+
+
+def parse_obit_page(obit_id, html_text):
+    """
+    detect which of the known page layouts a saved obituary page uses and parse it
+    :param obit_id: id of obituary
+    :param html_text: raw page html
+    :return: (page format, ObitMetadataRow); the row is None when the format is "missing"
+    """
+    page_format, spans = classify_page(html_text)
+    if page_format == "hypernova_rendered":
+        """ ~96% of sample: react hypernova format """
+        metadata_begin, metadata_end = spans["metadata"]
+        rendered_begin, rendered_end = spans["rendered"]
+        rendered_page_block = BeautifulSoup(html_text[rendered_begin:rendered_end], "html.parser",
+                                            parse_only=RENDERED_PAGE_STRAINER)
+        return page_format, parse_page_hypernova_rendered(obit_id, html_text[metadata_begin:metadata_end],
+                                                          rendered_page_block)
+    if page_format == "redux_preloaded":
+        """ ~3% of sample: redux data format, type 1 PRELOADED STATE """
+        return page_format, parse_redux_preloaded(obit_id, html_text[spans["script"][0]:spans["script"][1]])
+    if page_format == "redux_initial":
+        """ ~0.6% of sample: redux data format, type 2 INITIAL STATE """
+        return page_format, parse_redux_initial(obit_id, html_text[spans["script"][0]:spans["script"][1]])
+    if page_format in ("person_94", "person_125"):
+        """ ~0.01% of sample each: person div formats """
+        person_block = BeautifulSoup(html_text[spans["person"][0]:spans["person"][1]], "html.parser")
+        if page_format == "person_94":
+            return page_format, parse_person_94(obit_id, person_block)
+        return page_format, parse_person_125(obit_id, person_block)
+
+    """ ~0.2% of sample: hard to parse; give the full soup search a chance before giving up """
+    return parse_obit_page_soup(obit_id, html_text)
+
+
+def parse_obit_page_soup(obit_id, html_text):
+    """
+    slower equivalent of parse_obit_page that searches a full BeautifulSoup tree for each format in turn
+    """
+    soup = BeautifulSoup(html_text, "html.parser")
+    metadata_blocks = soup.find_all("script", {"type": "application/json", "data-hypernova-key": "ObituaryPage"})
+    rendered_page_blocks = soup.find_all("div", {"data-hypernova-key": "ObituaryPage"})
+    if len(metadata_blocks) == 1 and len(rendered_page_blocks) == 1:
+        return "hypernova_rendered", parse_page_hypernova_rendered(obit_id, metadata_blocks[0].get_text(), rendered_page_blocks[0])
+
+    redux_data_blocks = [block for block in soup.find_all("script", {"type": None, "src": None, "id": None}) if "window.__PRELOADED_STATE__" in block.get_text()]
+    if len(redux_data_blocks) == 1:
+        return "redux_preloaded", parse_redux_preloaded(obit_id, redux_data_blocks[0].get_text())
+
+    redux_data_blocks = [block for block in soup.find_all("script", {"type": None, "src": None, "id": None}) if "window.__INITIAL_STATE__" in block.get_text()]
+    if len(redux_data_blocks) == 1:
+        return "redux_initial", parse_redux_initial(obit_id, redux_data_blocks[0].get_text())
+
+    person_html_blocks = soup.find_all("div", {"class": "Person", "data-reactid": "94"})
+    if len(person_html_blocks) == 1:
+        return "person_94", parse_person_94(obit_id, person_html_blocks[0])
+
+    person_html_blocks = soup.find_all("div", {"class": "Person", "data-reactid": "125"})
+    if len(person_html_blocks) == 1:
+        return "person_125", parse_person_125(obit_id, person_html_blocks[0])
+
+    return "missing", None
@@ -0,0 +1,194 @@
+import os
+import re
+import uuid
+from collections import defaultdict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from obittools.records import METADATA_FIELDS, ObitMetadataBatch
+
+
+BOOLEAN_FIELDS = ("is_ad_free", "is_consumer_direct_obituary")
+# year directories only: a year x region layout spreads every flush over thousands of small files
+PARTITION_FIELDS = ("death_year",)
+
+# every metadata field is kept as a string except the flags, plus the derived partition column
+METADATA_SCHEMA = pa.schema(
+    [pa.field(field, pa.bool_() if field in BOOLEAN_FIELDS else pa.string()) for field in METADATA_FIELDS]
+    + [pa.field("death_year", pa.string())]
+)
+
+YEAR_PATTERN = re.compile(r"\d{4}")
+
+# the analysis scripts use the CSV column names; read_obit_table serves them from the metadata columns
+COLUMN_ALIASES = {"id": "obit_id", "text": "obituary_paragraph"}
+
+
+def to_string(value):
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def to_boolean(value):
+    if value is None or isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ("true", "1", "yes"):
+        return True
+    if value in ("false", "0", "no"):
+        return False
+    return None
+
+
+def extract_year(date_text):
+    if not date_text:
+        return None
+    match = YEAR_PATTERN.search(date_text)
+    return match.group(0) if match else None
+
+
+def batch_to_table(batch):
+    """
+    convert an ObitMetadataBatch to an arrow table with METADATA_SCHEMA
+    page json values are not consistently typed across layouts, so everything is coerced first
+    """
+    arrays = []
+    for field in METADATA_FIELDS:
+        if field in BOOLEAN_FIELDS:
+            arrays.append(pa.array([to_boolean(v) for v in batch.columns[field]], type=pa.bool_()))
+        else:
+            arrays.append(pa.array([to_string(v) for v in batch.columns[field]], type=pa.string()))
+    death_dates = arrays[METADATA_FIELDS.index("death_date")].to_pylist()
+    arrays.append(pa.array([extract_year(d) for d in death_dates], type=pa.string()))
+    return pa.Table.from_arrays(arrays, schema=METADATA_SCHEMA)
+
+
+class ParquetMetadataSink:
+    """
+    Appends ObitMetadataBatch rows to a hive-partitioned parquet dataset.
+
+    rows are buffered per partition and a partition is written as one file once it holds rows_per_file rows;
+    when more than max_buffered_rows are held in total, the largest partitions are written early. close() writes
+    the rest, so each partition gets a few large files per run. existing data is never rewritten.
+    """
+
+    def __init__(self, root_path, partition_fields=PARTITION_FIELDS, rows_per_file=200000, max_buffered_rows=1000000):
+        self.root_path = root_path
+        self.partition_fields = list(partition_fields)
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        # partition values -> list of arrow tables waiting to be written
+        self.buffers = defaultdict(list)
+        self.buffered_rows = defaultdict(int)
+        self.run_id = uuid.uuid4().hex[:12]
+        self.files_written = 0
+        os.makedirs(root_path, exist_ok=True)
+
+    def write_batch(self, batch):
+        table = batch_to_table(batch)
+        rows_by_partition = defaultdict(list)
+        keys = zip(*(table.column(field).to_pylist() for field in self.partition_fields))
+        for i, key in enumerate(keys):
+            rows_by_partition[key].append(i)
+        for key, rows in rows_by_partition.items():
+            self.buffers[key].append(table.take(pa.array(rows)))
+            self.buffered_rows[key] += len(rows)
+            if self.buffered_rows[key] >= self.rows_per_file:
+                self.write_partition(key)
+        while sum(self.buffered_rows.values()) > self.max_buffered_rows:
+            self.write_partition(max(self.buffered_rows, key=self.buffered_rows.get))
+
+    def write_partition(self, key):
+        table = pa.concat_tables(self.buffers.pop(key))
+        del self.buffered_rows[key]
+        ds.write_dataset(
+            table,
+            self.root_path,
+            format="parquet",
+            partitioning=self.partition_fields,
+            partitioning_flavor="hive",
+            basename_template=f"part-{self.run_id}-{self.files_written}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_rows_per_group=self.rows_per_file,
+        )
+        self.files_written += 1
+
+    def flush(self):
+        for key in list(self.buffers):
+            self.write_partition(key)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def metadata_partitioning(partition_fields=PARTITION_FIELDS):
+    # declared explicitly so partition values like "2020" are not inferred as integers
+    return ds.partitioning(pa.schema([pa.field(field, pa.string()) for field in partition_fields]), flavor="hive")
+
+
+def open_metadata_dataset(root_path, partition_fields=PARTITION_FIELDS):
+    return ds.dataset(root_path, format="parquet", partitioning=metadata_partitioning(partition_fields))
+
+
+def read_metadata_dataset(root_path, columns=None, filters=None, partition_fields=PARTITION_FIELDS):
+    """
+    read a parquet metadata dataset into a DataFrame, pushing column selection and filters down to the scan
+    :param root_path: dataset directory written by ParquetMetadataSink
+    :param columns: optional list of columns to read
+    :param filters: optional pyarrow expression or DNF list like [("death_year", "=", "2020"), ("address_region", "in", ["GA", "FL"])]
+    :return: pandas DataFrame
+    """
+    if os.path.isfile(root_path):
+        return pq.read_table(root_path, columns=columns, filters=filters).to_pandas()
+    return pq.read_table(root_path, columns=columns, filters=filters,
+                         partitioning=metadata_partitioning(partition_fields)).to_pandas()
+
+
+def iter_metadata_batches(root_path, columns=None, filter=None, batch_size=65536):
+    """
+    stream a parquet metadata dataset as DataFrames without loading it all at once
+    :param filter: optional pyarrow.dataset expression, e.g. ds.field("death_year") == "2020"
+    """
+    dataset = open_metadata_dataset(root_path)
+    for record_batch in dataset.to_batches(columns=columns, filter=filter, batch_size=batch_size):
+        yield record_batch.to_pandas()
+
+
+def read_obit_table(path, columns=None, filters=None):
+    """
+    load obituary data from either a parquet dataset/file or a CSV
+    parquet metadata columns are renamed to their CSV names (COLUMN_ALIASES), so "id" and "text" work for both
+    :param path: parquet directory, .parquet file, or CSV path
+    :param columns: optional list of columns to read; raises ValueError if any is missing from the data
+    :param filters: parquet filters (see read_metadata_dataset); ignored for CSV input
+    :return: pandas DataFrame
+    """
+    if os.path.isdir(path) or path.endswith(".parquet"):
+        names = (pq.read_schema(path) if os.path.isfile(path) else open_metadata_dataset(path).schema).names
+        # alias -> stored column, for aliases the data does not already have under their own name
+        aliases = {alias: stored for alias, stored in COLUMN_ALIASES.items() if alias not in names and stored in names}
+        if columns is not None:
+            check_columns(columns, set(names) | set(aliases), path)
+            columns = [aliases.get(c, c) for c in columns]
+        df = read_metadata_dataset(path, columns=columns, filters=filters)
+        return df.rename(columns={stored: alias for alias, stored in aliases.items()})
+    if columns is not None:
+        check_columns(columns, set(pd.read_csv(path, nrows=0).columns), path)
+        wanted = set(columns)
+        return pd.read_csv(path, usecols=lambda c: c in wanted, low_memory=False)
+    return pd.read_csv(path, low_memory=False)
+
+
+def check_columns(columns, available, path):
+    missing = [c for c in columns if c not in available]
+    if missing:
+        raise ValueError(f"{path} has no column(s) {missing}; available: {sorted(available)}")
@@ -0,0 +1,74 @@
+BASE_URL = "https://www.legacy.com"
+PROBE_INFIX = "/us/obituaries/name/a-obituary?id="
+SEARCH_DEAD_END = "obituaries/search?firstName=a&lastName=obituary"
+
+BLOCKED_TITLES = ("access denied",)
+CHALLENGE_TITLES = ("just a moment", "just a moment...")
+MISS_STATUS_MESSAGE = "redirect, no obituary id/pid"
+
+
+# example: https://www.legacy.com/us/obituaries/charlotte/name/david-melton-obituary?id=57552782
+def build_url(id, base=BASE_URL, infix=PROBE_INFIX):
+    """
+    :param id: id of obituary
+    :return: formatted url string
+    """
+    base, infix = base.strip(), infix.strip()
+    return f"{base}{infix}{id}"
+
+
+def is_blocked_title(title):
+    return title is not None and title.strip().lower() in BLOCKED_TITLES
+
+
+def is_challenge_title(title):
+    return title is not None and title.strip().lower() in CHALLENGE_TITLES
+
+
+def classify_probe(obit_id, current_url, current_title):
+    """
+    classify where a probe for obit_id ended up
+    :return: one of "hit" (redirected to an obituary), "miss" (redirected elsewhere, usually the search dead end),
+             "no_redirect", "bad_gateway", "blocked", "challenge"
+    """
+    current_title = current_title or ""
+    if is_blocked_title(current_title):
+        return "blocked"
+    if is_challenge_title(current_title):
+        return "challenge"
+    if "502" in current_title and "bad gateway" in current_title.lower():
+        return "bad_gateway"
+    if f"/a-obituary?id={obit_id}" in current_url:
+        return "no_redirect"
+    if SEARCH_DEAD_END not in current_url and ("?pid=" in current_url or "?id=" in current_url):
+        return "hit"
+    return "miss"
+
+
+def probe_result(obit_id, current_url, current_title, status_code, status_msg):
+    """
+    :return: dict: {"id": obituary id, "url": page url, "title": page title, "statusCode": "0" on a hit or "ERROR",
+                    "statusMsg": status message}
+    """
+    return {
+        "id": str(obit_id),
+        "url": current_url,
+        "title": current_title,
+        "statusCode": status_code,
+        "statusMsg": status_msg,
+    }
+
+
+def is_definitive(result):
+    """
+    :param result: dict from probe_result
+    :return: True for hits and clean misses; errors (blocks, timeouts, missing redirects) are worth retrying
+    """
+    return result["statusCode"] == "0" or result["statusMsg"] == MISS_STATUS_MESSAGE
+
+
+def hit_status_message(obit_id, current_url):
+    # a redirect to a different id (merged obituaries) keeps the query string for later inspection
+    if str(obit_id) not in current_url:
+        return current_url.split("?")[-1]
+    return "0"
@@ -0,0 +1,126 @@
+import pandas as pd
+
+
+METADATA_FIELDS = (
+    "obit_id",
+    "obit_page_type",
+    "obituary_paragraph",
+    "sympathy_cta",
+    "full_name",
+    "first_name",
+    "middle_name",
+    "last_name",
+    "nick_name",
+    "maiden_name",
+    "prefix",
+    "suffix",
+    "additional_prefix",
+    "additional_suffix",
+    "birth_date",
+    "death_date",
+    "from_to_years",
+    "address_country",
+    "address_locality",
+    "address_region",
+    "address_postal_code",
+    "affiliated_source",
+    "obitwriter_source",
+    "ad_status",
+    "affiliate",
+    "affiliate_type",
+    "analytic_page_category",
+    "days_to_first_service",
+    "days_to_last_service",
+    "first_to_file",
+    "merged_obit_parents",
+    "notice_type",
+    "page_name",
+    "product_name",
+    "obit_publish_date",
+    "donations_view_type",
+    "is_ad_free",
+    "is_consumer_direct_obituary",
+    "legacy_pro_plan_type",
+    "partner_city",
+    "partner_state",
+    "partner_country",
+    "partner_display_name",
+    "church",
+)
+
+# html fragments left in the page json that get_dict and ObitMetadataBatch replace with spaces
+HTML_FRAGMENTS = ("<br />", "<p>", "</p>", "<strong>", "</strong>", "<em>", "</em>")
+
+
+def clean_value(value):
+    if value is not None and type(value) == str:
+        for fragment in HTML_FRAGMENTS:
+            value = value.replace(fragment, " ")
+        value = value.strip()
+    return value
+
+
+class ObitMetadataRow:
+    __slots__ = METADATA_FIELDS
+
+    def __init__(self, obit_id, obit_page_type):
+        self.obit_id = obit_id
+        self.obit_page_type = obit_page_type
+        self.obituary_paragraph, self.sympathy_cta = None, None
+        self.full_name, self.first_name, self.middle_name, self.last_name = None, None, None, None
+        self.nick_name, self.maiden_name, self.prefix, self.suffix, self.additional_prefix, self.additional_suffix = None, None, None, None, None, None
+        self.birth_date, self.death_date, self.from_to_years = None, None, None
+        self.address_country, self.address_locality, self.address_region, self.address_postal_code = None, None, None, None
+        self.affiliated_source, self.obitwriter_source = None, None
+        self.ad_status, self.affiliate, self.affiliate_type, self.analytic_page_category, self.days_to_first_service, self.days_to_last_service, self.first_to_file, self.merged_obit_parents, self.notice_type, self.page_name, self.product_name = None, None, None, None, None, None, None, None, None, None, None
+        self.obit_publish_date = None
+        self.donations_view_type = None
+        self.is_ad_free, self.is_consumer_direct_obituary, self.legacy_pro_plan_type = None, None, None
+
+        self.partner_city, self.partner_state, self.partner_country, self.partner_display_name = None, None, None, None
+
+        self.church = None
+
+    def get_dict(self):
+        return {field: clean_value(getattr(self, field)) for field in METADATA_FIELDS}
+
+
+class ObitMetadataBatch:
+    """
+    column-oriented container for ObitMetadataRow records
+
+    rows are cleaned and appended straight into one list per field, so no per-row dict is ever built;
+    to_pandas/to_arrow hand the columns over as-is.
+    """
+
+    def __init__(self):
+        self.columns = {field: [] for field in METADATA_FIELDS}
+
+    def __len__(self):
+        return len(self.columns["obit_id"])
+
+    def append(self, row):
+        for field in METADATA_FIELDS:
+            self.columns[field].append(clean_value(getattr(row, field)))
+
+    def extend(self, other):
+        for field in METADATA_FIELDS:
+            self.columns[field].extend(other.columns[field])
+
+    def clear(self):
+        for column in self.columns.values():
+            column.clear()
+
+    def iter_rows(self):
+        """
+        :return: iterator of tuples ordered like METADATA_FIELDS
+        """
+        return zip(*(self.columns[field] for field in METADATA_FIELDS))
+
+    def to_pandas(self):
+        return pd.DataFrame(self.columns, columns=list(METADATA_FIELDS))
+
+    def to_arrow(self):
+        # pyarrow is only needed for arrow/parquet output
+        import pyarrow as pa
+        return pa.table(self.columns)
@@ -0,0 +1,170 @@
+"""
+Re-parse every saved obituary page of a collection in parallel.
+
+Walks collections/<collection>/metadata/*.html, fans the files out over a
+process pool in chunks, and streams the parsed metadata rows to an output
+file as chunks complete. Per-format counts are printed at the end.
+
+Usage:
+    obits-reparse final
+    obits-reparse final --workers 64 --chunk-size 128 --output final_metadata.csv
+    obits-reparse --metadata-dir /data/pages/metadata --output out.csv
+    obits-reparse final --format parquet --output /data/obits/metadata_parquet
+"""
+
+import os
+import csv
+import argparse
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from tqdm import tqdm
+
+from obittools import ROOT_DIR
+from obittools.records import METADATA_FIELDS, ObitMetadataBatch
+from obittools.page_parsers import PAGE_FORMATS, parse_obit_page
+from obittools.parquet_store import ParquetMetadataSink
+
+
+def list_page_files(metadata_dir):
+    """
+    :param metadata_dir: directory of saved <id>_obit.html pages
+    :return: sorted list of html file names
+    """
+    with os.scandir(metadata_dir) as entries:
+        return sorted(entry.name for entry in entries if entry.name.endswith(".html"))
+
+
+def chunk_list(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def parse_page_file(metadata_dir, html_file):
+    obit_id = html_file.split("_")[0]
+    with open(os.path.join(metadata_dir, html_file), "r", encoding="utf-8") as f:
+        html_text = f.read()
+    return parse_obit_page(obit_id, html_text)
+
+
+def parse_page_chunk(metadata_dir, html_files):
+    """
+    work unit run inside a pool worker
+    :return: (ObitMetadataBatch of parsed rows, list of (html file, page format))
+    """
+    batch = ObitMetadataBatch()
+    formats = []
+    for html_file in html_files:
+        try:
+            page_format, row = parse_page_file(metadata_dir, html_file)
+        except Exception as e:
+            print(f"ERROR: {html_file} failed to parse: {e}")
+            page_format, row = "missing", None
+        if row is not None:
+            batch.append(row)
+        formats.append((html_file, page_format))
+    return batch, formats
+
+
+class CsvRowSink:
+    """Writes ObitMetadataBatch columns to a CSV file as they arrive."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(METADATA_FIELDS)
+
+    def write_batch(self, batch):
+        self.writer.writerows(batch.iter_rows())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def reparse_collection(metadata_dir, sink, workers=None, chunk_size=64, missing=None):
+    """
+    parse every page in metadata_dir over a process pool, streaming rows to sink
+    :param metadata_dir: directory of saved <id>_obit.html pages
+    :param sink: object with a write_batch(ObitMetadataBatch) method
+    :param workers: number of worker processes (defaults to cpu count)
+    :param chunk_size: number of files per work unit
+    :param missing: optional list that collects the names of unparseable files
+    :return: collections.Counter of page format -> number of files
+    """
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    html_files = list_page_files(metadata_dir)
+    chunks = chunk_list(html_files, chunk_size)
+    counts = collections.Counter({page_format: 0 for page_format in PAGE_FORMATS})
+
+    # keep a bounded number of chunks in flight so memory stays flat on huge collections
+    max_in_flight = workers * 4
+    next_chunk = 0
+    pending = set()
+    with tqdm(total=len(html_files)) as pbar:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while next_chunk < len(chunks) or pending:
+                while next_chunk < len(chunks) and len(pending) < max_in_flight:
+                    pending.add(executor.submit(parse_page_chunk, metadata_dir, chunks[next_chunk]))
+                    next_chunk += 1
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch, formats = future.result()
+                    for html_file, page_format in formats:
+                        counts[page_format] += 1
+                        if page_format == "missing" and missing is not None:
+                            missing.append(html_file)
+                    if len(batch):
+                        sink.write_batch(batch)
+                    pbar.update(len(formats))
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-parse all saved obituary pages of a collection")
+    parser.add_argument("collection", nargs="?", default=None, help="collection name under collections/")
+    parser.add_argument("--metadata-dir", default=None,
+                        help="directory of saved pages (defaults to collections/<collection>/metadata)")
+    parser.add_argument("--output", default=None,
+                        help="output CSV path or parquet dataset directory "
+                             "(defaults to collections/<collection>/extract_data_dump.csv or extract_data_parquet/)")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="output format")
+    parser.add_argument("--missing-output", default=None, help="optional path listing files that could not be parsed")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("-c", "--chunk-size", type=int, default=64, help="number of files per work unit")
+    args = parser.parse_args()
+
+    if args.metadata_dir is None and args.collection is None:
+        parser.error("either a collection name or --metadata-dir is required")
+
+    metadata_dir = args.metadata_dir
+    if metadata_dir is None:
+        metadata_dir = os.path.join(ROOT_DIR, "collections", args.collection, "metadata")
+    output_path = args.output
+    if output_path is None:
+        output_name = "extract_data_dump.csv" if args.format == "csv" else "extract_data_parquet"
+        output_path = os.path.join(os.path.dirname(os.path.normpath(metadata_dir)), output_name)
+
+    missing = []
+    sink = CsvRowSink(output_path) if args.format == "csv" else ParquetMetadataSink(output_path)
+    with sink:
+        counts = reparse_collection(metadata_dir, sink, workers=args.workers, chunk_size=args.chunk_size,
+                                    missing=missing)
+
+    if args.missing_output is not None:
+        with open(args.missing_output, "w") as f:
+            f.write("\n".join(sorted(missing)))
+
+    print(f"Wrote {sum(counts.values()) - counts['missing']} rows to {output_path}")
+    for page_format in PAGE_FORMATS:
+        print(f"{page_format}: {counts[page_format]}")
+
+
+if __name__ == "__main__":
+    main()
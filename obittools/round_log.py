@@ -0,0 +1,182 @@
+"""
+Line-delimited logs of probe results, one file per sampling round.
+
+A round is written to <name>_hits.jsonl.partial as results arrive (flushed per line, fsynced
+periodically) and renamed to <name>_hits.jsonl once the round completes, so a finished log is
+never half-written and an interrupted one can be appended to on resume. The reader merges any
+mix of finished logs, partial logs and the older end-of-round _hits.json dumps.
+
+Usage:
+    obits-rounds collections/random_legacy_20250101_000000_000000/queries
+    obits-rounds collections/random_legacy_20250101_000000_000000/queries --output merged.jsonl
+"""
+
+import os
+import json
+import time
+import argparse
+import collections
+
+
+LOG_SUFFIX = "_hits.jsonl"
+PARTIAL_SUFFIX = LOG_SUFFIX + ".partial"
+LEGACY_SUFFIX = "_hits.json"
+
+
+def drop_truncated_line(path):
+    # a crash can leave half a line at the end; cut it so appended results start on a fresh line
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+class RoundLogWriter:
+    """Appends probe results to a round log and tracks live hit counts."""
+
+    def __init__(self, path, fsync_every=500, fsync_seconds=10):
+        """
+        :param path: final log path, ending in _hits.jsonl; results go to path + ".partial" until commit()
+        :param fsync_every: fsync after this many results
+        :param fsync_seconds: or after this many seconds, whichever comes first
+        """
+        self.path = path
+        self.partial_path = path + ".partial"
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        drop_truncated_line(self.partial_path)
+        self.file = open(self.partial_path, "a", encoding="utf-8")
+        self.written, self.hits = 0, 0
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def write(self, result):
+        self.file.write(json.dumps(result) + "\n")
+        self.file.flush()
+        self.written += 1
+        if result["statusCode"] == "0":
+            self.hits += 1
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_seconds:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def hit_rate(self):
+        return self.hits / self.written if self.written else 0.0
+
+    def commit(self):
+        """finish the round: sync and atomically rename the partial log to its final name"""
+        if self.file.closed:
+            return
+        self.sync()
+        self.file.close()
+        os.replace(self.partial_path, self.path)
+
+    def close(self):
+        # leaves the .partial file in place so the round can be resumed
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.close()
+
+
+def find_partial_log(queries_dir, round_number):
+    """
+    :return: final path of an unfinished log for round_number in queries_dir, or None
+    """
+    suffix = f"_{round_number}{PARTIAL_SUFFIX}"
+    with os.scandir(queries_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(suffix):
+                return entry.path[:-len(".partial")]
+    return None
+
+
+def iter_round_log(path):
+    """
+    yield result dicts from a round log; a truncated last line (from a crash) is skipped
+    """
+    if path.endswith(LEGACY_SUFFIX):
+        with open(path, "r") as f:
+            yield from json.load(f)
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def list_round_logs(queries_dir, include_partial=True):
+    names = []
+    with os.scandir(queries_dir) as entries:
+        for entry in entries:
+            if entry.name.endswith(LOG_SUFFIX) or entry.name.endswith(LEGACY_SUFFIX) \
+                    or (include_partial and entry.name.endswith(PARTIAL_SUFFIX)):
+                names.append(entry.name)
+    return [os.path.join(queries_dir, name) for name in sorted(names)]
+
+
+def merge_round_logs(queries_dir, include_partial=True):
+    """
+    merge every round log in queries_dir, keeping one result per id (a hit wins over an earlier error)
+    :return: dict of id -> result
+    """
+    merged = {}
+    for path in list_round_logs(queries_dir, include_partial=include_partial):
+        for result in iter_round_log(path):
+            previous = merged.get(result["id"])
+            if previous is None or previous["statusCode"] != "0":
+                merged[result["id"]] = result
+    return merged
+
+
+def round_summary(queries_dir, include_partial=True):
+    """
+    :return: list of (log file name, results, hits) per round log
+    """
+    summary = []
+    for path in list_round_logs(queries_dir, include_partial=include_partial):
+        counts = collections.Counter(result["statusCode"] == "0" for result in iter_round_log(path))
+        summary.append((os.path.basename(path), counts[True] + counts[False], counts[True]))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize and merge random sampling round logs")
+    parser.add_argument("queries_dir", help="queries directory of a random_legacy_* collection")
+    parser.add_argument("--output", default=None, help="optional path for the merged results as json lines")
+    parser.add_argument("--finished-only", action="store_true", help="ignore logs of rounds still in progress")
+    args = parser.parse_args()
+
+    include_partial = not args.finished_only
+    for name, n_results, n_hits in round_summary(args.queries_dir, include_partial=include_partial):
+        rate = n_hits / n_results if n_results else 0.0
+        print(f"{name}: {n_hits}/{n_results} hits ({rate:.4%})")
+
+    merged = merge_round_logs(args.queries_dir, include_partial=include_partial)
+    n_hits = sum(1 for result in merged.values() if result["statusCode"] == "0")
+    print(f"{len(merged)} distinct ids, {n_hits} hits")
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in merged.values():
+                f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Rule-based extraction of birth/death dates, years and age at death from obituary text.
+
+Most obituaries state these in a handful of stock phrasings ("Guy Mitchell Riddle, 66, of Midland,
+passed away February 15th, 2019 ... He was born November 30, 1952"), so a few compiled regexes
+resolve them without a model. Every field comes with a confidence flag:
+
+    high    stated with an explicit cue ("born", "passed away", "at the age of") or read from the
+            page's LifespanText, and consistent with the other fields
+    medium  stated without a cue that pins it down (a "1952 - 2019" range near the top)
+    low     guessed (first date in the text, birth year from death year minus age) or contradicted
+            by another field
+
+Only high and medium count as resolved; low values are kept so a later stage can confirm them.
+"""
+
+import re
+import multiprocessing
+from datetime import date
+
+import pandas as pd
+
+
+RULE_FIELDS = ['birth_year', 'death_year', 'age_at_death', 'birth_date', 'death_date']
+RESOLVED_CONFIDENCE = ('high', 'medium')
+
+MONTHS = {
+    'january': 1, 'february': 2, 'march': 3, 'april': 4, 'may': 5, 'june': 6, 'july': 7, 'august': 8,
+    'september': 9, 'october': 10, 'november': 11, 'december': 12,
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'sept': 9, 'oct': 10,
+    'nov': 11, 'dec': 12,
+}
+_MONTH = '(?:' + '|'.join(sorted(MONTHS, key=len, reverse=True)) + r')\b\.?'
+_YEAR = r'(?:1[6-9]\d\d|20\d\d)'
+_DAY = r'\d{1,2}(?:st|nd|rd|th)?'
+
+# all patterns run on lowercased text: case-insensitive alternations are several times slower in re, and the
+# leading lookarounds reject most positions before an alternation is tried
+# "february 15th, 2019", "feb. 24, 2012" or "15th may 2007", "7 of april, 2009"
+DATE_PATTERN = re.compile(
+    rf'(?<![a-z0-9])(?=[jfmasond0-9])'
+    rf'(?:(?P<m1>{_MONTH})\s+(?P<d1>{_DAY}),?\s+(?P<y1>{_YEAR})'
+    rf'|(?P<d2>{_DAY})\s+(?:of\s+)?(?P<m2>{_MONTH}),?\s+(?P<y2>{_YEAR}))\b')
+CUE_PATTERN = re.compile(
+    r'(?=[bpdecw])\b(?:(?P<birth>born)'
+    r'|(?P<death>passed\s+away|passed|died|departed\s+this\s+life|departed|entered\s+(?:into\s+)?(?:eternal\s+)?rest'
+    r'|went\s+(?:home\s+)?to\s+be\s+with|called\s+home|passing|went\s+to\s+heaven|death))\b')
+YEAR_RANGE_PATTERN = re.compile(rf'\b({_YEAR})\s*[-–—]+\s*({_YEAR})\b')
+RANGE_GAP_PATTERN = re.compile(r'\s*[-–—]+\s*')
+# a period ends the sentence unless it closes a one- or two-letter abbreviation (a.m., dr., st.)
+SENTENCE_END_PATTERN = re.compile(r'\n|(?<!\b[a-z])(?<!\b[a-z]{2})\.(?=\s)')
+# "aged 74", ", age 56," and "at the age of 98" / "at age 40"; the last form is also used for events during
+# the person's life, so it only counts as the age at death right after a death cue
+AGE_PATTERN = re.compile(r'(?=[a,])(?:(?P<strong>\baged\s+|,\s*age\s+)|(?P<at>\bat\s+(?:the\s+)?age\s+(?:of\s+)?))(\d{1,3})\b')
+# "guy mitchell riddle, 66, of midland" near the start
+AGE_AFTER_NAME_PATTERN = re.compile(r',\s*(\d{1,3})\s*,')
+
+HEAD_CHARS = 300
+SCAN_CHARS = 1500
+CUE_GAP_CHARS = 80
+MAX_AGE = 120
+
+
+def _to_date(month, day, year):
+    try:
+        return date(int(year), MONTHS[month.lower().rstrip('.')], int(re.match(r'\d+', day).group(0)))
+    except (ValueError, KeyError):
+        return None
+
+
+def date_from_match(match):
+    """
+    :return: datetime.date for whichever of the two date forms matched, or None for an impossible date
+    """
+    if match.group('m1'):
+        return _to_date(match.group('m1'), match.group('d1'), match.group('y1'))
+    return _to_date(match.group('m2'), match.group('d2'), match.group('y2'))
+
+
+def find_dates(text):
+    """
+    :return: list of (start, end, datetime.date) for every valid date in text
+    """
+    dates = []
+    for match in DATE_PATTERN.finditer(text):
+        parsed = date_from_match(match)
+        if parsed is not None:
+            dates.append((match.start(), match.end(), parsed))
+    return dates
+
+
+def _same_sentence(text, start, end):
+    return end - start <= CUE_GAP_CHARS and not SENTENCE_END_PATTERN.search(text, start, end)
+
+
+def _date_after(text, dates, position):
+    """
+    :return: the first date starting after position in the same sentence, or None
+    """
+    for start, _, parsed in dates:
+        if start >= position:
+            return parsed if _same_sentence(text, position, start) else None
+    return None
+
+
+def _parse_year(value):
+    if value is None:
+        return None
+    match = re.search(_YEAR, str(value))
+    return int(match.group(0)) if match else None
+
+
+_LEVELS = {'high': 2, 'medium': 1, 'low': 0}
+
+
+def _rank(level):
+    return _LEVELS[level]
+
+
+def _age_between(birth, death):
+    return death.year - birth.year - ((death.month, death.day) < (birth.month, birth.day))
+
+
+def extract_rule_labels(text, lifespan_birth_year=None, lifespan_death_year=None):
+    """
+    :param text: obituary text
+    :param lifespan_birth_year, lifespan_death_year: years from the page's LifespanText, if the record has them
+    :return: dict with each of RULE_FIELDS (None if not found) and a <field>_confidence for each
+    """
+    labels = {f: None for f in RULE_FIELDS}
+    confidence = {f: None for f in RULE_FIELDS}
+
+    def put(field, value, level):
+        if value is not None and labels[field] is None:
+            labels[field], confidence[field] = value, level
+
+    text = text[:SCAN_CHARS].lower() if isinstance(text, str) else ''
+    head = text[:HEAD_CHARS]
+    dates = find_dates(text)
+
+    death_cues = []
+    for cue in CUE_PATTERN.finditer(text):
+        kind = 'birth' if cue.group('birth') else 'death'
+        if kind == 'death':
+            death_cues.append(cue.end())
+        put(f'{kind}_date', _date_after(text, dates, cue.end()), 'high')
+
+    # "15th May 2007 - 7th April 2009" near the top
+    for (_, end, first), (start, _, second) in zip(dates, dates[1:]):
+        if start > HEAD_CHARS:
+            break
+        if first < second and RANGE_GAP_PATTERN.fullmatch(text, end, start):
+            put('birth_date', first, 'medium')
+            put('death_date', second, 'medium')
+            break
+
+    if labels['death_date'] is None:
+        # first date near the top that is not the birth date; often the death date, but it can be a service date
+        for start, _, candidate in dates:
+            if start < HEAD_CHARS and candidate != labels['birth_date']:
+                put('death_date', candidate, 'low')
+                break
+
+    for field, value in (('birth_year', lifespan_birth_year), ('death_year', lifespan_death_year)):
+        put(field, _parse_year(value), 'high')
+    years_from_dates = []
+    for field, date_field in (('birth_year', 'birth_date'), ('death_year', 'death_date')):
+        if labels[field] is None and labels[date_field] is not None:
+            put(field, labels[date_field].year, confidence[date_field])
+            years_from_dates.append((field, date_field))
+    year_match = YEAR_RANGE_PATTERN.search(head)
+    if year_match and int(year_match.group(1)) < int(year_match.group(2)):
+        put('birth_year', int(year_match.group(1)), 'medium')
+        put('death_year', int(year_match.group(2)), 'medium')
+
+    for match in AGE_PATTERN.finditer(head):
+        if match.group('strong'):
+            level = 'high'
+        else:
+            level = 'high' if any(_same_sentence(text, end, match.start()) for end in death_cues
+                                  if end <= match.start()) else 'low'
+        if 0 < int(match.group(3)) <= MAX_AGE:
+            put('age_at_death', int(match.group(3)), level)
+            break
+    name_match = AGE_AFTER_NAME_PATTERN.search(head, 0, HEAD_CHARS // 2)
+    if name_match and 0 < int(name_match.group(1)) <= MAX_AGE and confidence['age_at_death'] != 'high':
+        labels['age_at_death'], confidence['age_at_death'] = int(name_match.group(1)), 'high'
+
+    # fill and cross-check between dates, years and age
+    if labels['birth_date'] is not None and labels['death_date'] is not None:
+        age = _age_between(labels['birth_date'], labels['death_date'])
+        level = min(confidence['birth_date'], confidence['death_date'], key=_rank)
+        if labels['age_at_death'] is None:
+            put('age_at_death', age, level)
+        elif labels['age_at_death'] != age:
+            for field in ('age_at_death', 'birth_date', 'death_date'):
+                confidence[field] = 'low'
+    elif labels['birth_year'] is not None and labels['death_year'] is not None and labels['age_at_death'] is not None:
+        if labels['death_year'] - labels['birth_year'] - labels['age_at_death'] not in (0, 1):
+            for field in ('age_at_death', 'birth_year', 'death_year'):
+                confidence[field] = 'low'
+    if labels['birth_year'] is None and labels['death_year'] is not None and labels['age_at_death'] is not None:
+        # off by one unless the birthday is known
+        put('birth_year', labels['death_year'] - labels['age_at_death'], 'low')
+
+    for field, date_field in years_from_dates:
+        confidence[field] = min(confidence[field], confidence[date_field], key=_rank)
+    for field in ('birth_date', 'death_date'):
+        if labels[field] is not None:
+            labels[field] = labels[field].isoformat()
+
+    labels.update({f'{field}_confidence': confidence[field] for field in RULE_FIELDS})
+    return labels
+
+
+def _extract_rule_labels_rows(rows):
+    return [extract_rule_labels(text, by, dy) for text, by, dy in rows]
+
+
+def extract_rule_labels_frame(df, text_col='text', workers=1, chunk_size=5000):
+    """
+    run extract_rule_labels over a dataframe, using its birth_year / death_year columns (LifespanText) if present
+    :param workers: processes to split the rows over (about 8k documents per second each)
+    :return: dataframe with RULE_FIELDS and their _confidence columns, on df's index
+    """
+    texts = df[text_col].tolist()
+    birth_years = df['birth_year'].tolist() if 'birth_year' in df else [None] * len(df)
+    death_years = df['death_year'].tolist() if 'death_year' in df else [None] * len(df)
+    rows = list(zip(texts, birth_years, death_years))
+    if workers > 1 and len(rows) > chunk_size:
+        chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+        with multiprocessing.Pool(workers) as pool:
+            labeled = [labels for chunk in pool.map(_extract_rule_labels_rows, chunks) for labels in chunk]
+    else:
+        labeled = _extract_rule_labels_rows(rows)
+    labels = pd.DataFrame(labeled, index=df.index, columns=RULE_FIELDS + [f'{field}_confidence' for field in RULE_FIELDS])
+    return labels.astype({'birth_year': 'Int64', 'death_year': 'Int64', 'age_at_death': 'Int64'})
+
+
+def is_resolved(labels, field):
+    """
+    :param labels: dict or row from extract_rule_labels(_frame)
+    """
+    return labels.get(f'{field}_confidence') in RESOLVED_CONFIDENCE
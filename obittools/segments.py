@@ -0,0 +1,194 @@
+"""
+Pack a directory of per-obituary <id>.json files into large append-only segment files.
+
+Each segment is a JSON-lines file; index.tsv maps every id to (segment, byte offset, length)
+so records can be read sequentially or fetched by id without touching the original files.
+Compaction is incremental: ids already in the index are skipped, new records are appended.
+
+Usage:
+    obits-compact /data/obit_jsons
+    obits-compact /data/obit_jsons --store /data/obit_segments --segment-mb 512
+"""
+
+import os
+import re
+import json
+import argparse
+import pandas as pd
+from tqdm import tqdm
+
+
+SEGMENT_DIR_NAME = "segments"
+INDEX_FILE_NAME = "index.tsv"
+DEFAULT_SEGMENT_BYTES = 256 * 1024 * 1024
+# records written to a segment before it is fsynced and their index lines are appended
+INDEX_BATCH_SIZE = 1000
+SEGMENT_FILE_PATTERN = re.compile(r"segment-(\d+)\.jsonl$")
+
+
+def segment_path(store_dir, segment_number):
+    return os.path.join(store_dir, f"segment-{segment_number:05d}.jsonl")
+
+
+def default_store_dir(json_dir):
+    return os.path.join(json_dir, SEGMENT_DIR_NAME)
+
+
+def has_segment_store(store_dir):
+    return os.path.exists(os.path.join(store_dir, INDEX_FILE_NAME))
+
+
+def load_index(store_dir):
+    """
+    :return: dict of id -> (segment number, offset, length)
+    """
+    index = {}
+    index_path = os.path.join(store_dir, INDEX_FILE_NAME)
+    if not os.path.exists(index_path):
+        return index
+    with open(index_path, "r") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t")
+            if len(parts) != 4:
+                continue  # partially written line from an interrupted run
+            index[parts[0]] = (int(parts[1]), int(parts[2]), int(parts[3]))
+    return index
+
+
+def compact_json_dir(json_dir, store_dir=None, segment_bytes=DEFAULT_SEGMENT_BYTES):
+    """
+    append every <id>.json in json_dir that is not yet indexed to the segment store
+    :param json_dir: directory of per-obituary json files
+    :param store_dir: segment store directory (defaults to <json_dir>/segments)
+    :param segment_bytes: size at which a new segment is started
+    :return: number of records added
+    """
+    if store_dir is None:
+        store_dir = default_store_dir(json_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    index = load_index(store_dir)
+
+    # resume the last segment at the end of its last indexed record, dropping any unindexed tail and any later
+    # segment started by a rollover whose records never reached the index
+    segment_number = max((entry[0] for entry in index.values()), default=0)
+    segment_end = max((entry[1] + entry[2] for entry in index.values() if entry[0] == segment_number), default=0)
+    for name in os.listdir(store_dir):
+        match = SEGMENT_FILE_PATTERN.fullmatch(name)
+        if match and int(match.group(1)) > segment_number:
+            os.remove(os.path.join(store_dir, name))
+    if os.path.exists(segment_path(store_dir, segment_number)):
+        with open(segment_path(store_dir, segment_number), "r+b") as f:
+            f.truncate(segment_end)
+
+    with os.scandir(json_dir) as entries:
+        new_files = [entry.name for entry in entries
+                     if entry.name.endswith(".json") and entry.name[:-5] not in index]
+    new_files.sort()
+    print(f"{len(index)} records already compacted, {len(new_files)} new files")
+
+    added = 0
+    pending = []
+    segment_file = open(segment_path(store_dir, segment_number), "ab")
+    index_file = open(os.path.join(store_dir, INDEX_FILE_NAME), "a")
+
+    def commit():
+        # data must hit disk before the index entries that point at it
+        segment_file.flush()
+        os.fsync(segment_file.fileno())
+        index_file.writelines(pending)
+        index_file.flush()
+        pending.clear()
+
+    try:
+        for json_file in tqdm(new_files):
+            try:
+                with open(os.path.join(json_dir, json_file), "r") as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Skipping {json_file}: {e}")
+                continue
+            line = (json.dumps(record) + "\n").encode("utf-8")
+
+            offset = segment_file.tell()
+            if offset > 0 and offset + len(line) > segment_bytes:
+                commit()
+                segment_file.close()
+                segment_number += 1
+                segment_file = open(segment_path(store_dir, segment_number), "ab")
+                offset = segment_file.tell()
+
+            segment_file.write(line)
+            pending.append(f"{json_file[:-5]}\t{segment_number}\t{offset}\t{len(line)}\n")
+            added += 1
+            if len(pending) >= INDEX_BATCH_SIZE:
+                commit()
+    finally:
+        commit()
+        segment_file.close()
+        os.fsync(index_file.fileno())
+        index_file.close()
+    return added
+
+
+def project(record, columns):
+    if columns is None:
+        return record
+    return {column: record.get(column) for column in columns}
+
+
+def iter_segment_records(store_dir, columns=None, ids=None):
+    """
+    yield records from the segment store
+    :param columns: optional list of keys to keep from each record
+    :param ids: optional iterable of ids; only those records are read, via the index
+    """
+    if ids is not None:
+        index = load_index(store_dir)
+        locations = sorted(index[str(i)] for i in ids if str(i) in index)
+        open_segment, f = None, None
+        try:
+            for segment_number, offset, length in locations:
+                if segment_number != open_segment:
+                    if f is not None:
+                        f.close()
+                    f = open(segment_path(store_dir, segment_number), "rb")
+                    open_segment = segment_number
+                f.seek(offset)
+                yield project(json.loads(f.read(length)), columns)
+        finally:
+            if f is not None:
+                f.close()
+        return
+
+    # sequential scan: read each indexed segment front to back, stopping at the last indexed byte
+    index = load_index(store_dir)
+    segment_ends = {}
+    for segment_number, offset, length in index.values():
+        segment_ends[segment_number] = max(segment_ends.get(segment_number, 0), offset + length)
+    for segment_number in sorted(segment_ends):
+        with open(segment_path(store_dir, segment_number), "rb") as f:
+            while f.tell() < segment_ends[segment_number]:
+                line = f.readline()
+                if not line:
+                    break
+                yield project(json.loads(line), columns)
+
+
+def load_segments_to_dataframe(store_dir, columns=None, ids=None):
+    return pd.DataFrame(list(iter_segment_records(store_dir, columns=columns, ids=ids)), columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact per-obituary json files into segment files")
+    parser.add_argument("json_dir", help="directory of <id>.json files")
+    parser.add_argument("--store", default=None, help="segment store directory (defaults to <json_dir>/segments)")
+    parser.add_argument("--segment-mb", type=int, default=DEFAULT_SEGMENT_BYTES // (1024 * 1024),
+                        help="target size of each segment file in MB")
+    args = parser.parse_args()
+
+    added = compact_json_dir(args.json_dir, args.store, segment_bytes=args.segment_mb * 1024 * 1024)
+    print(f"Added {added} records")
+
+
+if __name__ == "__main__":
+    main()
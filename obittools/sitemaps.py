@@ -0,0 +1,368 @@
+"""
+Fetch and parse legacy.com memorial sitemaps into a deduplicated on-disk url store.
+
+Shards are fetched concurrently (plain http first, a pooled browser if that is blocked) and parsed
+incrementally as bytes arrive, so neither a shard nor the full url list is ever held in memory.
+Parsed (url, lastmod) entries go through a bounded queue to a single writer that upserts them into
+a sqlite database keyed on obituary id, applying the -memorial?id= -> -obituary?id= rewrite.
+
+The store also remembers the (id, lastmod) of every url already handed to the scraper, so a refresh
+only emits the delta: ids that are new or whose lastmod moved forward since they were last queued.
+"""
+
+import os
+import re
+import json
+import queue
+import codecs
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+
+from obittools.probing import is_blocked_title, is_challenge_title
+
+
+SITEMAP_URL_TEMPLATE = "http://www.legacy.com/us/memorials-sitemap-{}.xml"
+SITEMAP_COUNT = 20
+OBIT_ID_PATTERN = re.compile(r"[?&](?:id|pid)=(\d+)")
+CHUNK_BYTES = 1024 * 1024
+_DONE = object()
+
+
+def sitemap_urls(count=SITEMAP_COUNT):
+    return [SITEMAP_URL_TEMPLATE.format(i) for i in range(1, count + 1)]
+
+
+def normalize_obit_url(url):
+    return url.strip().replace("-memorial?id=", "-obituary?id=")
+
+
+def extract_obit_id(url):
+    match = OBIT_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+def lastmod_key(lastmod):
+    """
+    comparable form of a sitemap lastmod: UTC iso timestamp, so "...Z", "+00:00" and offset forms order correctly
+    unparseable values are returned as is
+    """
+    if not lastmod:
+        return ""
+    text = lastmod.strip()
+    try:
+        parsed = datetime.fromisoformat(text[:-1] + "+00:00" if text.endswith("Z") else text)
+    except ValueError:
+        return text
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+class SitemapEntryParser(HTMLParser):
+    """
+    Incremental parser for <url><loc>..</loc><lastmod>..</lastmod></url> entries.
+
+    html.parser is used instead of an xml parser because browser-fetched shards come back wrapped
+    in the browser's xml viewer markup, which is not well-formed xml.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.entries = []
+        self.field = None
+        self.loc, self.lastmod = None, None
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "url":
+            self.loc, self.lastmod = None, None
+        elif tag in ("loc", "lastmod"):
+            self.field = tag
+            self.text = []
+
+    def handle_data(self, data):
+        if self.field is not None:
+            self.text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == self.field:
+            value = "".join(self.text).strip()
+            if tag == "loc":
+                self.loc = value
+            else:
+                self.lastmod = value
+            self.field = None
+        elif tag == "url" and self.loc:
+            self.entries.append((normalize_obit_url(self.loc), self.lastmod))
+            self.loc, self.lastmod = None, None
+
+    def pop_entries(self):
+        entries, self.entries = self.entries, []
+        return entries
+
+
+def iter_sitemap_entries(chunks):
+    """
+    :param chunks: iterable of str or utf-8 bytes chunks of a sitemap
+    :return: generator of (url, lastmod) tuples
+    """
+    parser = SitemapEntryParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = decoder.decode(chunk)
+        parser.feed(chunk)
+        yield from parser.pop_entries()
+    parser.feed(decoder.decode(b"", final=True))
+    parser.close()
+    yield from parser.pop_entries()
+
+
+def iter_file_chunks(path, chunk_bytes=CHUNK_BYTES):
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                return
+            yield chunk
+
+
+class SitemapUrlStore:
+    """
+    sqlite table of obituary urls keyed on obituary id; the most recent lastmod wins on conflict.
+    a second table, synced, holds the (id, lastmod) of every url already emitted to the scraper.
+    single-writer: only the thread that created the store should call add_entries.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.create_function("lastmod_key", 1, lastmod_key)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS urls (id TEXT PRIMARY KEY, url TEXT NOT NULL, lastmod TEXT, source TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS synced (id TEXT PRIMARY KEY, lastmod TEXT)")
+        self.connection.commit()
+
+    def add_entries(self, entries, source=None):
+        """
+        :param entries: iterable of (url, lastmod); urls without an obituary id are keyed on the url itself
+        :return: number of entries processed
+        """
+        rows = [(extract_obit_id(url) or url, url, lastmod, source) for url, lastmod in entries]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO urls (id, url, lastmod, source) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET url = excluded.url, lastmod = excluded.lastmod, source = excluded.source "
+                "WHERE lastmod_key(excluded.lastmod) > lastmod_key(urls.lastmod)", rows)
+        return len(rows)
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+    def iter_urls(self, batch_size=10000):
+        """
+        :return: generator of (id, url, lastmod) in id order
+        """
+        cursor = self.connection.execute("SELECT id, url, lastmod FROM urls ORDER BY id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def export_json(self, all_urls_path=None, only_urls_path=None):
+        """
+        stream the store out in the all_urls.json ({"url", "timestamp"} records) and only_urls.json formats
+        """
+        all_urls_file = open(all_urls_path, "w") if all_urls_path else None
+        only_urls_file = open(only_urls_path, "w") if only_urls_path else None
+        try:
+            for f in (all_urls_file, only_urls_file):
+                if f is not None:
+                    f.write("[")
+            for i, (_, url, lastmod) in enumerate(self.iter_urls()):
+                separator = ",\n" if i else "\n"
+                if all_urls_file is not None:
+                    all_urls_file.write(separator + json.dumps({"url": url, "timestamp": lastmod}))
+                if only_urls_file is not None:
+                    only_urls_file.write(separator + json.dumps(url))
+            for f in (all_urls_file, only_urls_file):
+                if f is not None:
+                    f.write("\n]\n")
+        finally:
+            for f in (all_urls_file, only_urls_file):
+                if f is not None:
+                    f.close()
+
+    def seed_synced(self, records):
+        """
+        record a previous scrape's url list as already synced, e.g. the all_urls.json it was run from
+        :param records: iterable of {"url", "timestamp"} dicts
+        :return: number of records seeded
+        """
+        rows = [(extract_obit_id(normalize_obit_url(record["url"])) or normalize_obit_url(record["url"]),
+                 record.get("timestamp")) for record in records]
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO synced (id, lastmod) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET lastmod = excluded.lastmod "
+                "WHERE lastmod_key(excluded.lastmod) > lastmod_key(synced.lastmod)", rows)
+        return len(rows)
+
+    def iter_delta(self, batch_size=10000):
+        """
+        :return: generator of (id, url, lastmod) for urls never synced or whose lastmod is newer than when synced
+        """
+        cursor = self.connection.execute(
+            "SELECT urls.id, urls.url, urls.lastmod FROM urls LEFT JOIN synced ON synced.id = urls.id "
+            "WHERE synced.id IS NULL OR lastmod_key(urls.lastmod) > lastmod_key(synced.lastmod) ORDER BY urls.id")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+
+    def export_delta(self, path, mark_synced=False):
+        """
+        write the delta as an all_urls.json-style work queue for parallel_obit_scraper
+        :param mark_synced: record the emitted (id, lastmod) pairs as synced right away; leave False when the queue
+                            is going to be scraped, and record what the scrape finished with commit_scraped instead,
+                            so urls from an interrupted or failed scrape stay in the next delta
+        :return: number of urls written
+        """
+        # materialized first: marking rows synced while the delta query is still being read would change its result
+        delta = list(self.iter_delta())
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write("[")
+            for i, (_, url, lastmod) in enumerate(delta):
+                f.write((",\n" if i else "\n") + json.dumps({"url": url, "timestamp": lastmod}))
+            f.write("\n]\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        if mark_synced:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO synced (id, lastmod) VALUES (?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET lastmod = excluded.lastmod",
+                    [(obit_id, lastmod) for obit_id, _, lastmod in delta])
+        return len(delta)
+
+    def commit_scraped(self, rows):
+        """
+        record urls as synced once they have been scraped, e.g. from ScrapeManifest.scraped_lastmods()
+        :param rows: iterable of (id, lastmod the url was scraped at)
+        :return: number of rows recorded
+        """
+        rows = list(rows)
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO synced (id, lastmod) VALUES (?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET lastmod = excluded.lastmod "
+                "WHERE lastmod_key(excluded.lastmod) > lastmod_key(synced.lastmod)", rows)
+        return len(rows)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def fetch_sitemap_chunks(fetcher, url, raw_path=None, chunk_bytes=CHUNK_BYTES):
+    """
+    yield a sitemap shard in chunks: streamed over http when the server answers with xml, otherwise loaded
+    through the fetcher's browser tier. chunks are also written to raw_path if given.
+    """
+    raw_file = open(raw_path, "wb") if raw_path else None
+    try:
+        response = None
+        if fetcher.use_http:
+            try:
+                response = fetcher.session.get(url, timeout=fetcher.timeout, stream=True)
+            except Exception as e:
+                print(f"{url} http tier failed: {e}")
+        if response is not None and response.status_code == 200 and "xml" in response.headers.get("Content-Type", ""):
+            with response:
+                for chunk in response.iter_content(chunk_size=chunk_bytes):
+                    if raw_file is not None:
+                        raw_file.write(chunk)
+                    yield chunk
+            return
+        if response is not None:
+            response.close()
+        if fetcher.driver_pool is None:
+            raise Exception(f"Failed to get sitemap over http and no browser available: {url}")
+        result = fetcher.fetch_browser(url)
+        if is_blocked_title(result.current_title) or is_challenge_title(result.current_title):
+            raise Exception(f"Blocked fetching sitemap ({result.current_title}): {url}")
+        data = result.page_source.encode("utf-8")
+        for start in range(0, len(data), chunk_bytes):
+            if raw_file is not None:
+                raw_file.write(data[start:start + chunk_bytes])
+            yield data[start:start + chunk_bytes]
+    finally:
+        if raw_file is not None:
+            raw_file.close()
+
+
+def crawl_sitemaps(urls, store, fetcher, workers=4, raw_dir=None, batch_size=5000, max_queued_batches=16):
+    """
+    fetch and parse sitemap shards concurrently, streaming entries into store
+    :param urls: sitemap shard urls
+    :param store: SitemapUrlStore, written from the calling thread only
+    :param fetcher: TieredFetcher providing the http session and the browser fallback
+    :param raw_dir: optional directory to keep the raw shards in (named like the shard file)
+    :param max_queued_batches: bound on parsed batches waiting for the writer, which bounds memory
+    :return: dict of shard url -> number of entries, or the error message for failed shards
+    """
+    batches = queue.Queue(maxsize=max_queued_batches)
+    results = {}
+    lock = threading.Lock()
+
+    def crawl_one(url):
+        raw_path = os.path.join(raw_dir, url.split("/")[-1]) if raw_dir else None
+        n_entries, batch = 0, []
+        try:
+            for entry in iter_sitemap_entries(fetch_sitemap_chunks(fetcher, url, raw_path)):
+                batch.append(entry)
+                if len(batch) >= batch_size:
+                    batches.put((url, batch))
+                    n_entries += len(batch)
+                    batch = []
+            if batch:
+                batches.put((url, batch))
+                n_entries += len(batch)
+            outcome = n_entries
+        except Exception as e:
+            outcome = f"ERROR: {e}"
+        with lock:
+            results[url] = outcome
+        print(f"{url}: {outcome}")
+
+    def crawl_all():
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(crawl_one, urls))
+        finally:
+            batches.put(_DONE)
+
+    producer = threading.Thread(target=crawl_all, daemon=True)
+    producer.start()
+    while True:
+        item = batches.get()
+        if item is _DONE:
+            break
+        url, batch = item
+        store.add_entries(batch, source=url.split("/")[-1])
+    producer.join()
+    return results
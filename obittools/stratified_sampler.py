@@ -0,0 +1,197 @@
+"""
+Stratified, adaptive sampling of the obituary ID space.
+
+The ID range is split into equal-width strata. Hit rates per stratum are estimated from earlier
+probes (checkpoint bitmaps and/or round logs), shrunk toward the overall hit rate so thinly
+probed strata are not over- or under-trusted. Each round gives an exploration share of the
+probes evenly to every stratum and allocates the rest in proportion to estimated hit rate.
+
+Within a stratum the ids are a simple random sample of the ids not yet probed, so each round
+records a design (N_h unprobed ids, n_h drawn, weight N_h / n_h, plus hits already known in
+the stratum). estimate_hits turns a design and its results into an unbiased estimate of the
+number of obituaries in the range, conditional on the allocation.
+"""
+
+import random
+import numpy as np
+
+from obittools.probing import is_definitive
+from obittools.round_log import merge_round_logs
+
+
+class StratifiedSampler:
+
+    def __init__(self, begin, end, n_strata=600, explore=0.2, prior_strength=20.0):
+        """
+        :param begin: first id of the sampled range
+        :param end: end of the sampled range (exclusive)
+        :param n_strata: number of equal-width strata
+        :param explore: fraction of each round spread evenly over all strata regardless of hit rate
+        :param prior_strength: pseudo-probes pulling each stratum's hit rate toward the overall rate
+        """
+        self.begin, self.end = begin, end
+        self.edges = np.unique(np.linspace(begin, end, n_strata + 1).astype(np.int64))
+        self.n_strata = len(self.edges) - 1
+        self.explore = explore
+        self.prior_strength = prior_strength
+        self.probes = np.zeros(self.n_strata, dtype=np.int64)
+        self.hits = np.zeros(self.n_strata, dtype=np.int64)
+
+    def stratum_of(self, ids):
+        return np.searchsorted(self.edges, np.asarray(ids, dtype=np.int64), side="right") - 1
+
+    def sizes(self):
+        return np.diff(self.edges)
+
+    def add_results(self, results):
+        """
+        :param results: iterable of probe result dicts; errors are ignored, ids outside the range are skipped
+        """
+        ids, hit_flags = [], []
+        for result in results:
+            if is_definitive(result):
+                ids.append(int(result["id"]))
+                hit_flags.append(result["statusCode"] == "0")
+        if not ids:
+            return
+        strata = self.stratum_of(ids)
+        inside = (strata >= 0) & (strata < self.n_strata)
+        np.add.at(self.probes, strata[inside], 1)
+        np.add.at(self.hits, strata[inside], np.asarray(hit_flags)[inside].astype(np.int64))
+
+    def add_round_logs(self, queries_dir):
+        self.add_results(merge_round_logs(queries_dir).values())
+
+    def counts_from_checkpoint(self, checkpoint):
+        """
+        :return: (probed per stratum, hits per stratum) from a SamplingCheckpoint's bitmaps
+        """
+        starts = self.edges[:-1] - self.begin
+        probed = np.add.reduceat(checkpoint.probed.bits(self.begin, self.end), starts)
+        hits = np.add.reduceat(checkpoint.hits.bits(self.begin, self.end), starts)
+        return probed.astype(np.int64), hits.astype(np.int64)
+
+    def hit_rates(self, probes=None, hits=None):
+        probes = self.probes if probes is None else probes
+        hits = self.hits if hits is None else hits
+        overall = (hits.sum() + 1.0) / (probes.sum() + 2.0)
+        return (hits + self.prior_strength * overall) / (probes + self.prior_strength)
+
+    def allocate(self, n, available, rates, rng=random):
+        """
+        split n probes over strata: an exploration floor for every stratum with ids left, the rest by hit rate
+        :param available: ids left to probe per stratum
+        :param rates: estimated hit rate per stratum
+        :return: numpy array of probes per stratum, never more than available
+        """
+        available = np.asarray(available, dtype=np.int64)
+        n = int(min(n, available.sum()))
+        allocation = np.zeros(self.n_strata, dtype=np.int64)
+        open_strata = np.flatnonzero(available > 0)
+        if n == 0 or len(open_strata) == 0:
+            return allocation
+
+        explore_budget = int(self.explore * n)
+        allocation[open_strata] = explore_budget // len(open_strata)
+        for h in rng.sample(list(open_strata), explore_budget % len(open_strata)):
+            allocation[h] += 1
+        allocation = np.minimum(allocation, available)
+
+        while allocation.sum() < n:
+            remaining = n - allocation.sum()
+            room = available - allocation
+            weights = np.where(room > 0, rates, 0.0)
+            if weights.sum() <= 0:
+                weights = (room > 0).astype(float)
+            share = weights / weights.sum() * remaining
+            add = np.minimum(np.floor(share).astype(np.int64), room)
+            if add.sum() == 0:
+                # less than one probe per stratum left: hand them to the strata with the most weight
+                for h in np.argsort(-weights)[:remaining]:
+                    if room[h] > 0:
+                        add[h] = 1
+            allocation += add
+        return allocation
+
+    def draw(self, n, checkpoint=None, rng=random):
+        """
+        draw a round of n ids
+        :param checkpoint: optional SamplingCheckpoint; its bitmaps provide hit rates and exclude probed ids
+        :return: (shuffled list of ids, design dict for estimate_hits)
+        """
+        sizes = self.sizes()
+        probes, hits = self.probes, self.hits
+        if checkpoint is not None:
+            probed_counts, hit_counts = self.counts_from_checkpoint(checkpoint)
+            probes, hits = probes + probed_counts, hits + hit_counts
+            available = sizes - probed_counts
+            known_hits = hit_counts
+        else:
+            available = sizes
+            known_hits = np.zeros(self.n_strata, dtype=np.int64)
+        rates = self.hit_rates(probes, hits)
+        allocation = self.allocate(n, available, rates, rng=rng)
+
+        ids, strata = [], []
+        for h in np.flatnonzero(allocation):
+            low, high = int(self.edges[h]), int(self.edges[h + 1])
+            if checkpoint is not None:
+                drawn = checkpoint.sample_unprobed(low, high, int(allocation[h]), rng=rng)
+            else:
+                drawn = rng.sample(range(low, high), int(allocation[h]))
+            ids.extend(drawn)
+            strata.append({
+                "stratum": int(h),
+                "begin": low,
+                "end": high,
+                "population": int(available[h]),
+                "sample_size": len(drawn),
+                "weight": float(available[h] / len(drawn)),
+                "known_hits": int(known_hits[h]),
+                "estimated_hit_rate": float(rates[h]),
+            })
+        rng.shuffle(ids)
+        design = {
+            "begin": self.begin,
+            "end": self.end,
+            "strata": strata,
+            # strata that got no probes this round still count toward the population total
+            "unsampled_population": int(available.sum() - sum(s["population"] for s in strata)),
+            "unsampled_known_hits": int(known_hits.sum() - sum(s["known_hits"] for s in strata)),
+        }
+        return ids, design
+
+
+def estimate_hits(design, results):
+    """
+    stratified estimate of the number of obituary ids in the design's range
+    :param design: dict returned by StratifiedSampler.draw
+    :param results: probe result dicts for the round
+    :return: (estimate, standard error); strata with no probes this round contribute only their known hits,
+             so the estimate is a lower bound for them
+    """
+    strata = design["strata"]
+    starts = np.array([stratum["begin"] for stratum in strata], dtype=np.int64)
+    outcomes = [[] for _ in strata]
+    for result in results:
+        if not is_definitive(result) or not strata:
+            continue
+        obit_id = int(result["id"])
+        position = int(np.searchsorted(starts, obit_id, side="right")) - 1
+        if position >= 0 and obit_id < strata[position]["end"]:
+            outcomes[position].append(result["statusCode"] == "0")
+
+    estimate = float(design.get("unsampled_known_hits", 0))
+    variance = 0.0
+    for stratum, stratum_outcomes in zip(strata, outcomes):
+        n_h = len(stratum_outcomes)
+        population = stratum["population"]
+        estimate += stratum["known_hits"]
+        if n_h == 0:
+            continue
+        p_h = sum(stratum_outcomes) / n_h
+        estimate += population * p_h
+        if n_h > 1:
+            # finite population correction: sampling is without replacement
+            variance += population ** 2 * (1 - n_h / population) * p_h * (1 - p_h) / (n_h - 1)
+    return estimate, variance ** 0.5
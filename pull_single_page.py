@@ -10,6 +10,9 @@ from bs4 import BeautifulSoup
 from seleniumbase import Driver
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from obittools import parse_page_metadata_from_schemas_in_html
+from obittools.driver_pool import DriverPool
+from obittools.probing import is_blocked_title
+from obittools.driver_config import DEFAULT_BLOCKED_CLASSES
 
 
 parser = argparse.ArgumentParser()
@@ -17,6 +20,7 @@ parser.add_argument("-s", "--samplesize", type=int, help="number of IDs to sampl
 parser.add_argument("-t", "--threads", type=int, help="number of threads to use")
 parser.add_argument("-b", "--beginindex", type=int, help="linux timestamp to start sampling from")
 parser.add_argument("-e", "--endindex", type=int, help="linux timestamp to end sampling at")
+parser.add_argument("--noblock", action="store_true", help="let the browser load images, fonts, ads, analytics and video")
 args = parser.parse_args()
 
 sample_size, threads, begin_index, end_index = 50000, 16, 1, 58000000
@@ -31,26 +35,9 @@ if args.endindex is not None:
     end_index = args.endindex
 
 collection = f"test_results"
-thread_local = threading.local()
-
-def get_driver(reset_driver=False):
-    """
-    manage selenium webdriver instances for each running thread
-    :param reset_driver:
-    :return:
-    """
-    print(f"reset_driver is {reset_driver}")
-    driver = getattr(thread_local, 'driver', None)
-    if reset_driver:
-        if driver is not None:
-            driver.quit()
-            sleep(5)
-        setattr(thread_local, 'driver', None)
-    if driver is None:
-        driver = Driver(uc=True, headless=True, binary_location=os.getenv("CHROME_BINARY"))
-        print(driver)
-    setattr(thread_local, 'driver', driver)
-    return driver
+# one browser per thread, reused across pages; reset when we get blocked
+driver_pool = DriverPool(threads, uc=True, headless=True, binary_location=os.getenv("CHROME_BINARY"),
+                         block_resources=None if args.noblock else DEFAULT_BLOCKED_CLASSES)
 
 
 # example: https://www.legacy.com/us/obituaries/charlotte/name/david-melton-obituary?id=57552782
@@ -84,52 +71,51 @@ def check_url(url_tuple):
 
     TIMEOUT = 20
 
-    tries, reset_driver = 0, False
+    tries = 0
     current_title, current_errormsg = "", ""
 
     print("Processing page")
 
     while tries < 4:
         try:
-            # driver = Driver(uc=True, headless=True, driver_version="/home/kyzheng/obitvenv313/lib/python3.13/site-packages/seleniumbase/drivers/chromedriver", binary_location=os.getenv("CHROME_BINARY"), no_sandbox=True, disable_gpu=True, disable_csp=True, remote_debug=False, use_wire=True,) # get_driver(reset_driver)
-            driver = get_driver(reset_driver)
-            print(driver)
-            print("Got driver")
-            print(url)
-            driver.get(url)
-            #driver.wait_for_attribute(selector='script', attribute='data-hypernova-key', value='ObituaryPage')
-            # driver.wait_for_element(timeout=100)
-            print("Got page")
-            # WebDriverWait(driver, TIMEOUT).until(expected_conditions.presence_of_element_located((By.CSS_SELECTOR, "div#topContent2")))
-            # driver.implicitly_wait(5)  # wait up to 5 secs just in case things don't load immediately?
-            page_source, current_title, current_url = driver.page_source, driver.title, driver.current_url
-            print("Got page source")
-            print(page_source)
-
-            """
-            STRUCTURE:
-            
-            if not denied:
-                if url is different:
-                    save html, extract data
-                elif url is same
-                    discard (ID did not resolve)
-            else: (denied)
-                reset driver, repeat 5 times  
-            """
-
-
-            # TODO: what is the title of the page when we're denied?
-            if not current_title == "Access Denied":  # this is when we're not blocked
-                # current_status = driver.page_stat
-                json_metadata_object, results_dict = parse_page_metadata_from_schemas_in_html(page_source)
-                print(results_dict)
-                # driver.quit()
-                exit()
-            else:  # this is when we are blocked -- gotcha
-                driver.quit()
-                sleep(5)
-                setattr(thread_local, 'driver', None)
+            # driver = Driver(uc=True, headless=True, driver_version="/home/kyzheng/obitvenv313/lib/python3.13/site-packages/seleniumbase/drivers/chromedriver", binary_location=os.getenv("CHROME_BINARY"), no_sandbox=True, disable_gpu=True, disable_csp=True, remote_debug=False, use_wire=True,)
+            with driver_pool.lease() as lease:
+                driver = lease.driver
+                print(driver)
+                print("Got driver")
+                print(url)
+                driver.get(url)
+                #driver.wait_for_attribute(selector='script', attribute='data-hypernova-key', value='ObituaryPage')
+                # driver.wait_for_element(timeout=100)
+                print("Got page")
+                # WebDriverWait(driver, TIMEOUT).until(expected_conditions.presence_of_element_located((By.CSS_SELECTOR, "div#topContent2")))
+                # driver.implicitly_wait(5)  # wait up to 5 secs just in case things don't load immediately?
+                page_source, current_title, current_url = driver.page_source, driver.title, driver.current_url
+                print("Got page source")
+                print(page_source)
+
+                """
+                STRUCTURE:
+
+                if not denied:
+                    if url is different:
+                        save html, extract data
+                    elif url is same
+                        discard (ID did not resolve)
+                else: (denied)
+                    reset driver, repeat 5 times
+                """
+
+                # TODO: what is the title of the page when we're denied?
+                if not is_blocked_title(current_title):  # this is when we're not blocked
+                    # current_status = driver.page_stat
+                    json_metadata_object, results_dict = parse_page_metadata_from_schemas_in_html(page_source)
+                    print(results_dict)
+                    driver_pool.close()
+                    exit()
+                else:  # this is when we are blocked -- gotcha
+                    lease.reset()
+            sleep(5)
         except Exception as e:
             current_errormsg = str(e)
             # kevin there is sometimes a field in the legacy webpage with the data-component value "LifespanText". includes like 1940 - 2025
@@ -137,14 +123,9 @@ def check_url(url_tuple):
             # modifying data collection code to look for this. word
             if "Message: invalid session id" not in current_errormsg:  # "invalid session id" error is fixed with a driver reset
                 tqdm.write(f"{obit_id} {current_errormsg}")
-            driver = getattr(thread_local, 'driver', None)
-            if driver is not None:
-                driver.quit()
-            setattr(thread_local, 'driver', None)
             sleep(5)
         finally:
             tries += 1
-            reset_driver = True
     tqdm.write(f"{obit_id} returning none")
     return {
         "id": str(obit_id),
@@ -1,6 +1,7 @@
 import os
 import json
 import random
+import asyncio
 import argparse
 import threading
 from tqdm import tqdm
@@ -10,6 +11,15 @@ from bs4 import BeautifulSoup
 from seleniumbase import Driver
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from obittools import ROOT_DIR, initialize_collection
+from obittools.driver_pool import DriverPool
+from obittools.driver_config import DEFAULT_BLOCKED_CLASSES
+from obittools.fetch import TieredFetcher
+from obittools.async_probe import probe_ids
+from obittools.id_bitmap import SamplingCheckpoint
+from obittools.round_log import RoundLogWriter, find_partial_log, iter_round_log, LOG_SUFFIX
+from obittools.stratified_sampler import StratifiedSampler, estimate_hits
+from obittools.probing import build_url, classify_probe, probe_result, hit_status_message, is_definitive, \
+    MISS_STATUS_MESSAGE
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
@@ -23,6 +33,26 @@ parser.add_argument("-s", "--samplesize", type=int, help="number of IDs to sampl
 parser.add_argument("-t", "--threads", type=int, help="number of threads to use")
 parser.add_argument("-b", "--beginindex", type=int, help="linux timestamp to start sampling from")
 parser.add_argument("-e", "--endindex", type=int, help="linux timestamp to end sampling at")
+parser.add_argument("-m", "--maxpages", type=int, default=200, help="restart each browser after this many pages")
+parser.add_argument("-j", "--jitter", type=float, default=10, help="sleep up to this many seconds before each probe")
+parser.add_argument("--browseronly", action="store_true", help="skip the plain http tier and probe with the browser")
+parser.add_argument("--noblock", action="store_true", help="let the browser load images, fonts, ads, analytics and video")
+parser.add_argument("--engine", choices=["threads", "async"], default="threads",
+                    help="threads: one fetch per thread with jitter; async: adaptive asyncio http prober, "
+                         "falling back to the threaded browser probe only for ids that did not redirect")
+parser.add_argument("--rate", type=float, default=2.0, help="async engine: initial requests per second")
+parser.add_argument("--maxconcurrency", type=int, default=64, help="async engine: upper bound on requests in flight")
+parser.add_argument("--sampler", choices=["uniform", "stratified"], default="uniform",
+                    help="uniform: simple random sample of unprobed ids; stratified: allocate probes to strata of "
+                         "the id range by observed hit rate and record design weights per round")
+parser.add_argument("--strata", type=int, default=600, help="stratified sampler: number of equal-width strata")
+parser.add_argument("--explore", type=float, default=0.2,
+                    help="stratified sampler: fraction of each round spread evenly over all strata")
+parser.add_argument("--history", nargs="*", default=[],
+                    help="stratified sampler: queries directories of earlier collections to learn hit rates from")
+parser.add_argument("-r", "--resume", default=None,
+                    help="name of an earlier random_legacy_* collection to resume; its unfinished round is completed "
+                         "first and ids it already probed are never drawn again")
 args = parser.parse_args()
 
 sample_size, threads, begin_index, end_index = 50000, 2, 1, 60000000
@@ -37,37 +67,13 @@ if args.endindex is not None:
     end_index = args.endindex
 
 current_time = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-collection = f"random_legacy_{current_time}"
-
-
-
-# def get_driver(reset_driver=False):
-#     """
-#     manage selenium webdriver instances for each running thread
-#     :param reset_driver:
-#     :return:
-#     """
-#     # print(f"reset_driver is {reset_driver}")
-#     thread_local = threading.local()
-#     driver = getattr(thread_local, 'driver', None)
-#     if reset_driver:
-#         if driver is not None:
-#             driver.quit()
-#             sleep(5)
-#         setattr(thread_local, 'driver', None)
-#     if driver is None:
-#         driver = Driver(uc=True, page_load_strategy='eager', guest_mode=True, do_not_track=True, headless2=True)  # , headless=True, binary_location=os.getenv("CHROME_BINARY"))
-#     setattr(thread_local, 'driver', driver)
-#     return driver
-
-# example: https://www.legacy.com/us/obituaries/charlotte/name/david-melton-obituary?id=57552782
-def build_url(id, base = "https://www.legacy.com", infix = "/us/obituaries/name/a-obituary?id="):
-    """
-    :param id: id of obituary
-    :return: formatted url string
-    """
-    base, infix = base.strip(), infix.strip()
-    return f"{base}{infix}{id}"
+collection = args.resume if args.resume is not None else f"random_legacy_{current_time}"
+
+# one browser per thread, shared across IDs, and the http-first fetcher in front of it; created in main()
+driver_pool = None
+fetcher = None
+# probed/hit bitmaps for the collection; created in main()
+checkpoint = None
 
 
 def extract_metadata(page_source):
@@ -86,7 +92,7 @@ def already_scraped(obit_id):
     :param obit_id: id of obituary
     :return: bool
     """
-    return os.path.exists(os.path.join(ROOT_DIR, "collections", collection, "metadata", f"{obit_id}.json"))
+    return checkpoint is not None and obit_id in checkpoint.probed
 
 
 
@@ -100,102 +106,166 @@ def check_url(url_tuple):
     url = url_tuple[0]
     obit_id = url_tuple[1]
 
-    TIMEOUT = 20
-
-    tries, reset_driver = 0, False
+    tries = 0
     current_title, current_errormsg, current_url = "", "0", ""
 
     while tries < 5:
         try:
-            sleep(random.random()*10)
-            driver = Driver(uc=True, page_load_strategy='eager', guest_mode=True, do_not_track=True)  # , headless2=True)  # get_driver(reset_driver)
+            sleep(random.random()*args.jitter)
             print()
             print(f"Getting URL: {url}")
-            wait = WebDriverWait(driver, TIMEOUT)
-            driver.get(url)
-            wait.until(EC.presence_of_element_located((By.XPATH, '/html/body/div[1]/div[1]')))
-            page_source, current_title, current_url = driver.page_source, driver.title, driver.current_url
-            driver.quit()
-
-            if "502" in current_title and "bad gateway" in current_title.lower():
+            result = fetcher.fetch(url, obit_id)
+            page_source, current_title, current_url = result.page_source, result.current_title, result.current_url
+
+            outcome = classify_probe(obit_id, current_url, current_title)
+            if outcome == "blocked":
+                raise Exception("Access Denied")
+            if outcome == "challenge":
+                raise Exception("cloudflare")
+            if outcome == "bad_gateway":
                 raise Exception("502: bad gateway")
-            if f"/a-obituary?id={obit_id}" in current_url:
+            if outcome == "no_redirect":
                 raise Exception("no redirect")
-
-            elif not "obituaries/search?firstName=a&lastName=obituary" in current_url:
-                if ("?pid=" in current_url or "?id=" in current_url):
-                    print()
-                    print(f"Success: {current_url} {current_title}")
-                    with open(os.path.join(ROOT_DIR, "collections", collection, "metadata", f"{obit_id}_obit.html"),
-                              "w") as f:
-                        f.write(page_source)
-                    if str(obit_id) not in current_url:
-                        current_errormsg = current_url.split("?")[-1]
-                    else:
-                        current_errormsg = "0"
-
-                    return {
-                        "id": str(obit_id),
-                        "url": current_url,
-                        "title": current_title,
-                        "statusCode": "0",
-                        "statusMsg": current_errormsg,
-                    }
-            current_errormsg = "redirect, no obituary id/pid"
+            elif outcome == "hit":
+                print()
+                print(f"Success ({result.tier}): {current_url} {current_title}")
+                with open(os.path.join(ROOT_DIR, "collections", collection, "metadata", f"{obit_id}_obit.html"),
+                          "w") as f:
+                    f.write(page_source)
+                return probe_result(obit_id, current_url, current_title, "0", hit_status_message(obit_id, current_url))
+            current_errormsg = MISS_STATUS_MESSAGE
             break
         except Exception as e:
             current_errormsg = str(e)
             if "Message: invalid session id" not in current_errormsg:  # "invalid session id" error is fixed with a driver reset
                 tqdm.write(f"{obit_id} {current_errormsg}")
-            # thread_local = threading.local()
-            # driver = getattr(thread_local, 'driver', None)
-            # if driver is not None:
-            #     driver.quit()
-            # setattr(thread_local, 'driver', None)
             sleep(5)
         finally:
             tries += 1
-            reset_driver = True
     print(f"{obit_id} returning none")
-    return {
-        "id": str(obit_id),
-        "url": current_url,
-        "title": current_title,
-        "statusCode": "ERROR",
-        "statusMsg": current_errormsg,
-    }
+    return probe_result(obit_id, current_url, current_title, "ERROR", current_errormsg)
+
+
+def wait_for_page(driver, timeout=20):
+    WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.XPATH, '/html/body/div[1]/div[1]')))
+
+
+def probe_ids_threaded(ids, on_result):
+    with tqdm(total=len(ids)) as pbar:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = [executor.submit(check_url, (build_url(generated_id), generated_id)) for generated_id in ids]
+            for future in as_completed(futures):
+                on_result(future.result())
+                pbar.update(1)
+
+
+def probe_ids_async(ids, on_result):
+    """
+    probe ids with the adaptive asyncio prober; ids that need a browser go through probe_ids_threaded afterwards
+    """
+    escalated = []
+    pbar = tqdm(total=len(ids))
+
+    def save_result(result, page_source):
+        if page_source is not None:
+            with open(os.path.join(ROOT_DIR, "collections", collection, "metadata", f"{result['id']}_obit.html"),
+                      "w") as f:
+                f.write(page_source)
+        on_result(result)
+        pbar.update(1)
+
+    def escalate(obit_id):
+        escalated.append(obit_id)
+        pbar.update(1)
+
+    summary = asyncio.run(probe_ids(ids, save_result, on_escalate=escalate, rate=args.rate,
+                                    initial_concurrency=threads, max_concurrency=args.maxconcurrency))
+    pbar.close()
+    tqdm.write(f"async prober: {json.dumps(summary)}")
+    if escalated:
+        tqdm.write(f"{len(escalated)} ids did not redirect over http, probing with the browser")
+        probe_ids_threaded(escalated, on_result)
 
 
 def main():
+    global driver_pool, fetcher, checkpoint
     print(initialize_collection(collection))
-    all_ids_logged = []
-
-    round = 0
-    while True:
-        all_ids = random.sample(range(begin_index, end_index), sample_size)
-
-        with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_queries.json"), "w") as f:
-            json.dump(all_ids, f)
-        with tqdm(total=len(all_ids)) as pbar:
-            with ThreadPoolExecutor(max_workers=threads) as executor:
-                results = []
-                futures = [executor.submit(check_url, (build_url(generated_id), generated_id)) for
-                           generated_id in all_ids]
-
-                for future in as_completed(futures):
-                    if future.result()["statusCode"] == "0":
-                        # tqdm.write(json.dumps(future.result()))
-                        all_ids_logged.append(future.result()["id"])
-                        # tqdm.write("{:b}".format(int(future.result()["id"])).zfill(64))
-                    results.append(future.result())
-                    pbar.update(1)
-        with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_hits.json"), "w") as f:
-            json.dump(results, f)
-
-        with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_ids.json"), "w") as f:
-            json.dump(all_ids_logged, f)
-        round += 1
+    checkpoint = SamplingCheckpoint(os.path.join(ROOT_DIR, "collections", collection, "checkpoint"),
+                                    max_id=max(end_index, 60000000))
+    driver_pool = DriverPool(threads, max_pages=args.maxpages, launch_jitter=10, uc=True,
+                             page_load_strategy='eager', guest_mode=True, do_not_track=True,
+                             block_resources=None if args.noblock else DEFAULT_BLOCKED_CLASSES)
+    fetcher = TieredFetcher(driver_pool, pool_size=threads, use_http=not args.browseronly, browser_wait=wait_for_page)
+
+    sampler = None
+    if args.sampler == "stratified":
+        sampler = StratifiedSampler(begin_index, end_index, n_strata=args.strata, explore=args.explore)
+        for queries_dir in args.history:
+            sampler.add_round_logs(queries_dir)
+
+    round, all_ids = checkpoint.load_round()
+    if round is not None and all_ids:
+        print(f"Resuming round {round} with {len(all_ids)} ids left")
+    else:
+        round = 0 if round is None else round + 1
+        all_ids = []
+
+    try:
+        while True:
+            design = None
+            if not all_ids:
+                if sampler is not None:
+                    all_ids, design = sampler.draw(sample_size, checkpoint=checkpoint)
+                else:
+                    all_ids = checkpoint.sample_unprobed(begin_index, end_index, sample_size)
+                if not all_ids:
+                    print(f"Every id in [{begin_index}, {end_index}) has been probed")
+                    break
+                checkpoint.start_round(round, all_ids)
+
+                with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_queries.json"), "w") as f:
+                    json.dump(all_ids, f)
+                if design is not None:
+                    with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_design.json"), "w") as f:
+                        json.dump(design, f)
+
+            # results stream to a per-round log; a resumed round keeps appending to its unfinished log
+            queries_dir = os.path.join(ROOT_DIR, "collections", collection, "queries")
+            log_path = find_partial_log(queries_dir, round) or \
+                os.path.join(queries_dir, f"{current_time}_{sample_size}_{round}{LOG_SUFFIX}")
+            with RoundLogWriter(log_path) as round_log:
+
+                def record_result(result):
+                    # only hits and clean misses are checkpointed; errored ids are retried on resume
+                    if is_definitive(result):
+                        checkpoint.mark(result["id"], result["statusCode"] == "0")
+                    round_log.write(result)
+                    if round_log.written % 1000 == 0:
+                        tqdm.write(f"round {round}: {round_log.hits}/{round_log.written} hits "
+                                   f"({round_log.hit_rate():.4%})")
+
+                if args.engine == "async":
+                    probe_ids_async(all_ids, record_result)
+                else:
+                    probe_ids_threaded(all_ids, record_result)
+                checkpoint.flush()
+            # the log was renamed to its final name when the with block exited
+            checkpoint.finish_round(round)
+
+            if design is not None:
+                estimate, standard_error = estimate_hits(design, iter_round_log(log_path))
+                tqdm.write(f"round {round}: estimated {estimate:.0f} (+/- {standard_error:.0f}) obituary ids "
+                           f"in [{begin_index}, {end_index})")
+
+            with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_ids.json"), "w") as f:
+                json.dump([str(obit_id) for obit_id in checkpoint.hits.ids()], f)
+            tqdm.write(f"round {round} fetch tiers: {json.dumps(fetcher.report())}")
+            round += 1
+            all_ids = []
+    finally:
+        driver_pool.close()
+        checkpoint.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -10,7 +10,8 @@ from bs4 import BeautifulSoup
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from obittools import ROOT_DIR, initialize_collection
 
-from seleniumbase import SB
+from obittools.driver_pool import DriverPool, make_sb_factory
+from obittools.probing import is_blocked_title
 
 
 from obittools.extract_data import parse_page_metadata_from_schemas_in_html
@@ -21,6 +22,7 @@ parser.add_argument("-s", "--samplesize", type=int, help="number of IDs to sampl
 parser.add_argument("-t", "--threads", type=int, help="number of threads to use")
 parser.add_argument("-b", "--beginindex", type=int, help="linux timestamp to start sampling from")
 parser.add_argument("-e", "--endindex", type=int, help="linux timestamp to end sampling at")
+parser.add_argument("-m", "--maxpages", type=int, default=200, help="restart each browser after this many pages")
 args = parser.parse_args()
 
 sample_size, threads, begin_index, end_index = 1000, 1, 1, 60000000
@@ -37,6 +39,9 @@ if args.endindex is not None:
 current_time = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
 collection = f"random_legacy_{current_time}"
 
+# one SB browser per thread, shared across IDs and rounds; created in main()
+driver_pool = None
+
 
 
 # example: https://www.legacy.com/us/obituaries/charlotte/name/david-melton-obituary?id=57552782
@@ -69,7 +74,7 @@ def already_scraped(obit_id):
 
 
 
-def check_url(url_tuple, sb):
+def check_url(url_tuple):
     """
     Check if url exists
     :param url_tuple: url and obit_id
@@ -81,7 +86,7 @@ def check_url(url_tuple, sb):
 
     TIMEOUT = 20
 
-    tries, reset_driver = 0, False
+    tries = 0
     current_title, current_errormsg, current_url = "", "0", ""
 
     while tries < 5:
@@ -91,25 +96,31 @@ def check_url(url_tuple, sb):
             #RInW4 div
             """
 
-
-            print(f"{threading.current_thread().ident}")
-            print(f"Getting URL: {url}")
-
-            # sb.activate_cdp_mode(url=url)
-            sb.get(url)
-            # sb.sleep(5)
-            if "just a moment" in sb.get_title().lower():
-                sb.uc_gui_click_captcha()
-                # sb.cdp.gui_click_element("#RInW4 div")
-                sb.sleep(5)
-            sb.cdp.wait_for_element_visible('/html/body/div[1]/div[1]', timeout=None)
-            page_source, current_title, current_url = sb.get_page_source(), sb.get_title(), sb.get_current_url()
+            with driver_pool.lease() as lease:
+                sb = lease.driver
+                print(f"{threading.current_thread().ident}")
+                print(f"Getting URL: {url}")
+
+                # sb.activate_cdp_mode(url=url)
+                sb.get(url)
+                # sb.sleep(5)
+                if "just a moment" in sb.get_title().lower():
+                    sb.uc_gui_click_captcha()
+                    # sb.cdp.gui_click_element("#RInW4 div")
+                    sb.sleep(5)
+                sb.cdp.wait_for_element_visible('/html/body/div[1]/div[1]', timeout=None)
+                page_source, current_title, current_url = sb.get_page_source(), sb.get_title(), sb.get_current_url()
+
+                if is_blocked_title(current_title):
+                    lease.reset()
+                    raise Exception("Access Denied")
+                if f"/a-obituary?id={obit_id}" in current_url and "just a moment" in current_title.lower():
+                    # a fresh browser replaces the old sb.reconnect()
+                    lease.reset()
+                    raise Exception("cloudflare")
 
             if "502" in current_title and "bad gateway" in current_title.lower():
                 raise Exception("502: bad gateway")
-            if f"/a-obituary?id={obit_id}" in current_url and "just a moment" in sb.get_title().lower():
-
-                raise Exception("cloudflare")
             if f"/a-obituary?id={obit_id}" in current_url:
                 raise Exception("no redirect")
             elif not "obituaries/search?firstName=a&lastName=obituary" in current_url:
@@ -139,17 +150,9 @@ def check_url(url_tuple, sb):
             current_errormsg = str(e)
             if "Message: invalid session id" not in current_errormsg:  # "invalid session id" error is fixed with a driver reset
                 tqdm.write(f"{obit_id} {current_errormsg}")
-            if "cloudflare" in current_errormsg:
-                sb.reconnect(timeout=10)
-            # thread_local = threading.local()
-            # driver = getattr(thread_local, 'driver', None)
-            # if driver is not None:
-            #     driver.quit()
-            # setattr(thread_local, 'driver', None)
             sleep(5)
         finally:
             tries += 1
-            reset_driver = True
     print(f"{obit_id} returning none")
     return {
         "id": str(obit_id),
@@ -161,22 +164,17 @@ def check_url(url_tuple, sb):
 
 
 def main():
+    global driver_pool
     print(initialize_collection(collection))
     all_ids_logged = []
-
-
+    driver_pool = DriverPool(threads, max_pages=args.maxpages,
+                             driver_factory=make_sb_factory(start_url="https://www.example.com", uc=True, test=True,
+                                                            page_load_strategy='eager', do_not_track=True,
+                                                            incognito=True))
 
     round = 0
-    while True:
-        # thread_sb =
-        with SB(uc=True, test=True, page_load_strategy='eager', do_not_track=True, incognito=True) as sb:
-            url = "https://www.example.com"
-            print()
-            print(f"Getting URL: {url}")
-
-            sb.activate_cdp_mode(url=url)
-            sb.sleep(2)
-
+    try:
+        while True:
             all_ids = random.sample(range(begin_index, end_index), sample_size)
 
             with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_queries.json"), "w") as f:
@@ -185,7 +183,7 @@ def main():
                 with ThreadPoolExecutor(max_workers=threads) as executor:
 
                     results = []
-                    futures = [executor.submit(check_url, (build_url(generated_id), generated_id), sb) for
+                    futures = [executor.submit(check_url, (build_url(generated_id), generated_id)) for
                                generated_id in all_ids]
 
                     for future in as_completed(futures):
@@ -195,13 +193,14 @@ def main():
                             # tqdm.write("{:b}".format(int(future.result()["id"])).zfill(64))
                         results.append(future.result())
                         pbar.update(1)
-        with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_hits.json"), "w") as f:
-            json.dump(results, f)
-
-        with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_ids.json"), "w") as f:
-            json.dump(all_ids_logged, f)
-        round += 1
-
+            with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_hits.json"), "w") as f:
+                json.dump(results, f)
+
+            with open(os.path.join(ROOT_DIR, "collections", collection, "queries", f"{current_time}_{sample_size}_{round}_ids.json"), "w") as f:
+                json.dump(all_ids_logged, f)
+            round += 1
+    finally:
+        driver_pool.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -13,19 +13,23 @@ Usage:
 
 import argparse
 import os
+import sys
 import logging
 
 import numpy as np
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from obittools.parquet_store import read_obit_table
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Embed obituary texts with a BERT-like model')
-    parser.add_argument('--data', default='obit_data.csv', help='Path to CSV data file')
+    parser.add_argument('--data', default='obit_data.csv', help='Path to CSV data file or parquet dataset')
     parser.add_argument('--text-col', default='text', help='Column containing obituary text')
     parser.add_argument('--model', default='sentence-transformers/all-MiniLM-L6-v2',
                         help='sentence-transformers model name or path')
@@ -42,7 +46,7 @@ def main():
     os.makedirs(os.path.dirname(args.ids_output) or '.', exist_ok=True)
 
     logger.info(f"Loading data from {args.data}")
-    df = pd.read_csv(args.data, low_memory=False)
+    df = read_obit_table(args.data, columns=['id', args.text_col])
     df = df.dropna(subset=[args.text_col])
     df = df[df[args.text_col].str.strip().astype(bool)].reset_index(drop=True)
     logger.info(f"Loaded {len(df)} documents with non-empty text")
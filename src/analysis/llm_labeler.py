@@ -10,59 +10,337 @@ Extracts four structured fields from each obituary:
 Outputs a CSV with the original data columns plus the four new label columns.
 Supports --resume to skip already-processed rows, and --sample for quick tests.
 
+birth_year and death_year are first read with the regex rules in obittools.rule_labels; the model is
+only asked for the fields the rules could not resolve, and rows with nothing left to ask skip the
+model entirely (--no-rules sends every field to the model; --fields limits which fields are labeled).
+
+Generation stops at the closing </output> tag. With --constrained the answer is prefilled with <output> and
+every token is restricted to the label JSON (obittools.json_grammar): fixed keys, 4-digit years or null, short
+strings or null, so each response parses and no tokens go to explanations.
+
 Usage:
     python src/analysis/llm_labeler.py --sample 10
     python src/analysis/llm_labeler.py --model Qwen/Qwen2.5-1.5B-Instruct --resume
     python src/analysis/llm_labeler.py --data obit_data.csv --output output/llm_labels.csv
+    python src/analysis/llm_labeler.py --fields birth_year death_year
+    python src/analysis/llm_labeler.py --batch-size 16 --threads 32
+    python src/analysis/llm_labeler.py --prefix-cache
+    python src/analysis/llm_labeler.py --constrained
 """
 
 import argparse
+import copy
 import json
 import logging
 import os
 import re
 import sys
+import time
 
 import pandas as pd
 from tqdm import tqdm
-from transformers import pipeline
+import torch
+from transformers import DynamicCache, LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList, pipeline
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from obittools.json_grammar import DONE, END_TAG, STRING, YEAR, LabelGrammar, TokenMasks, is_string_content
+from obittools.parquet_store import read_obit_table
+from obittools.rule_labels import RULE_FIELDS, RESOLVED_CONFIDENCE, extract_rule_labels_frame, is_resolved
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger(__name__)
 
 LABEL_FIELDS = ['birth_year', 'death_year', 'cause_of_death', 'occupation']
 
-PROMPT_TEMPLATE = """You are analyzing an obituary to extract specific information.
+FIELD_INSTRUCTIONS = {
+    'birth_year': 'The 4-digit year the person was born. Use null if not stated.',
+    'death_year': 'The 4-digit year the person died. Use null if not stated.',
+    'cause_of_death': 'The cause of death as described in the obituary itself---quote directly and limit to a short phrase or a word. Use null if not stated.',
+    'occupation': "The person's primary occupation or profession. Use null if not stated.",
+}
+FIELD_KINDS = {'birth_year': YEAR, 'death_year': YEAR, 'cause_of_death': STRING, 'occupation': STRING}
+EXAMPLE_LABELS = {"birth_year": 1942, "death_year": 2021, "cause_of_death": "cancer", "occupation": "teacher"}
 
-<obituary>
-{text}
-</obituary>
+# the instructions come first and the obituary last, so every prompt for the same fields starts with an identical
+# prefix whose key/value cache can be computed once and reused (--prefix-cache)
+PROMPT_PREFIX_TEMPLATE = """You are analyzing an obituary to extract specific information.
 
 Extract the following fields:
-1. birth_year: The 4-digit year the person was born. Use null if not stated.
-2. death_year: The 4-digit year the person died. Use null if not stated.
-3. cause_of_death: The cause of death as described in the obituary itself---quote directly and limit to a short phrase or a word. Use null if not stated.
-4. occupation: The person's primary occupation or profession. Use null if not stated.
+{field_list}
 
 Respond ONLY with a JSON object inside <output> tags. Example:
 <output>
-{{"birth_year": 1942, "death_year": 2021, "cause_of_death": "cancer", "occupation": "teacher"}}
+{example}
 </output>
 
-Do not include any explanation outside the <output> tags."""
+Do not include any explanation outside the <output> tags.
+
+<obituary>
+"""
+PROMPT_SUFFIX_TEMPLATE = """{text}
+</obituary>
+"""
+PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + PROMPT_SUFFIX_TEMPLATE
+
+# --constrained starts the answer for the model, so generation begins at the JSON object
+OUTPUT_PREFILL = '<output>\n'
 
-EMPTY_LABELS = {f: None for f in LABEL_FIELDS}
 
+def build_prompt_prefix(fields=LABEL_FIELDS):
+    field_list = '\n'.join(f'{i}. {f}: {FIELD_INSTRUCTIONS[f]}' for i, f in enumerate(fields, start=1))
+    example = json.dumps({f: EXAMPLE_LABELS[f] for f in fields})
+    return PROMPT_PREFIX_TEMPLATE.format(field_list=field_list, example=example)
 
-def parse_response(response_text):
-    match = re.search(r'<output>\s*(\{.*?\})\s*</output>', response_text, re.DOTALL)
+
+def build_prompt(text, fields=LABEL_FIELDS, prefill=''):
+    return build_prompt_prefix(fields) + PROMPT_SUFFIX_TEMPLATE.format(text=text) + prefill
+
+
+def parse_output(response_text):
+    """
+    :return: the JSON object inside <output> tags, or None if there is no parsable one
+    """
+    match = re.search(r'<output>\s*(\{.*?\})\s*</output>', response_text or '', re.DOTALL)
     if not match:
-        return dict(EMPTY_LABELS)
+        return None
     try:
         parsed = json.loads(match.group(1))
-        return {f: parsed.get(f) for f in LABEL_FIELDS}
     except json.JSONDecodeError:
-        return dict(EMPTY_LABELS)
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def length_buckets(lengths, batch_size):
+    """
+    :param lengths: prompt length in tokens, by position
+    :return: list of batches of positions, shortest prompts first, so each batch pads to similar lengths
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class StopOnTag(StoppingCriteria):
+    """
+    Stops each row once its generated text contains the closing </output> tag; the prompt's own example tag is
+    never looked at. Holds the prompt length of one generate() call, so make a new one per call.
+    """
+
+    def __init__(self, tokenizer, tag=END_TAG, lookback=8):
+        self.tokenizer = tokenizer
+        self.tag = tag
+        self.lookback = lookback
+        self.prompt_length = None
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1] - 1
+        tails = self.tokenizer.batch_decode(input_ids[:, max(self.prompt_length, input_ids.shape[1] - self.lookback):])
+        return torch.tensor([self.tag in tail for tail in tails], dtype=torch.bool, device=input_ids.device)
+
+
+class JsonLabelsProcessor(LogitsProcessor):
+    """
+    Masks every token that would leave the row's LabelGrammar, so the output is always the label JSON followed by
+    </output>. Strings are closed after max_string_tokens tokens. One instance per generate() call.
+    """
+
+    def __init__(self, decoding, grammars):
+        self.decoding = decoding
+        self.grammars = grammars
+        self.states = [grammar.start for grammar in grammars]
+        self.string_tokens = [0] * len(grammars)
+        self.started = False
+
+    def __call__(self, input_ids, scores):
+        if self.started:
+            for row, token in enumerate(input_ids[:, -1].tolist()):
+                if self.states[row] not in (None, DONE):
+                    self.states[row] = self.grammars[row].run(self.states[row], self.decoding.masks.vocab[token])
+                self.string_tokens[row] = self.string_tokens[row] + 1 if is_string_content(self.states[row]) else 0
+        self.started = True
+        mask = torch.full_like(scores, float('-inf'))
+        for row, (grammar, state) in enumerate(zip(self.grammars, self.states)):
+            close = self.string_tokens[row] >= self.decoding.max_string_tokens
+            mask[row, self.decoding.allowed(grammar, state, close, scores.device)] = 0
+        return scores + mask
+
+
+class OutputDecoding:
+    """
+    Per-call generate() arguments: stop every row at </output> and, with constrained=True, keep the output inside
+    the label schema (obittools.json_grammar) with generation starting after OUTPUT_PREFILL.
+    """
+
+    def __init__(self, tokenizer, constrained=False, max_string_tokens=32):
+        if constrained and tokenizer.eos_token_id is None:
+            # a finished (or stuck) row can only emit eos, so constrained decoding has no way to end without one
+            raise ValueError("--constrained needs a tokenizer with an eos token")
+        self.tokenizer = tokenizer
+        self.constrained = constrained
+        self.max_string_tokens = max_string_tokens
+        self.prefill = OUTPUT_PREFILL if constrained else ''
+        self.masks = TokenMasks(self._vocab(), tokenizer.all_special_ids) if constrained else None
+        self.grammars = {}
+        self.tensors = {}
+
+    def _vocab(self):
+        # decode each token after a fixed one, so tokenizers that drop a leading space on their own keep it
+        reference = self.tokenizer('"', add_special_tokens=False)['input_ids']
+        offset = len(self.tokenizer.decode(reference, clean_up_tokenization_spaces=False))
+        texts = self.tokenizer.batch_decode([reference + [i] for i in range(len(self.tokenizer))],
+                                            clean_up_tokenization_spaces=False)
+        return [text[offset:] for text in texts]
+
+    def grammar(self, fields):
+        key = tuple(fields)
+        if key not in self.grammars:
+            self.grammars[key] = LabelGrammar(fields, [FIELD_KINDS[f] for f in fields])
+        return self.grammars[key]
+
+    def allowed(self, grammar, state, close, device):
+        """
+        :return: tensor of allowed token ids; only eos once the output is complete (or if it somehow left the grammar)
+        """
+        key = (grammar.key, state, close)
+        if key not in self.tensors:
+            ids = self.masks.allowed(grammar, state, close) if state is not None else []
+            self.tensors[key] = torch.tensor(ids or [self.tokenizer.eos_token_id], dtype=torch.long, device=device)
+        return self.tensors[key]
+
+    def generate_kwargs(self, fields_per_row):
+        """
+        :param fields_per_row: fields asked for in each prompt of the call
+        """
+        kwargs = {'stopping_criteria': StoppingCriteriaList([StopOnTag(self.tokenizer)])}
+        if self.constrained:
+            grammars = [self.grammar(fields) for fields in fields_per_row]
+            kwargs['logits_processor'] = LogitsProcessorList([JsonLabelsProcessor(self, grammars)])
+            kwargs['max_new_tokens'] = max(grammar.max_tokens(self.max_string_tokens) for grammar in grammars)
+        return kwargs
+
+
+def generate_batched(pipe, prompts, gen_kwargs, batch_size=8, decoding=None, fields=None):
+    """
+    run prompts through a text-generation pipeline in length-sorted batches
+    :param decoding: optional OutputDecoding, with the fields asked for in each prompt
+    :return: (generated texts in prompt order, None where a batch failed; prompt tokens; generated tokens)
+    """
+    tokenizer = pipe.tokenizer
+    lengths = [len(ids) for ids in tokenizer(prompts)['input_ids']]
+    generated = [None] * len(prompts)
+    for batch in length_buckets(lengths, batch_size):
+        kwargs = dict(gen_kwargs)
+        if decoding is not None:
+            kwargs.update(decoding.generate_kwargs([fields[j] for j in batch]))
+        try:
+            outputs = pipe([prompts[j] for j in batch], batch_size=len(batch), return_full_text=False, **kwargs)
+        except Exception as e:
+            logger.warning(f"Batch of {len(batch)} prompts failed: {e}")
+            continue
+        for j, output in zip(batch, outputs):
+            generated[j] = output[0]['generated_text']
+    texts = [g for g in generated if g]
+    n_generated = sum(len(ids) for ids in tokenizer(texts, add_special_tokens=False)['input_ids']) if texts else 0
+    return generated, sum(lengths), n_generated
+
+
+class PrefixCache:
+    """
+    Prefills the shared instruction prefix once per field set and reuses its key/value cache for every row.
+
+    Rows with the same fields are generated in length-sorted batches: the prefix cache is copied and repeated
+    across the batch (generate() extends the cache it is given), and only the left-padded obituaries and closing
+    tags are run through the model. Needs a model that returns a DynamicCache.
+    """
+
+    def __init__(self, model, tokenizer, prefill=''):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefill = prefill
+        self.prefixes = {}
+        # checked once here: older transformers versions return tuples, which cannot be copied and extended per batch
+        probe_ids = self.tokenizer('<obituary>', add_special_tokens=False, return_tensors='pt')['input_ids']
+        with torch.no_grad():
+            cache = self.model(input_ids=probe_ids.to(self.model.device), use_cache=True).past_key_values
+        if not isinstance(cache, DynamicCache):
+            raise TypeError(f"--prefix-cache needs a model returning a DynamicCache, got {type(cache).__name__}; "
+                            f"upgrade transformers or run without --prefix-cache")
+
+    def prefix(self, fields):
+        """
+        :return: (prefix input ids, key/value cache of the prefix) for this field set
+        """
+        key = tuple(fields)
+        if key not in self.prefixes:
+            prefix_ids = self.tokenizer(build_prompt_prefix(fields), return_tensors='pt')['input_ids'].to(self.model.device)
+            with torch.no_grad():
+                cache = self.model(input_ids=prefix_ids, use_cache=True).past_key_values
+            self.prefixes[key] = (prefix_ids, cache)
+        return self.prefixes[key]
+
+    def suffix_ids(self, text):
+        return self.tokenizer(PROMPT_SUFFIX_TEMPLATE.format(text=text) + self.prefill, add_special_tokens=False)['input_ids']
+
+    def input_ids(self, text, fields):
+        """
+        prefix and suffix are tokenized separately and concatenated, so the prefix tokens always match the cache
+        """
+        prefix_ids, cache = self.prefix(fields)
+        suffix_ids = torch.tensor([self.suffix_ids(text)], dtype=torch.long, device=self.model.device)
+        return torch.cat([prefix_ids, suffix_ids], dim=1), cache
+
+    def generate_batch(self, suffixes, fields, gen_kwargs, decoding=None):
+        """
+        :param suffixes: token ids of each row's obituary and closing tag (see suffix_ids)
+        :param decoding: optional OutputDecoding
+        :return: (generated texts, generated tokens)
+        """
+        prefix_ids, cache = self.prefix(fields)
+        width = max(len(ids) for ids in suffixes)
+        pad_id = self.tokenizer.pad_token_id
+        # left padding goes between the prefix and each suffix; the attention mask hides it and generate()
+        # derives position ids from the mask
+        padded = [[pad_id] * (width - len(ids)) + ids for ids in suffixes]
+        suffix_mask = [[0] * (width - len(ids)) + [1] * len(ids) for ids in suffixes]
+        batch_size = len(suffixes)
+        input_ids = torch.cat([prefix_ids.expand(batch_size, -1),
+                               torch.tensor(padded, dtype=torch.long, device=self.model.device)], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(batch_size, -1),
+                                    torch.tensor(suffix_mask, dtype=torch.long, device=self.model.device)], dim=1)
+        batch_cache = copy.deepcopy(cache)
+        batch_cache.batch_repeat_interleave(batch_size)
+        if decoding is not None:
+            gen_kwargs = {**gen_kwargs, **decoding.generate_kwargs([fields] * batch_size)}
+        with torch.no_grad():
+            output = self.model.generate(input_ids=input_ids, attention_mask=attention_mask, past_key_values=batch_cache,
+                                         pad_token_id=pad_id, **gen_kwargs)
+        new_tokens = output[:, input_ids.shape[1]:]
+        texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        return texts, int((new_tokens != pad_id).sum())
+
+    def generate_all(self, inputs, gen_kwargs, decoding=None, batch_size=8):
+        """
+        :param inputs: list of (text, fields)
+        :return: same as generate_batched; prompt tokens only count the uncached suffixes
+        """
+        generated = [None] * len(inputs)
+        suffixes = [self.suffix_ids(text) for text, _ in inputs]
+        positions_by_fields = {}
+        for position, (_, fields) in enumerate(inputs):
+            positions_by_fields.setdefault(tuple(fields), []).append(position)
+        n_generated = 0
+        for fields, positions in positions_by_fields.items():
+            for batch in length_buckets([len(suffixes[j]) for j in positions], batch_size):
+                rows = [positions[j] for j in batch]
+                try:
+                    texts, n_new = self.generate_batch([suffixes[j] for j in rows], list(fields), gen_kwargs, decoding)
+                except Exception as e:
+                    logger.warning(f"Prefix-cached batch of {len(rows)} prompts failed: {e}")
+                    continue
+                for j, text in zip(rows, texts):
+                    generated[j] = text
+                n_generated += n_new
+        return generated, sum(len(ids) for ids in suffixes), n_generated
 
 
 def truncate_text(text, max_chars=2000):
@@ -72,7 +350,7 @@ def truncate_text(text, max_chars=2000):
 
 def main():
     parser = argparse.ArgumentParser(description='Label obituary variables with a local LLM')
-    parser.add_argument('--data', default='obit_data.csv', help='Path to input CSV')
+    parser.add_argument('--data', default='obit_data.csv', help='Path to input CSV or parquet dataset')
     parser.add_argument('--output', default='output/llm_labels.csv', help='Path to output CSV')
     parser.add_argument('--model', default='Qwen/Qwen2.5-1.5B-Instruct',
                         help='HuggingFace model name or local path')
@@ -82,19 +360,37 @@ def main():
                         help='Skip rows whose id already appears in --output')
     parser.add_argument('--text-col', default='text', help='Column containing obituary text')
     parser.add_argument('--max-new-tokens', type=int, default=200,
-                        help='Max tokens to generate per response')
+                        help='Max tokens to generate per response (--constrained sets its own bound per field set)')
+    parser.add_argument('--fields', nargs='+', choices=LABEL_FIELDS, default=LABEL_FIELDS,
+                        help='Fields to label')
+    parser.add_argument('--no-rules', action='store_true',
+                        help='Ask the model for every field instead of resolving dates with regex rules first')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='Prompts per generate call; prompts are sorted by length before batching')
+    parser.add_argument('--bucket-window', type=int, default=256,
+                        help='Rows sorted into length buckets together (and written out) at a time')
+    parser.add_argument('--prefix-cache', action='store_true',
+                        help='Reuse the key/value cache of the shared instruction prefix across rows, still in batches of '
+                             '--batch-size; pays off when the instructions are long next to the obituaries '
+                             '(compare with src/scripts/benchmark_prefix_cache.py on your hardware)')
+    parser.add_argument('--constrained', action='store_true',
+                        help='Start the answer at <output> and restrict generation to the label JSON schema')
+    parser.add_argument('--max-string-tokens', type=int, default=32,
+                        help='With --constrained, close cause_of_death/occupation strings after this many tokens')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Torch CPU threads (defaults to torch\'s choice)')
     args = parser.parse_args()
 
     os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
 
     logger.info(f"Loading data from {args.data}")
-    df = pd.read_csv(args.data, low_memory=False)
+    df = read_obit_table(args.data)
     df = df.dropna(subset=[args.text_col])
     df = df[df[args.text_col].str.strip().astype(bool)].reset_index(drop=True)
     logger.info(f"Loaded {len(df)} rows with non-empty text")
 
     if args.resume and os.path.exists(args.output):
-        existing = pd.read_csv(args.output, low_memory=False)
+        existing = read_obit_table(args.output, columns=['id'])
         done_ids = set(existing['id'].astype(str))
         df = df[~df['id'].astype(str).isin(done_ids)].reset_index(drop=True)
         logger.info(f"Resuming: {len(done_ids)} already done, {len(df)} remaining")
@@ -103,6 +399,18 @@ def main():
         df = df.sample(n=min(args.sample, len(df)), random_state=42).reset_index(drop=True)
         logger.info(f"Sampled {len(df)} rows")
 
+    fields = [f for f in LABEL_FIELDS if f in args.fields]
+    if args.no_rules:
+        rule_labels = None
+    else:
+        rule_labels = extract_rule_labels_frame(df, text_col=args.text_col)
+        for f in fields:
+            if f in RULE_FIELDS:
+                resolved = rule_labels[f'{f}_confidence'].isin(RESOLVED_CONFIDENCE).sum()
+                logger.info(f"Rules resolved {f} for {resolved}/{len(df)} rows")
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
     logger.info(f"Loading model: {args.model}")
     pipe = pipeline(
         'text-generation',
@@ -110,6 +418,13 @@ def main():
         device_map='auto',
         trust_remote_code=True,
     )
+    # batched generation with a decoder-only model needs left padding and a pad token
+    pipe.tokenizer.padding_side = 'left'
+    if pipe.tokenizer.pad_token is None:
+        pipe.tokenizer.pad_token = pipe.tokenizer.eos_token
+    # every row stops at </output>; --constrained also masks tokens outside the label schema
+    decoding = OutputDecoding(pipe.tokenizer, constrained=args.constrained, max_string_tokens=args.max_string_tokens)
+    prefix_cache = PrefixCache(pipe.model, pipe.tokenizer, prefill=decoding.prefill) if args.prefix_cache else None
     # Disable sampling for deterministic extraction
     gen_kwargs = dict(
         max_new_tokens=args.max_new_tokens,
@@ -118,48 +433,86 @@ def main():
         top_p=None,
     )
 
-    results = []
     write_mode = 'a' if (args.resume and os.path.exists(args.output)) else 'w'
     write_header = not (args.resume and os.path.exists(args.output))
-    BATCH_WRITE = 100
-
-    for i, (_, row) in enumerate(tqdm(df.iterrows(), total=len(df), desc='Labeling')):
-        text = truncate_text(str(row[args.text_col]))
-        prompt = PROMPT_TEMPLATE.format(text=text)
-
-        try:
-            out = pipe(prompt, **gen_kwargs)
-            generated = out[0]['generated_text']
-            # Strip the input prompt from the output (some models include it)
-            if generated.startswith(prompt):
-                generated = generated[len(prompt):]
-            labels = parse_response(generated)
-        except Exception as e:
-            logger.warning(f"Row {i} failed: {e}")
-            labels = dict(EMPTY_LABELS)
-
-        record = row.to_dict()
-        record.update(labels)
-        results.append(record)
-
-        if len(results) >= BATCH_WRITE:
-            chunk = pd.DataFrame(results)
-            chunk.to_csv(args.output, mode=write_mode, header=write_header, index=False)
-            write_mode = 'a'
-            write_header = False
-            results = []
-            logger.info(f"Wrote batch at row {i+1}")
 
-    if results:
-        chunk = pd.DataFrame(results)
-        chunk.to_csv(args.output, mode=write_mode, header=write_header, index=False)
+    model_calls, unparsed = 0, 0
+    total_prompt_tokens, total_generated_tokens, total_seconds = 0, 0, 0.0
+    progress = tqdm(total=len(df), desc='Labeling')
+    for start in range(0, len(df), args.bucket_window):
+        window = df.iloc[start:start + args.bucket_window]
+
+        resolved_by_row, prompts, prompt_inputs, prompt_rows = [], [], [], []
+        for pos, (idx, row) in enumerate(window.iterrows()):
+            resolved = {}
+            if rule_labels is not None:
+                rule_row = rule_labels.loc[idx]
+                resolved = {f: rule_row[f] for f in fields if f in RULE_FIELDS and is_resolved(rule_row, f)}
+            resolved_by_row.append(resolved)
+            model_fields = [f for f in fields if f not in resolved]
+            if model_fields:
+                text = truncate_text(str(row[args.text_col]))
+                prompts.append(build_prompt(text, model_fields, prefill=decoding.prefill))
+                prompt_inputs.append((text, model_fields))
+                prompt_rows.append((pos, model_fields))
+
+        generated = []
+        if prompts:
+            began = time.perf_counter()
+            if prefix_cache is not None:
+                generated, n_prompt_tokens, n_generated_tokens = prefix_cache.generate_all(
+                    prompt_inputs, gen_kwargs, decoding=decoding, batch_size=args.batch_size)
+            else:
+                generated, n_prompt_tokens, n_generated_tokens = generate_batched(
+                    pipe, prompts, gen_kwargs, batch_size=args.batch_size, decoding=decoding,
+                    fields=[model_fields for _, model_fields in prompt_rows])
+            seconds = time.perf_counter() - began
+            model_calls += len(prompts)
+            total_prompt_tokens += n_prompt_tokens
+            total_generated_tokens += n_generated_tokens
+            total_seconds += seconds
+            logger.info(f"Rows {start}-{start + len(window)}: {len(prompts)} prompts, "
+                        f"{n_prompt_tokens / seconds:.0f} prompt tokens/s, {n_generated_tokens / seconds:.1f} generated tokens/s, "
+                        f"{n_generated_tokens / len(prompts):.1f} generated tokens/row")
+
+        # back in the original row order
+        labels_by_row = [dict() for _ in range(len(window))]
+        for (pos, model_fields), text in zip(prompt_rows, generated):
+            # the prefilled <output> tag is part of the prompt, not the generated text
+            parsed = parse_output(decoding.prefill + text) if text else None
+            if parsed is None:
+                unparsed += 1
+                parsed = {}
+            labels_by_row[pos] = {f: parsed.get(f) for f in model_fields}
+        results = []
+        for (_, row), labels, resolved in zip(window.iterrows(), labels_by_row, resolved_by_row):
+            labels.update(resolved)
+            record = row.to_dict()
+            # fixed column order: every window is appended under the first window's header
+            record.update({f: labels.get(f) for f in fields})
+            record['rule_fields'] = ','.join(f for f in fields if f in resolved)
+            results.append(record)
+
+        pd.DataFrame(results).to_csv(args.output, mode=write_mode, header=write_header, index=False)
+        write_mode = 'a'
+        write_header = False
+        progress.update(len(window))
+    progress.close()
 
     logger.info(f"Done. Output saved to {args.output}")
+    logger.info(f"Model calls: {model_calls} for {len(df)} rows ({len(df) - model_calls} fully resolved by rules), "
+                f"{unparsed} responses without parsable <output> JSON")
+    if model_calls:
+        logger.info(f"Generated tokens per model row: {total_generated_tokens / model_calls:.1f}")
+    if total_seconds:
+        logger.info(f"Throughput: {total_prompt_tokens / total_seconds:.0f} prompt tokens/s, "
+                    f"{total_generated_tokens / total_seconds:.1f} generated tokens/s, "
+                    f"{model_calls / total_seconds:.2f} rows/s")
 
     # Print a quick preview of extracted labels
-    final = pd.read_csv(args.output, low_memory=False)
+    final = read_obit_table(args.output, columns=['id'] + fields)
     print(f"\nLabeled {len(final)} rows. Sample output:")
-    print(final[['id'] + LABEL_FIELDS].head(5).to_string(index=False))
+    print(final[['id'] + fields].head(5).to_string(index=False))
 
 
 if __name__ == '__main__':
@@ -25,7 +25,9 @@ from nltk.lm.preprocessing import padded_everygram_pipeline
 from sklearn.feature_extraction.text import CountVectorizer
 
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 from processing.log_odds import find_distinctive_words
+from obittools.parquet_store import read_obit_table
 
 nltk.download('punkt', quiet=True)
 nltk.download('punkt_tab', quiet=True)
@@ -65,7 +67,7 @@ def top_k_ngrams(texts, n, k):
 
 def main():
     parser = argparse.ArgumentParser(description='N-gram LM analysis per categorical column')
-    parser.add_argument('--data', default='obit_data.csv', help='Path to CSV data file')
+    parser.add_argument('--data', default='obit_data.csv', help='Path to CSV data file or parquet dataset')
     parser.add_argument('--column', required=True, help='Categorical column to split by')
     parser.add_argument('--text-col', default='text', help='Column containing obituary text')
     parser.add_argument('--n', type=int, default=2, help='N-gram order')
@@ -77,7 +79,7 @@ def main():
     os.makedirs(args.output_dir, exist_ok=True)
 
     logger.info(f"Loading data from {args.data}")
-    df = pd.read_csv(args.data, low_memory=False)
+    df = read_obit_table(args.data, columns=['id', args.text_col, args.column])
     df = df.dropna(subset=[args.text_col, args.column])
     df = df[df[args.text_col].str.strip().astype(bool)]
 
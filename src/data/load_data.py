@@ -0,0 +1,55 @@
+import os
+import json
+import pandas as pd
+from tqdm import tqdm
+
+from obittools.segments import default_store_dir, has_segment_store, load_index, load_segments_to_dataframe
+
+
+DATA_DIR = "/home/laviniad/projects/obits/data/obit_jsons"
+
+
+def load_jsons_to_dataframe(data_dir=DATA_DIR, columns=None, ids=None):
+    """
+    Load the per-obituary json records written by scrape_obits_from_kevin_xml.process_url.
+
+    Reads the compacted segment store in <data_dir>/segments when one exists (see obits-compact), plus any
+    <id>.json written since the last compaction; otherwise opens every <id>.json file in data_dir.
+
+    Args:
+        data_dir (str): Directory of <id>.json files
+        columns (list, optional): Only keep these keys of each record
+        ids (iterable, optional): Only load these obituary ids
+
+    Returns:
+        pd.DataFrame: One row per obituary
+    """
+    store_dir = default_store_dir(data_dir)
+    if has_segment_store(store_dir):
+        indexed = set(load_index(store_dir))
+        compacted = load_segments_to_dataframe(store_dir, columns=columns, ids=ids)
+        loose_files = [f for f in list_json_files(data_dir, ids) if f[:-5] not in indexed]
+        if not loose_files:
+            return compacted
+        print(f"Reading {len(loose_files)} json files not yet in {store_dir}; run obits-compact {data_dir} to add them")
+        return pd.concat([compacted, load_json_files(data_dir, loose_files, columns)], ignore_index=True)
+
+    return load_json_files(data_dir, list_json_files(data_dir, ids), columns)
+
+
+def list_json_files(data_dir, ids=None):
+    if ids is not None:
+        json_files = [f"{i}.json" for i in ids]
+        return [f for f in json_files if os.path.exists(os.path.join(data_dir, f))]
+    return [f for f in os.listdir(data_dir) if f.endswith('.json')]
+
+
+def load_json_files(data_dir, json_files, columns=None):
+    records = []
+    for json_file in tqdm(json_files):
+        with open(os.path.join(data_dir, json_file), 'r') as f:
+            record = json.load(f)
+        if columns is not None:
+            record = {column: record.get(column) for column in columns}
+        records.append(record)
+    return pd.DataFrame(records, columns=columns)
@@ -1,21 +1,59 @@
-from time import sleep
-from seleniumbase import Driver
+import os
+import sys
+import json
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from obittools.driver_pool import DriverPool
+from obittools.fetch import TieredFetcher
+from src.scraping.scrape_manifest import ScrapeManifest, MANIFEST_FILE_NAME
+from obittools.sitemaps import SitemapUrlStore, crawl_sitemaps, sitemap_urls, SITEMAP_COUNT
+
+
+def wait_for_sitemap(driver):
+    driver.wait_for_element_visible("#folder0")
 
 
 def main():
-    urls = [f"http://www.legacy.com/us/memorials-sitemap-{generated_id}.xml" for generated_id in list(range(20, 0, -1))]
-    for url in urls:
-        print(url)
-        driver = Driver(uc=True, incognito=True)  # , headless=True)
-        driver.get(url)
-        driver.wait_for_element_visible("#folder0")
-        page_source, current_title, current_url = driver.page_source, driver.title, driver.current_url
-        print(f"{current_title} {current_url}")
-        with open(url.split("/")[-1], "w") as f:
-            f.write(page_source)
-        driver.quit()
-        sleep(5)
+    parser = argparse.ArgumentParser(description="Fetch legacy.com memorial sitemaps into a deduplicated url store")
+    parser.add_argument("-n", "--count", type=int, default=SITEMAP_COUNT, help="number of sitemap shards")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="shards fetched concurrently")
+    parser.add_argument("--db", default="sitemap_urls.sqlite", help="sqlite url store to update")
+    parser.add_argument("--baseline", default=None,
+                        help="all_urls.json from an earlier full scrape; its urls are recorded as already synced")
+    parser.add_argument("--delta", default=None,
+                        help="write only new or changed urls (by lastmod) since the last sync to this work queue "
+                             "for parallel_obit_scraper")
+    parser.add_argument("--commit", default=None, metavar="OUT_DIR",
+                        help="output directory of a finished scrape_obits_from_kevin_xml run; the urls its manifest "
+                             "records as scraped are marked synced before the delta is computed")
+    parser.add_argument("--raw-dir", default=".", help="directory to keep the raw shards in (empty string to skip)")
+    parser.add_argument("--browseronly", action="store_true", help="skip plain http and load shards in the browser")
+    args = parser.parse_args()
 
+    driver_pool = DriverPool(args.workers, launch_jitter=5, uc=True, incognito=True)
+    fetcher = TieredFetcher(driver_pool, pool_size=args.workers, timeout=120, use_http=not args.browseronly,
+                            browser_wait=wait_for_sitemap)
+    try:
+        with SitemapUrlStore(args.db) as store:
+            if args.baseline is not None:
+                with open(args.baseline, "r") as f:
+                    print(f"Seeded {store.seed_synced(json.load(f))} synced urls from {args.baseline}")
+            if args.commit is not None:
+                manifest = ScrapeManifest(os.path.join(args.commit, MANIFEST_FILE_NAME))
+                print(f"Marked {store.commit_scraped(manifest.scraped_lastmods())} scraped urls from {args.commit} as synced")
+                manifest.close()
+            results = crawl_sitemaps(sitemap_urls(args.count), store, fetcher, workers=args.workers,
+                                     raw_dir=args.raw_dir or None)
+            print(f"{store.count()} distinct obituary urls in {args.db}")
+            if args.delta is not None:
+                print(f"Wrote {store.export_delta(args.delta)} new or changed urls to {args.delta}")
+    finally:
+        driver_pool.close()
+    print(json.dumps(fetcher.report()))
+    failed = [url for url, outcome in results.items() if isinstance(outcome, str)]
+    if failed:
+        print(f"{len(failed)} shards failed: {failed}")
 
 
 if __name__ == "__main__":
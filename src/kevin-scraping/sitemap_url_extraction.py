@@ -1,43 +1,55 @@
+import os
+import sys
 import json
-import collections
-from bs4 import BeautifulSoup
-
-all_urls = []
-
-regex
-
-
-for i in range(1, 21):
-    print(i)
-    print(len(all_urls))
-    with open(f"memorials-sitemap-{i}.xml", "rb") as f:
-        soup = BeautifulSoup(f, features="html")
-    elements = soup.find_all("url")
-    for element in elements:
-        all_urls.append({
-            "url": element.find_all("loc")[0].get_text().replace("-memorial?id=", "-obituary?id="),
-            "timestamp": element.find_all("lastmod")[0].get_text()
-        })
-
-with open("all_urls.json", "w") as f:
-    json.dump(all_urls, f, indent=4)\
-
-only_urls = [all_url["url"] for all_url in all_urls]
-print([item for item, count in collections.Counter(only_urls).items() if count > 1])
-print(len(only_urls))
-only_urls = list(set(only_urls))
-print(len(only_urls))
-
-with open("only_urls.json", "w") as f:
-    json.dump(only_urls, f, indent=4)
-
-"""
-delete
-\u201c
-\u201d
-
-\u00a0\u00a0 - replace with dash
-
-
-
-"""
+import argparse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.scraping.scrape_manifest import ScrapeManifest, MANIFEST_FILE_NAME
+from obittools.sitemaps import SitemapUrlStore, iter_sitemap_entries, iter_file_chunks, SITEMAP_COUNT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract obituary urls from saved sitemap shards")
+    parser.add_argument("files", nargs="*",
+                        help="saved sitemap files (defaults to memorials-sitemap-{1..20}.xml in the current directory)")
+    parser.add_argument("--db", default="sitemap_urls.sqlite", help="sqlite url store to update")
+    parser.add_argument("--baseline", default=None,
+                        help="all_urls.json from an earlier full scrape; its urls are recorded as already synced")
+    parser.add_argument("--delta", default=None,
+                        help="write only new or changed urls (by lastmod) since the last sync to this work queue "
+                             "for parallel_obit_scraper")
+    parser.add_argument("--commit", default=None, metavar="OUT_DIR",
+                        help="output directory of a finished scrape_obits_from_kevin_xml run; the urls its manifest "
+                             "records as scraped are marked synced before the delta is computed")
+    parser.add_argument("--all-urls", default="all_urls.json", help="output list of {url, timestamp} records")
+    parser.add_argument("--only-urls", default="only_urls.json", help="output list of urls")
+    args = parser.parse_args()
+
+    files = args.files or [f"memorials-sitemap-{i}.xml" for i in range(1, SITEMAP_COUNT + 1)]
+    with SitemapUrlStore(args.db) as store:
+        if args.baseline is not None:
+            with open(args.baseline, "r") as f:
+                print(f"Seeded {store.seed_synced(json.load(f))} synced urls from {args.baseline}")
+        if args.commit is not None:
+            manifest = ScrapeManifest(os.path.join(args.commit, MANIFEST_FILE_NAME))
+            print(f"Marked {store.commit_scraped(manifest.scraped_lastmods())} scraped urls from {args.commit} as synced")
+            manifest.close()
+        for path in files:
+            batch, n_entries = [], 0
+            for entry in iter_sitemap_entries(iter_file_chunks(path)):
+                batch.append(entry)
+                if len(batch) >= 5000:
+                    n_entries += store.add_entries(batch, source=os.path.basename(path))
+                    batch = []
+            n_entries += store.add_entries(batch, source=os.path.basename(path))
+            print(f"{path}: {n_entries} entries, {store.count()} distinct urls so far")
+
+        # entries are deduplicated on obituary id as they are stored, so the exports contain each url once
+        store.export_json(args.all_urls, args.only_urls)
+        print(f"Wrote {store.count()} urls")
+        if args.delta is not None:
+            print(f"Wrote {store.export_delta(args.delta)} new or changed urls to {args.delta}")
+
+
+if __name__ == "__main__":
+    main()
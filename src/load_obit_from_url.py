@@ -3,22 +3,75 @@ from bs4 import BeautifulSoup
 
 import sys
 import os
+import atexit
 
 # experimenting with less aggressive method
 from time import sleep
 from seleniumbase import Driver
 
+from obittools.driver_pool import DriverPool
+from obittools.driver_config import DEFAULT_BLOCKED_CLASSES
+from obittools.extract_data import load_obit_text_and_metadata_from_html
+
 binary_location=os.getenv("CHROME_BINARY")
 print(f"Using Chromium binary location: {binary_location}")
 
-use_driver_to_find_elements = True
+# "snapshot": read page_source once and parse it offline (one driver call per page)
+# "driver": query each field with find_element(s) over the webdriver connection (about six round-trips plus .text calls)
+extraction_mode = "snapshot"
+
+# browser settings for obituary page loads, shared by the default pool and scraper worker processes
+DEFAULT_DRIVER_KWARGS = dict(uc=True, binary_location=binary_location, headless=True, incognito=True,
+                             block_resources=DEFAULT_BLOCKED_CLASSES)
+
+# per-process browser pool, started on first use so each worker process gets its own driver
+default_driver_pool = None
+
+
+def get_default_driver_pool():
+    global default_driver_pool
+    if default_driver_pool is None:
+        default_driver_pool = DriverPool(1, **DEFAULT_DRIVER_KWARGS)
+        atexit.register(default_driver_pool.close)
+    return default_driver_pool
+
+
+def close_default_driver_pool():
+    global default_driver_pool
+    if default_driver_pool is not None:
+        default_driver_pool.close()
+        default_driver_pool = None
+
+
+def load_obit_text_and_metadata(obit_url, DEBUG=False, driver_pool=None):
+    """
+    load an obituary page in a pooled browser and extract its text and funeral home metadata
+    :param driver_pool: DriverPool to lease the browser from (defaults to this process's pool)
+    :return: dict of obituary data, or None if the page could not be read
+    """
+    if driver_pool is None:
+        driver_pool = get_default_driver_pool()
+    with driver_pool.lease() as lease:
+        return extract_obit_text_and_metadata(lease.driver, obit_url, DEBUG=DEBUG)
+
+
+def fetch_obit_page_source(obit_url, DEBUG=False, driver_pool=None):
+    """
+    load an obituary page in a pooled browser without parsing it
+    :return: page_source once the obituary has rendered, or None
+    """
+    if driver_pool is None:
+        driver_pool = get_default_driver_pool()
+    with driver_pool.lease() as lease:
+        if not open_obit_page(lease.driver, obit_url, DEBUG=DEBUG):
+            return None
+        return lease.driver.page_source
 
 
-def load_obit_text_and_metadata(obit_url, DEBUG=False):
-    #print("Loading driver...")
-    #driver = Driver(uc=True, incognito=True)  # , headless=True)
-    driver = Driver(uc=True, binary_location=binary_location, headless=True, incognito=True)  # , headless=True)
-    #print("Loaded driver!")
+def open_obit_page(driver, obit_url, DEBUG=False):
+    """
+    :return: True once the page's #obituary element is there
+    """
     # get page
     #page = misc_utils.make_request(obit_url)
     driver.get(obit_url)
@@ -34,16 +87,37 @@ def load_obit_text_and_metadata(obit_url, DEBUG=False):
         if DEBUG:
             # save source to file
             with open('debug_page_source.html', 'w') as f:
-                f.write(page_source)
+                f.write(driver.page_source)
                 print("Saved debug page source to file: debug_page_source.html")
 
-        driver.quit()
+        return False
+    return True
+
+
+def obit_data_from_page_source(page_source, obit_url):
+    """
+    parse a rendered obituary page offline (no driver needed, so this can run in another process)
+    :return: dict of obituary data, or None if the page has no obituary text
+    """
+    obit_data = load_obit_text_and_metadata_from_html(page_source, rendered=True)
+    if obit_data is None:
+        print("No obituary text found")
+        print("URL: ", obit_url)
         return None
+    obit_data['id'] = int(obit_url.split('=')[-1])
+    obit_data['url'] = obit_url
+    return obit_data
 
-    page_source, _, _ = driver.page_source, driver.title, driver.current_url
-    obit_data = {}
 
-    if use_driver_to_find_elements:
+def extract_obit_text_and_metadata(driver, obit_url, DEBUG=False):
+    if not open_obit_page(driver, obit_url, DEBUG=DEBUG):
+        return None
+
+    if extraction_mode == "snapshot":
+        return obit_data_from_page_source(driver.page_source, obit_url)
+
+    obit_data = {}
+    if extraction_mode == "driver":
         try:
             # find element where 'data-component' = 'NameHeadingText'
             name_heading = driver.find_element("[data-component='NameHeadingText']")
@@ -79,50 +153,10 @@ def load_obit_text_and_metadata(obit_url, DEBUG=False):
         except Exception as e:
             print(f"Error finding elements: {e}")
             print("URL: ", obit_url)
-            driver.quit()
             return None
 
     else:
-        soup = BeautifulSoup(page_source, 'html.parser')
-    
-        # get features
-        name = soup.find('h2', {'data-component': 'NameHeadingText'})
-        if name:
-            name = name.text
-        else:
-            name = 'unknown'
-
-        # note that text is wrapped in <p> tags
-        text = soup.find('div', {'data-component': 'ObituaryText'})
-        if text: # first kind of page
-            text = text.text
-        else:
-            text = soup.find('div', {'data-component': 'ObituaryParagraph'})
-            if text:
-                text = text.text
-            else:
-                return None
-        
-        attribute_box = soup.find('div', {'data-component': 'AttributeValuesBox'})
-        funeral_home = 'unknown'
-        if not attribute_box:
-            e = soup.find('a', {'data-component': 'FuneralHomeDirectoryLink'})
-            if e:
-                funeral_home_link = e.text
-                funeral_location = soup.find('p', {'data-component': 'MemorialEventsFuneralHomeAddress'}).text
-            else:
-                funeral_home_link = 'unknown'
-                funeral_location = 'unknown'
-        else:
-            a_els = attribute_box.find_all('a')
-            if a_els:
-                funeral_home = attribute_box.find_all('a')[0].text
-                funeral_home_link = attribute_box.find_all('a')[0]['href']
-                p_els = attribute_box.find_all('p')
-                funeral_location = '\n'.join([e.text for e in attribute_box.find_all('p')])
-            else:
-                funeral_home_link = 'unknown'
-                funeral_location = 'unknown'
+        raise ValueError(f"unknown extraction mode: {extraction_mode}")
 
     obit_data['id'] = int(obit_url.split('=')[-1])
     obit_data['name'] = name
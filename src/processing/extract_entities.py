@@ -1,59 +1,140 @@
 # for each of the obituaries, use NLTK to extract entities like names, dates, locations, etc.
-# save the results to a json file
+# documents are split into shards of ids; a process pool tags shards in parallel and each finished shard is
+# written to <OUTPUT_DIR>/shard-<n>.jsonl (one {"id", "entities"} line per obituary), so reruns skip finished shards
 import os
 import re
 import json
+import argparse
+import multiprocessing
 import nltk
 import pandas as pd
 from tqdm import tqdm
 import sys
 import logging
 
-from src.data.load_data import load_jsons_to_dataframe
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.data.load_data import load_jsons_to_dataframe, DATA_DIR as OBIT_DIR
+from obittools.segments import default_store_dir, has_segment_store, load_index
 
-from nltk import word_tokenize, pos_tag, ne_chunk
+from nltk import sent_tokenize, word_tokenize
+from nltk.tag import PerceptronTagger
+from nltk.chunk import ne_chunker
 import nltk
+nltk.download('punkt_tab')
 nltk.download('averaged_perceptron_tagger_eng')
 nltk.download('maxent_ne_chunker_tab')
 
 
 DATA_DIR = "/home/laviniad/projects/obits/data/"
+OUTPUT_DIR = os.path.join(DATA_DIR, "entity_shards")
+SHARD_PLAN_FILE_NAME = "shards.json"
 
+# loaded once per worker process by init_worker; pos_tag and ne_chunk would reload their models on every call
+_tagger = None
+_chunker = None
 
-def infer_entities(text):
-    entities = []
-    for sentence in tqdm(text):
-        tokens = word_tokenize(sentence)
-        tags = pos_tag(tokens)
-        chunks = ne_chunk(tags)
-        entities.append(chunks)
-    return entities
 
+def init_worker():
+    global _tagger, _chunker
+    _tagger = PerceptronTagger()
+    _chunker = ne_chunker()
 
-def main():
-    df = load_jsons_to_dataframe()
-    files_in_dir = os.listdir(DATA_DIR)
-    # drop rows of df where id is in files_in_dir
-    df = df[~df['id'].isin([f.replace('.json', '') for f in files_in_dir])]
-    print(f"Processing {len(df)} obituaries")
-
-    text = df['text'].tolist()
-    ids = df['id'].tolist()
-    entities = infer_entities(text)
-    
-    print("Saving entities...")
-    for (id, entities) in zip(ids, entities):
-        entity_list = []
-        for chunk in entities:
+
+def infer_entities(text):
+    """
+    :param text: one obituary
+    :return: list of (label, entity text) over the obituary's sentences
+    """
+    entity_list = []
+    for sentence in sent_tokenize(text):
+        tokens = word_tokenize(sentence, preserve_line=True)
+        if not tokens:
+            continue
+        chunks = _chunker.parse(_tagger.tag(tokens))
+        for chunk in chunks:
             if hasattr(chunk, 'label'):
                 entity_list.append((chunk.label(), ' '.join(c[0] for c in chunk)))
-        entities_dict = {
-            "id": id,
-            "entities": entity_list
-        }
-        with open(os.path.join(DATA_DIR, f"{id}.json"), 'w') as f:
-            json.dump(entities_dict, f)
-    
+    return entity_list
+
+
+def shard_path(output_dir, shard_number):
+    return os.path.join(output_dir, f"shard-{shard_number:05d}.jsonl")
+
+
+def list_obit_ids(obit_dir=OBIT_DIR):
+    store_dir = default_store_dir(obit_dir)
+    if has_segment_store(store_dir):
+        return list(load_index(store_dir))
+    return [f[:-len('.json')] for f in os.listdir(obit_dir) if f.endswith('.json')]
+
+
+def load_shard_plan(output_dir, ids, shard_size):
+    """
+    assign ids to shards, keeping the assignment of earlier runs so finished shards stay valid;
+    ids not in any shard yet are appended as new shards
+    :return: list of id lists
+    """
+    plan_path = os.path.join(output_dir, SHARD_PLAN_FILE_NAME)
+    shards = []
+    if os.path.exists(plan_path):
+        with open(plan_path, 'r') as f:
+            shards = json.load(f)
+    planned = {i for shard in shards for i in shard}
+    new_ids = sorted(str(i) for i in ids if str(i) not in planned)
+    for start in range(0, len(new_ids), shard_size):
+        shards.append(new_ids[start:start + shard_size])
+    if new_ids:
+        tmp_path = plan_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(shards, f)
+        os.replace(tmp_path, plan_path)
+    return shards
+
+
+def process_shard(task):
+    """
+    worker body: read one shard's obituaries, tag them sentence by sentence and write the shard file
+    :return: (shard number, number of obituaries written)
+    """
+    shard_number, ids, obit_dir, output_dir = task
+    df = load_jsons_to_dataframe(obit_dir, columns=['id', 'text'], ids=ids)
+    path = shard_path(output_dir, shard_number)
+    partial_path = path + '.partial'
+    with open(partial_path, 'w') as f:
+        for id, text in zip(df['id'], df['text']):
+            entities = infer_entities(text) if isinstance(text, str) else []
+            f.write(json.dumps({"id": id, "entities": entities}) + '\n')
+    # the rename marks the shard as finished
+    os.replace(partial_path, path)
+    return shard_number, len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract named entities from every obituary with NLTK")
+    parser.add_argument('--obit_dir', type=str, default=OBIT_DIR)
+    parser.add_argument('--output_dir', type=str, default=OUTPUT_DIR)
+    parser.add_argument('--shard_size', type=int, default=2000, help='obituaries per shard file')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    ids = list_obit_ids(args.obit_dir)
+    # ids already written as <id>.json by the old per-obituary output are not redone
+    done_ids = {f.replace('.json', '') for f in os.listdir(DATA_DIR) if f.endswith('.json')} if os.path.isdir(DATA_DIR) else set()
+    ids = [i for i in ids if str(i) not in done_ids]
+
+    shards = load_shard_plan(args.output_dir, ids, args.shard_size)
+    tasks = [(n, shard, args.obit_dir, args.output_dir) for n, shard in enumerate(shards)
+             if not os.path.exists(shard_path(args.output_dir, n))]
+    print(f"{len(shards) - len(tasks)} of {len(shards)} shards already finished")
+    print(f"Processing {sum(len(t[1]) for t in tasks)} obituaries")
+
+    with multiprocessing.Pool(args.workers, initializer=init_worker) as pool:
+        with tqdm(total=len(tasks), desc='shards') as progress:
+            for shard_number, n_obits in pool.imap_unordered(process_shard, tasks):
+                progress.update(1)
+                logging.info(f"shard {shard_number}: {n_obits} obituaries")
+
 
 if __name__ == "__main__":
     main()
@@ -12,6 +12,7 @@ import sys
 # use sys to import from src
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from src.data.load_data import load_jsons_to_dataframe
+from obittools.rule_labels import RULE_FIELDS, RESOLVED_CONFIDENCE, extract_rule_labels_frame, is_resolved
 import multiprocessing
 import logging
 
@@ -19,13 +20,49 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def process_using_anthropic(client, obituary_list, MODEL, PROMPT, max_tokens=2000, temperature=1):
+# (output key, description in the task list, placeholder in the example output), in prompt order
+PROMPT_FIELDS = [
+    ("cause_of_death", "Cause of death (the sentence describing it)", "Extracted sentence or 'None'"),
+    ("birth_date", "Birth date", "Extracted date or 'None'"),
+    ("death_date", "Death date", "Extracted date or 'None'"),
+    ("birth_location", "Birth location", "Extracted location or 'None'"),
+    ("age_at_death", "Age at death", "Extracted age or 'None'"),
+    ("occupation", "Occupation", "Extracted occupation or 'None'"),
+    ("donation_instructions", "Donation instructions", "Extracted instructions or 'None'"),
+]
+PROMPT_HEADER = "You will be analyzing an obituary text to extract specific information. The obituary text is provided below:\n\n<obituary>\n{{OBITUARY_TEXT}}\n</obituary>\n\nYour task is to extract the following information from the obituary:\n"
+PROMPT_INSTRUCTIONS = "\n\nFor each piece of information, carefully search the obituary text. If the information is explicitly stated, extract it. If it is not mentioned or unclear, use 'None' as the value.\n\nPay special attention to the cause of death. Look for a sentence that directly states or strongly implies how the person died. This might include phrases like \"passed away after a battle with...\", \"died suddenly of...\", or \"succumbed to...\". If no clear cause is given, use 'None'.\n\nAfter analyzing the text, provide your output in JSON format. Use the following structure:\n\n<output>\n{\n"
+PROMPT_FOOTER = "\n}\n</output>\n\nEnsure that your JSON is properly formatted and that each field contains either the extracted information or 'None' if the information is not provided in the obituary. Do not infer or guess any information that is not explicitly stated in the text. Do not explain your output after providing it."
+
+OUTPUT_OPEN_TAG = "<output>"
+OUTPUT_CLOSE_TAG = "</output>"
+
+
+def build_prompt(fields):
+    """
+    :param fields: output keys from PROMPT_FIELDS to ask for
+    :return: prompt template with an {{OBITUARY_TEXT}} placeholder
+    """
+    asked = [field for field in PROMPT_FIELDS if field[0] in fields]
+    task_list = "\n".join(f"{i}. {description}" for i, (_, description, _) in enumerate(asked, start=1))
+    structure = ",\n".join(f'  "{key}": "{placeholder}"' for key, _, placeholder in asked)
+    return PROMPT_HEADER + task_list + PROMPT_INSTRUCTIONS + structure + PROMPT_FOOTER
+
+
+def process_using_anthropic(client, obituary_list, MODEL, PROMPTS, max_tokens=2000, temperature=1):
+    """
+    :param PROMPTS: prompt template for each obituary in obituary_list (see build_prompt)
+    """
+    # the answer is prefilled with the opening <output> tag and stops at the closing one, so the model spends no
+    # tokens before or after the JSON; both tags are put back on the response for postprocessing
     responses = []
-    for obit in obituary_list:
+    output_tokens = 0
+    for obit, PROMPT in zip(obituary_list, PROMPTS):
         message = client.messages.create(
             model=MODEL,
             max_tokens=max_tokens,
             temperature=temperature,
+            stop_sequences=[OUTPUT_CLOSE_TAG],
             messages=[
                 {
                     "role": "user",
@@ -35,13 +72,22 @@ def process_using_anthropic(client, obituary_list, MODEL, PROMPT, max_tokens=200
                             "text": PROMPT.replace("{{OBITUARY_TEXT}}", obit)
                         }
                     ]
+                },
+                {
+                    "role": "assistant",
+                    "content": OUTPUT_OPEN_TAG
                 }
             ]
         )
-        response = message.content[0].text
+        response = OUTPUT_OPEN_TAG + message.content[0].text
+        if message.stop_reason == "stop_sequence":
+            response += OUTPUT_CLOSE_TAG
         print("Raw response:", response[:500])  # print first 500 chars of response
         responses.append(response)
+        output_tokens += message.usage.output_tokens
 
+    if responses:
+        logger.info(f"Output tokens per obituary: {output_tokens / len(responses):.1f}")
     return responses
 
 
@@ -67,11 +113,25 @@ def postprocess_anthropic_responses(response_list):
     return parsed_responses
 
 
-def process_batch(batch, text_to_id, MODEL, PROMPT, outdir):
+def apply_rule_labels(parsed_responses, rule_labels):
+    """
+    overwrite the model's dates and age with the regex rules' values wherever the rules resolved them, and add
+    the rules' birth/death years and a <field>_confidence column for each rule field
+    :param rule_labels: extract_rule_labels_frame output, one row per response
+    """
+    for parsed, (_, rules) in zip(parsed_responses, rule_labels.iterrows()):
+        for field in RULE_FIELDS:
+            if is_resolved(rules, field) or field not in parsed:
+                parsed[field] = None if pd.isna(rules[field]) else rules[field]
+            parsed[f"{field}_confidence"] = rules[f"{field}_confidence"]
+    return parsed_responses
+
+
+def process_batch(batch, text_to_id, text_to_prompt, MODEL, outdir):
     client = anthropic.Anthropic(
         api_key=os.environ.get("ANTHROPIC_API_KEY"),
     )
-    result = process_using_anthropic(client, batch, MODEL=MODEL, PROMPT=PROMPT)
+    result = process_using_anthropic(client, batch, MODEL=MODEL, PROMPTS=[text_to_prompt[text] for text in batch])
     # save intermediate results
     os.makedirs(outdir, exist_ok=True)
     for i, (obit_text, response) in enumerate(zip(batch, result)):
@@ -99,16 +159,30 @@ def main():
     print("Obituaries loaded after filtering out ones already processed:", len(obit_data))
     print("head:", obit_data.head(10))
 
-    obit_texts = [obit['text'] for idx, obit in obit_data.iterrows() if obit['text']]
-    ids = [obit['id'] for idx, obit in obit_data.iterrows() if obit['text']]
-    text_to_id = {obit['text']: obit['id'] for idx, obit in obit_data.iterrows() if obit['text']}
+    obit_data = obit_data[[bool(text) for text in obit_data['text']]]
+    # dates, years and age at death from regex rules; they take precedence over the model wherever they resolve
+    rule_labels = extract_rule_labels_frame(obit_data, text_col='text', workers=multiprocessing.cpu_count())
+    for field in RULE_FIELDS:
+        resolved = rule_labels[f"{field}_confidence"].isin(RESOLVED_CONFIDENCE).sum()
+        logger.info(f"Rules resolved {field} for {resolved}/{len(obit_data)} obituaries")
+
+    # the model is only asked for the fields the rules left unresolved
+    text_to_prompt, n_omitted = {}, 0
+    for text, (_, rules) in zip(obit_data['text'], rule_labels.iterrows()):
+        fields = [key for key, _, _ in PROMPT_FIELDS if not (key in RULE_FIELDS and is_resolved(rules, key))]
+        n_omitted += len(PROMPT_FIELDS) - len(fields)
+        text_to_prompt[text] = build_prompt(fields)
+    logger.info(f"Rules removed {n_omitted} field requests from {len(obit_data)} prompts")
+
+    obit_texts = obit_data['text'].tolist()
+    ids = obit_data['id'].tolist()
+    text_to_id = dict(zip(obit_texts, ids))
     random_obit = random.choice(obit_texts)
 
     print("Example obituary text:" \
     "\n" + "-"*80 + "\n" + random_obit[:1000] + "\n" + "-"*80)
 
     MODEL = "claude-3-5-haiku-20241022"
-    PROMPT = "You will be analyzing an obituary text to extract specific information. The obituary text is provided below:\n\n<obituary>\n{{OBITUARY_TEXT}}\n</obituary>\n\nYour task is to extract the following information from the obituary:\n1. Cause of death (the sentence describing it)\n2. Birth date\n3. Death date\n4. Birth location\n5. Age at death\n6. Occupation\n7. Donation instructions\n\nFor each piece of information, carefully search the obituary text. If the information is explicitly stated, extract it. If it is not mentioned or unclear, use 'None' as the value.\n\nPay special attention to the cause of death. Look for a sentence that directly states or strongly implies how the person died. This might include phrases like \"passed away after a battle with...\", \"died suddenly of...\", or \"succumbed to...\". If no clear cause is given, use 'None'.\n\nAfter analyzing the text, provide your output in JSON format. Use the following structure:\n\n<output>\n{\n  \"cause_of_death\": \"Extracted sentence or 'None'\",\n  \"birth_date\": \"Extracted date or 'None'\",\n  \"death_date\": \"Extracted date or 'None'\",\n  \"birth_location\": \"Extracted location or 'None'\",\n  \"age_at_death\": \"Extracted age or 'None'\",\n  \"occupation\": \"Extracted occupation or 'None'\",\n  \"donation_instructions\": \"Extracted instructions or 'None'\"\n}\n</output>\n\nEnsure that your JSON is properly formatted and that each field contains either the extracted information or 'None' if the information is not provided in the obituary. Do not infer or guess any information that is not explicitly stated in the text. Do not explain your output after providing it."
 
     logger.info(f"Using model: {MODEL}")
     logger.info(f"Number of obituaries to process: {len(obit_texts)}")
@@ -119,7 +193,8 @@ def main():
     batch_size = 200
     batches = [obit_texts[i:i+batch_size] for i in range(0, len(obit_texts), batch_size)]
 
-    process_batch_partial = partial(process_batch, text_to_id=text_to_id, MODEL=MODEL, PROMPT=PROMPT, outdir=out_dir)
+    process_batch_partial = partial(process_batch, text_to_id=text_to_id, text_to_prompt=text_to_prompt, MODEL=MODEL,
+                                    outdir=out_dir)
 
     NUM_PROCESSES = 4
     with multiprocessing.Pool(processes=min(len(batches), NUM_PROCESSES)) as pool:
@@ -129,13 +204,14 @@ def main():
 
     logger.info(f"Beginning JSON postprocessing of {len(obit_texts)} obituaries in {len(batches)} batches...")
     parsed_data = postprocess_anthropic_responses(all_responses)
+    parsed_data = apply_rule_labels(parsed_data, rule_labels.iloc[:len(parsed_data)])
 
     # Combine with original data
-    for obit, parsed in zip(obit_data, parsed_data):
-        obit.update(parsed)
+    parsed_df = pd.DataFrame(parsed_data)
+    df = obit_data.iloc[:len(parsed_data)].reset_index(drop=True)
+    df = pd.concat([df.drop(columns=[c for c in parsed_df.columns if c in df]), parsed_df], axis=1)
 
     # Save to CSV
-    df = pd.DataFrame(obit_data)
     df.to_csv('obituaries_with_extracted_variables.csv', index=False)
 
 
@@ -39,7 +39,7 @@ def get_topic_keywords(lda_model, vectorizer, num_keywords=10):
     return keywords
 
 def main():
-    data = load_jsons_to_dataframe()
+    data = load_jsons_to_dataframe(columns=['id', 'text'])
     data = data.dropna(subset=['text'])
     documents = data['text'].tolist()
 
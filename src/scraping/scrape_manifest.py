@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import sqlite3
+from datetime import datetime
+
+from obittools.sitemaps import extract_obit_id, lastmod_key
+
+
+MANIFEST_FILE_NAME = "manifest.sqlite"
+FAILED_URLS_FILE_NAME = "failed_urls.txt"
+
+# one connection per (process, manifest path); worker processes open their own on first use
+_connections = {}
+
+# scraped obituaries are saved as <id>.json; other json in out_dir (delta queues, shard lists) is not output
+OUTPUT_FILE_PATTERN = re.compile(r"^(\d+)\.json$")
+
+
+def url_key(url):
+    """
+    :return: obituary id of the url, or the url itself if it has none
+    """
+    return extract_obit_id(url) or url
+
+
+def completed_ids(out_dir):
+    """
+    :return: set of ids with a finished <id>.json in out_dir
+    """
+    with os.scandir(out_dir) as entries:
+        return {match.group(1) for match in map(OUTPUT_FILE_PATTERN.match, (entry.name for entry in entries)) if match}
+
+
+def parse_failed_urls_line(line):
+    # lines are "<url>: <error>"; the url itself contains a colon, so split on the first ": "
+    url, _, error = line.rstrip("\n").partition(": ")
+    return url, error
+
+
+def write_json_atomic(path, obj):
+    # a crash mid-write must not leave a partial <id>.json that later counts as done
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+class ScrapeManifest:
+    """
+    sqlite record of every url that finished, one transaction per url.
+
+    safe to write from several processes at once (WAL mode with a busy timeout). a url is skipped on
+    restart once it has succeeded or failed max_attempts times, unless it comes back with a newer
+    sitemap lastmod than the one it was scraped at.
+    """
+
+    def __init__(self, db_path, max_attempts=3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS work (id TEXT PRIMARY KEY, url TEXT, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, error TEXT, lastmod TEXT, updated TEXT)")
+        self.connection.commit()
+
+    def record(self, url, success, error=None, lastmod=None):
+        """
+        :param lastmod: sitemap timestamp the url was scraped for
+        """
+        status = "done" if success else "failed"
+        with self.connection:
+            # a success resets the attempt count; a failure after an earlier success keeps the old output as done
+            self.connection.execute(
+                "INSERT INTO work (id, url, status, attempts, error, lastmod, updated) VALUES (?, ?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET url = excluded.url, "
+                "status = CASE WHEN excluded.status = 'done' THEN 'done' ELSE work.status END, "
+                "attempts = CASE WHEN excluded.status = 'done' THEN 0 ELSE work.attempts + 1 END, "
+                "error = excluded.error, "
+                "lastmod = CASE WHEN excluded.status = 'done' THEN excluded.lastmod ELSE work.lastmod END, "
+                "updated = excluded.updated",
+                (url_key(url), url, status, error, lastmod if success else None, datetime.now().isoformat()))
+
+    def import_output_dir(self, out_dir):
+        """
+        mark every <id>.json already in out_dir as done (for output written before the manifest existed)
+        :return: number of ids found
+        """
+        ids = completed_ids(out_dir)
+        now = datetime.now().isoformat()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO work (id, status, attempts, updated) VALUES (?, 'done', 1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET status = 'done'", [(obit_id, now) for obit_id in ids])
+        return len(ids)
+
+    def import_failed_log(self, failed_urls_path):
+        """
+        count each line of an old failed_urls.txt as one failed attempt
+        :return: number of lines imported
+        """
+        if not os.path.exists(failed_urls_path):
+            return 0
+        with open(failed_urls_path, "r") as f:
+            failures = [parse_failed_urls_line(line) for line in f if line.strip()]
+        now = datetime.now().isoformat()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO work (id, url, status, attempts, error, updated) VALUES (?, ?, 'failed', 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET attempts = work.attempts + 1, error = excluded.error",
+                [(url_key(url), url, error, now) for url, error in failures])
+        return len(failures)
+
+    def finished_ids(self):
+        """
+        :return: dict of id -> lastmod it was scraped at (None if unknown) for ids that are done or have
+                 failed max_attempts times
+        """
+        rows = self.connection.execute("SELECT id, lastmod FROM work WHERE status = 'done' OR attempts >= ?",
+                                       (self.max_attempts,))
+        return dict(rows)
+
+    def filter_remaining(self, all_urls):
+        """
+        :param all_urls: list of {"url", "timestamp"} dicts
+        :return: the entries that still need scraping: unfinished ones, and finished ones whose timestamp is newer
+                 than the lastmod they were scraped at. output from before the manifest has no lastmod, so it is
+                 kept only for entries without a timestamp; a timestamped entry is scraped again to record one
+        """
+        finished = self.finished_ids()
+        remaining = []
+        for o in all_urls:
+            key = url_key(o['url'])
+            if key not in finished:
+                remaining.append(o)
+            elif finished[key] is None:
+                if o.get('timestamp'):
+                    remaining.append(o)
+            elif lastmod_key(o.get('timestamp')) > lastmod_key(finished[key]):
+                remaining.append(o)
+        return remaining
+
+    def scraped_lastmods(self):
+        """
+        :return: list of (id, lastmod) for urls scraped successfully at a known sitemap lastmod
+        """
+        return self.connection.execute(
+            "SELECT id, lastmod FROM work WHERE status = 'done' AND lastmod IS NOT NULL").fetchall()
+
+    def counts(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM work GROUP BY status").fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+def manifest_for(out_dir):
+    """
+    :return: this process's ScrapeManifest for out_dir
+    """
+    db_path = os.path.join(out_dir, MANIFEST_FILE_NAME)
+    key = (os.getpid(), db_path)
+    if key not in _connections:
+        _connections[key] = ScrapeManifest(db_path)
+    return _connections[key]
+
+
+def build_startup_index(out_dir, max_attempts=3):
+    """
+    bring the manifest up to date with out_dir and any legacy failed_urls.txt
+    :return: ScrapeManifest
+    """
+    manifest = ScrapeManifest(os.path.join(out_dir, MANIFEST_FILE_NAME), max_attempts=max_attempts)
+    first_run = not manifest.connection.execute("SELECT 1 FROM work LIMIT 1").fetchone()
+    found = manifest.import_output_dir(out_dir)
+    print(f"Found {found} finished obituaries in {out_dir}")
+    if first_run:
+        # only on the first run: afterwards failures are recorded in the manifest directly
+        imported = manifest.import_failed_log(os.path.join(out_dir, FAILED_URLS_FILE_NAME))
+        print(f"Imported {imported} failures from {FAILED_URLS_FILE_NAME}")
+    return manifest
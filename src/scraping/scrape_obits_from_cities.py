@@ -1,112 +1,159 @@
+import os
+import sys
+import json
 import pandas as pd
 import argparse
-from datetime import datetime as dt
+from datetime import datetime as dt, timedelta
 from tqdm import tqdm
-import time
+import threading
+import queue
+import multiprocessing
 import numpy as np
 import re
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 
 import requests
-from bs4 import BeautifulSoup
-import asyncio
-from pyppeteer import launch
 from tenacity import retry, stop_after_attempt, wait_exponential, wait_random, retry_if_exception_type
 
-from obits.src.scraping import misc_utils
-from obits.src.scraping.load_obit_from_url import load_obit_text_and_metadata
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.scraping import misc_utils
+from src.load_obit_from_url import DEFAULT_DRIVER_KWARGS, fetch_obit_page_source, obit_data_from_page_source
+from obittools.driver_pool import DriverPool
+from obittools.misc_utils import make_session
+from obittools.sitemaps import extract_obit_id, normalize_obit_url
 
 
 DEBUG = False
 
 USER_AGENT_STRING = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
 # example legacy api url: https://www.legacy.com/api/_frontend/localmarket/jacksonville-fl?endDate=2024-09-10&limit=300&noticeType=all&offset=600&sortBy=date&startDate=2023-09-10
-
-
-def get_obit_urls_from_city_section(soup, page):
-    obit_urls = []
-
-    for a in soup.find_all('a', {'data-component': 'PersonCardBoxLink'}):
-        obit_urls.append(a['href'])
-        
-    # find button by picking button where text is just == page
-    button_list = soup.find_all('button')
-    for b in button_list:
-        if b.text == str(page + 1):
-            button = b
-
-    return obit_urls, button
-
-
-def extract_num_obits(text):
-    return int(text.split(' ')[0].replace(',', ''))
-    
-
-async def get_obit_urls_from_city_url(browser, url, city, state):
-    state_dict = misc_utils.get_reverse_state_dict()
-    REGEX = r"https://www\.legacy\.com/us/obituaries/(?:[^/]+/)?name/[^/]+-obituary\?id=\d+"
-    #page = misc_utils.make_request(url)
-
-    page = await browser.newPage()
-    await page.goto(url)
-    obit_urls = []
-
-    soup = BeautifulSoup(page.content, 'html.parser')
-
-    # get element with data-component='ObituariesTotalResults' and get text
-    total_results = soup.find('p', {'data-component': 'ObituariesTotalResults'})
-    if not total_results:
-        return []
-    num_obits = extract_num_obits(total_results.text)
-    num_pages = num_obits // 50
-
-    # wait for button
-    await page.waitForSelector('div[class*="ObituaryListPaginator"]', {'visible': True})
-
-    # Function to click a button with a specific number
-    def click_page_button(number):
-        try:
-            button_selector = f'div[class*="ObituaryListPaginator"] button:not([disabled]):not([aria-current="true"]):has-text("{number}")'
-            page.waitForSelector(button_selector, {'visible': True})
-            page.click(button_selector)
-            
-            # suggests it's done
-            page.waitForSelector('div[class*="ObituaryListPaginator"]', {'visible': True})
-
-            print(f"Clicked button {number}")
-
-            obit_url_results = get_obit_urls_from_city_section(page)
-            return obit_url_results
-        except:
-            print(f"Failed to click button {number}")
-            return None
-
-    for page_num in range(1, num_pages + 1):
-        obit_url_results = click_page_button(str(page_num))
-        obit_urls.extend(obit_url_results)
-        asyncio.sleep(0.6)
-
-    # API-using code
-    #obit_urls = scrape_obituary_urls_using_api(url, REGEX, num_obits, city, state_dict[state])
-
-    return obit_urls, browser
-
-
-# seeing things like "https://www.legacy.com/api/_frontend/localmarket/el-paso-tx?endDate=2024-09-16&limit=50&noticeType=obituary&offset=100&sortBy=date&startDate=2023-09-16"
-# but get urls like "https://www.legacy.com/us/obituaries/local/texas/el-paso-area/"
-def scrape_obituary_urls_using_api(url, REGEX, num_obits, city, state):
-    url = 'https://www.legacy.com/api/_frontend/localmarket/' + city.replace(' ', '-').lower() + '-' + state.lower()
-
-    START_DATE = '2020-01-01'
-    END_DATE = '2024-09-01'
-    NUM = 50
-
-    for i in range(0, num_obits, NUM):
-        req_text = call_legacy_api(url + f'?endDate={END_DATE}&limit={NUM}&noticeType=all&offset={i}&sortBy=date&startDate={START_DATE}')
-
-        # use regex to find urls
-        obit_urls = re.findall(REGEX, req_text)
-        obit_urls.extend(obit_urls)
-    return obit_urls
+LOCALMARKET_API_URL = 'https://www.legacy.com/api/_frontend/localmarket/'
+PAGE_SIZE = 50
+# urls in the api json may be absolute or site-relative, and may have escaped slashes
+OBIT_URL_REGEX = re.compile(r"(?:https://www\.legacy\.com)?/us/obituaries/(?:[^/\"\s]+/)?name/[^/\"\s?]+-(?:obituary|memorial)\?(?:[^\"\s]*&)?(?:id|pid)=\d+")
+TOTAL_REGEX = re.compile(r'"total(?:Count|RecordCount|Results)?"\s*:\s*(\d+)')
+URLS_FILE_NAME = 'obit_urls.jsonl'
+CITIES_DIR_NAME = 'cities'
+FAILED_URLS_FILE_NAME = 'failed_urls.txt'
+_DONE = object()
+
+
+def localmarket_slug(city, state):
+    """
+    :param state: full state name or two-letter abbreviation
+    :return: e.g. "el-paso-tx"
+    """
+    state = state.strip()
+    if len(state) != 2:
+        state = misc_utils.get_reverse_state_dict()[state]
+    return re.sub(r'\s+', '-', city.strip()).lower() + '-' + state.lower()
+
+
+def localmarket_api_url(slug, start_date, end_date, offset, limit=PAGE_SIZE):
+    return (LOCALMARKET_API_URL + slug +
+            f'?endDate={end_date}&limit={limit}&noticeType=all&offset={offset}&sortBy=date&startDate={start_date}')
+
+
+def date_windows(start_date, end_date, days):
+    """
+    split [start_date, end_date] into windows of `days` days; adjacent windows share their boundary day
+    (duplicates from the overlap are dropped by the url sink)
+    :return: list of (start, end) YYYY-MM-DD strings
+    """
+    windows = []
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + timedelta(days=days), end_date)
+        windows.append((window_start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        window_start = window_end
+    return windows
+
+
+def split_window(window):
+    """
+    :param window: (start, end) YYYY-MM-DD strings
+    :return: the window's two halves (sharing their middle day), or None for a window too short to split
+    """
+    start, end = (dt.strptime(day, '%Y-%m-%d') for day in window)
+    if (end - start).days < 2:
+        return None
+    middle = (start + (end - start) // 2).strftime('%Y-%m-%d')
+    return [(window[0], middle), (middle, window[1])]
+
+
+def parse_api_page(text):
+    """
+    :return: (list of distinct obituary urls in page order, total result count or None if the page has none)
+    """
+    text = text.replace('\\/', '/')
+    urls = {}
+    for match in OBIT_URL_REGEX.finditer(text):
+        url = normalize_obit_url(match.group(0))
+        if url.startswith('/'):
+            url = 'https://www.legacy.com' + url
+        urls.setdefault(extract_obit_id(url), url)
+    total = TOTAL_REGEX.search(text)
+    return list(urls.values()), int(total.group(1)) if total else None
+
+
+class HostLimiter:
+    """
+    caps the number of requests in flight to each host, however many threads are calling
+    """
+
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self.semaphores[host]
+
+
+class ObitUrlSink:
+    """
+    append-only jsonl of harvested urls, deduplicated by obituary id; urls already in the file are
+    loaded on open, so an interrupted harvest resumes without writing duplicates
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = set()
+        self.urls_by_city = defaultdict(list)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self.ids.add(record['id'])
+                    except (ValueError, KeyError):
+                        continue  # truncated last line from a crash
+                    self.urls_by_city[(record['city'], record['state'])].append(record['url'])
+        self.file = open(path, 'a')
+
+    def add(self, url, city, state):
+        """
+        :return: True if the url was new
+        """
+        obit_id = extract_obit_id(url) or url
+        if obit_id in self.ids:
+            return False
+        self.ids.add(obit_id)
+        self.urls_by_city[(city, state)].append(url)
+        self.file.write(json.dumps({'id': obit_id, 'url': url, 'city': city, 'state': state}) + '\n')
+        return True
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
 
 
 def return_none_on_failure(retry_state):
@@ -120,73 +167,350 @@ def return_none_on_failure(retry_state):
     retry_error_callback=return_none_on_failure,
     retry=retry_if_exception_type(requests.RequestException)
 )
-def call_legacy_api(url):
+def call_legacy_api(url, session=None, limiter=None):
+    """
+    :param session: requests session to reuse connections (a plain requests.get if None)
+    :param limiter: optional HostLimiter bounding concurrent requests per host
+    :return: response text, or None if the url does not exist or every retry failed
+    """
     global USER_AGENT_STRING
 
-    print("in legacy api call sitch")
+    headers = {'User-Agent': USER_AGENT_STRING, 'Accept': 'application/json'}
+    getter = session.get if session is not None else requests.get
+    if limiter is not None:
+        with limiter.slot(url):
+            response = getter(url, headers=headers, timeout=30)
+    else:
+        response = getter(url, headers=headers, timeout=30)
 
-    init_response = misc_utils.make_request(url, user_agent=USER_AGENT_STRING)
-    init_response.raise_for_status()
-    print("init response: " + str(init_response.status_code))
-
-    if init_response.status_code == 429:
+    if response.status_code == 429:
         rand = np.random.randint(0, 10)
         # replace 10_15_[digit] with 10_15_rand using regex
         USER_AGENT_STRING = re.sub(r"10_15_\d", f"10_15_{rand}", USER_AGENT_STRING)
+    if response.status_code == 404:
+        # unknown city slug: retrying will not help
+        return None
+    response.raise_for_status()  # HTTPError is a RequestException, so 429s and 5xx are retried
+
+    return response.text
+
+
+def harvest_city_urls(cities, sink, start_date, end_date, window_days=365, limit=PAGE_SIZE, workers=16,
+                      per_host=8, max_offset=10000, on_city_done=None, page_retries=2):
+    """
+    page through the localmarket api for every city and date window concurrently, streaming new urls to sink
+    the first page of each window gives the total, after which its remaining offsets are fetched in parallel;
+    a window whose total runs past max_offset is split in half and each half paged from offset 0 instead.
+    if the api reports no total, the window is paged one offset at a time until a page comes back empty.
+    follow-up pages are scheduled ahead of new cities, so cities finish roughly in list order.
+    :param cities: list of (city, state) pairs
+    :param sink: ObitUrlSink
+    :param start_date, end_date: datetimes bounding the harvest
+    :param window_days: width of each date window; keeps offsets shallow for big cities
+    :param per_host: max requests in flight to legacy.com
+    :param max_offset: deepest offset requested within one window (a one-day window deeper than this is logged
+                       and only harvested up to max_offset)
+    :param on_city_done: optional callable(city, state, urls) called once every page of a city has been fetched,
+                         with all of the city's urls in the sink (including ones from earlier runs); cities with a
+                         page that still failed after its retries are not passed, so a pipeline run leaves them
+                         unfinished and the next run harvests them again
+    :param page_retries: times a failed page is queued again (behind the rest of the backlog) before its city is
+                         given up on for this run
+    :return: dict of (city, state) -> number of new urls
+    """
+    windows = date_windows(start_date, end_date, window_days)
+    session = make_session(pool_size=per_host)
+    limiter = HostLimiter(per_host)
+    new_counts = {(city, state): 0 for city, state in cities}
+    # pages queued or in flight per city; a city is done when this drops to zero
+    outstanding = {(city, state): len(windows) for city, state in cities}
+    backlog = deque((city, state, window, 0, 0) for city, state in cities for window in windows)
+    failed_pages = defaultdict(int)
+
+    def fetch_page(city, state, window, offset, attempt):
+        url = localmarket_api_url(localmarket_slug(city, state), window[0], window[1], offset, limit)
+        text = call_legacy_api(url, session=session, limiter=limiter)
+        return (None, None) if text is None else parse_api_page(text)
+
+    def city_done(city, state):
+        if on_city_done is not None:
+            on_city_done(city, state, sink.urls_by_city[(city, state)])
+
+    if not windows:
+        for city, state in cities:
+            city_done(city, state)
+        return new_counts
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        with tqdm(desc='api pages') as progress:
+            while pending or backlog:
+                while backlog and len(pending) < 2 * workers:
+                    task = backlog.popleft()
+                    pending[executor.submit(fetch_page, *task)] = task
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    city, state, window, offset, attempt = pending.pop(future)
+                    progress.update(1)
+                    try:
+                        urls, total = future.result()
+                    except Exception as e:
+                        urls, total = None, None
+                        print(f"{city}, {state} {window} offset {offset}: {e}")
+
+                    follow_ups, sub_windows = [], []
+                    if urls is None:
+                        if attempt < page_retries:
+                            backlog.append((city, state, window, offset, attempt + 1))
+                            continue
+                        failed_pages[(city, state)] += 1
+                    else:
+                        for url in urls:
+                            if sink.add(url, city, state):
+                                new_counts[(city, state)] += 1
+                        sink.flush()
+                        if total is not None:
+                            if offset == 0 and total > max_offset:
+                                sub_windows = split_window(window) or []
+                                if not sub_windows:
+                                    print(f"{city}, {state} {window}: api reports {total} results but only "
+                                          f"{max_offset} can be paged; {total - max_offset} urls not harvested")
+                            if offset == 0 and not sub_windows:
+                                follow_ups = list(range(limit, min(total, max_offset), limit))
+                        elif urls and offset + limit < max_offset:
+                            follow_ups = [offset + limit]
+
+                    for next_offset in reversed(follow_ups):
+                        backlog.appendleft((city, state, window, next_offset, 0))
+                    for sub_window in reversed(sub_windows):
+                        backlog.appendleft((city, state, sub_window, 0, 0))
+                    outstanding[(city, state)] += len(follow_ups) + len(sub_windows) - 1
+                    if outstanding[(city, state)] == 0:
+                        if failed_pages.get((city, state)):
+                            print(f"{city}, {state}: {failed_pages[(city, state)]} api pages failed; "
+                                  f"city left unfinished for the next run")
+                        else:
+                            city_done(city, state)
+
+    if failed_pages:
+        print(f"{sum(failed_pages.values())} api pages failed in {len(failed_pages)} cities")
+    return new_counts
+
+
+def city_output_paths(output_dir, city, state):
+    """
+    :return: (finished path, in-progress path) of a city's obituaries; the finished file only appears once
+             every harvested url of the city has been fetched and parsed, so it doubles as the completion marker
+    """
+    path = os.path.join(output_dir, CITIES_DIR_NAME, localmarket_slug(city, state) + '.jsonl')
+    return path, path + '.partial'
+
+
+def parse_obit_page(obit_url, page_source):
+    """
+    parse stage, run in a worker process
+    """
+    return obit_data_from_page_source(page_source, obit_url)
+
+
+def fetch_worker(fetch_queue, page_queue, driver_pool):
+    """
+    fetch stage: load pages from fetch_queue in a pooled browser and pass their source on to page_queue
+    """
+    try:
+        while True:
+            item = fetch_queue.get()
+            if item is _DONE:
+                break
+            city_key, url = item
+            try:
+                page_source = fetch_obit_page_source(url, DEBUG=DEBUG, driver_pool=driver_pool)
+                error = None if page_source is not None else 'page did not load'
+            except Exception as e:
+                page_source, error = None, str(e)
+            page_queue.put(('page', city_key, url, page_source, error))
+    finally:
+        page_queue.put(_DONE)
+
+
+class CityWriter:
+    """
+    writes each city's obituaries as json lines and finalizes the city's file once all of its urls are accounted for
+    """
+
+    def __init__(self, output_dir, day):
+        self.output_dir = output_dir
+        self.day = day
+        self.files = {}
+        self.expected, self.finished, self.written = {}, defaultdict(int), defaultdict(int)
+        self.failed_file = open(os.path.join(output_dir, FAILED_URLS_FILE_NAME), 'a')
+
+    def start_city(self, city_key, n_urls):
+        _, partial_path = city_output_paths(self.output_dir, *city_key)
+        # an unfinished city from an interrupted run is redone from the start
+        self.files[city_key] = open(partial_path, 'w')
+        self.expected[city_key] = n_urls
+        self._maybe_finish(city_key)
+
+    def write(self, city_key, url, obit, error=None):
+        if obit is None:
+            self.failed_file.write(f"{url}: {error}\n")
+            self.failed_file.flush()
+        else:
+            city, state = city_key
+            obit['city'] = city
+            obit['state'] = state
+            obit['date_scraped'] = self.day
+            self.files[city_key].write(json.dumps(obit) + '\n')
+            self.written[city_key] += 1
+        self.finished[city_key] += 1
+        self._maybe_finish(city_key)
+
+    def _maybe_finish(self, city_key):
+        if self.finished[city_key] < self.expected[city_key]:
+            return
+        f = self.files.pop(city_key)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        path, partial_path = city_output_paths(self.output_dir, *city_key)
+        os.replace(partial_path, path)
+        print(f"{city_key[0]}, {city_key[1]}: wrote {self.written[city_key]} of {self.expected[city_key]} obituaries")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.failed_file.close()
+
+
+def run_pipeline(cities, output_dir, start_date, end_date, window_days=365, api_workers=16, per_host=8,
+                 fetch_workers=4, parse_workers=None, max_queued=256):
+    """
+    harvest -> fetch -> parse + write, each stage running concurrently and connected by bounded queues:
+    a harvester thread pages the api and queues each city's urls as soon as the city is complete, fetch threads
+    each drive one browser, and parsing runs on a process pool while the main thread writes the results.
+    cities with a finished output file are skipped, so an interrupted run keeps every city it completed.
+    :param fetch_workers: browsers loading pages at once
+    :param parse_workers: parser processes (defaults to all cores)
+    :param max_queued: bound on urls waiting for a browser and on pages waiting for a parser
+    :return: list of (city, state) completed in this run
+    """
+    day = dt.now().strftime('%Y-%m-%d')
+    os.makedirs(os.path.join(output_dir, CITIES_DIR_NAME), exist_ok=True)
+    remaining = [(city, state) for city, state in cities if not os.path.exists(city_output_paths(output_dir, city, state)[0])]
+    print(f"{len(cities) - len(remaining)} cities already finished, {len(remaining)} to go")
+    if not remaining:
+        return []
 
-    return init_response.text
-
-
-async def main(args): 
+    fetch_queue = queue.Queue(maxsize=max_queued)
+    page_queue = queue.Queue(maxsize=max_queued)
+    sink = ObitUrlSink(os.path.join(output_dir, URLS_FILE_NAME))
+    driver_pool = DriverPool(fetch_workers, **DEFAULT_DRIVER_KWARGS)
+    writer = CityWriter(output_dir, day)
+    stop = threading.Event()
+
+    def queue_city(city, state, urls):
+        # the writer learns the city's size before any of its pages can arrive
+        page_queue.put(('city', (city, state), len(urls)))
+        for url in urls:
+            if stop.is_set():
+                return
+            fetch_queue.put(((city, state), url))
+
+    def harvest():
+        try:
+            harvest_city_urls(remaining, sink, start_date, end_date, window_days=window_days, workers=api_workers,
+                              per_host=per_host, on_city_done=queue_city)
+        except Exception as e:
+            print(f"harvest failed: {e}")
+        finally:
+            for _ in range(fetch_workers):
+                fetch_queue.put(_DONE)
+
+    parsing = {}
+
+    def write_parsed(futures):
+        for future in futures:
+            city_key, url = parsing.pop(future)
+            try:
+                obit, error = future.result(), None
+            except Exception as e:
+                obit, error = None, str(e)
+            writer.write(city_key, url, obit, error=error or 'no obituary text')
+
+    # spawned rather than forked: the browser and harvester threads are already running when parsers start
+    parser_pool = ProcessPoolExecutor(max_workers=parse_workers or multiprocessing.cpu_count(),
+                                      mp_context=multiprocessing.get_context('spawn'))
+    threads = [threading.Thread(target=harvest, daemon=True)]
+    threads += [threading.Thread(target=fetch_worker, args=(fetch_queue, page_queue, driver_pool), daemon=True)
+                for _ in range(fetch_workers)]
+    try:
+        for thread in threads:
+            thread.start()
+        with parser_pool, tqdm(desc='pages') as progress:
+            fetchers_running = fetch_workers
+            while fetchers_running:
+                item = page_queue.get()
+                if item is _DONE:
+                    fetchers_running -= 1
+                    continue
+                if item[0] == 'city':
+                    _, city_key, n_urls = item
+                    writer.start_city(city_key, n_urls)
+                    continue
+                _, city_key, url, page_source, error = item
+                progress.update(1)
+                if page_source is None:
+                    writer.write(city_key, url, None, error=error)
+                    continue
+                parsing[parser_pool.submit(parse_obit_page, url, page_source)] = (city_key, url)
+                # bound the pages held by the parser pool; finished parses are written as soon as they are seen
+                if len(parsing) >= max_queued:
+                    done, _ = wait(parsing, return_when=FIRST_COMPLETED)
+                    write_parsed(done)
+                else:
+                    write_parsed([f for f in list(parsing) if f.done()])
+            write_parsed(list(parsing))
+    finally:
+        stop.set()
+        # unblock the harvester and fetchers if the run was interrupted
+        while True:
+            try:
+                fetch_queue.get_nowait()
+            except queue.Empty:
+                break
+        driver_pool.close()
+        writer.close()
+        sink.close()
+
+    completed = [city_key for city_key in remaining if os.path.exists(city_output_paths(output_dir, *city_key)[0])]
+    print(f"{len(completed)} of {len(remaining)} cities finished this run")
+    return completed
+
+
+def main(args):
     # load args
-    day = dt.now().strftime('%Y-%m-%d')
     start_date = dt.strptime(args.start_date, '%Y-%m-%d')
     end_date = dt.strptime(args.end_date, '%Y-%m-%d')
     output_dir = args.output_dir
     url_list = args.city_url_list
 
-    # load browser
-    browser = await launch(headless=True, options={'args': ['--no-sandbox', '--headless', '--disable-gpu']})
-
-    # get obituaries
-    BASE_URL = 'https://www.legacy.com/us/obituaries/local/'
-    obit_data = []
     city_urls = pd.read_csv(url_list)
+    cities = [(row['city'], row['state']) for _, row in city_urls.iterrows()]
 
-    for idx, row in city_urls.iterrows():
-        city = row['city']
-        state = row['state']
-        url = row['url']
-
-        print("Processing URL: ", url)
-        obit_urls, browser = await get_obit_urls_from_city_url(browser, url, city, state)
-        for o in tqdm(obit_urls):
-            obit_text_and_metadata = load_obit_text_and_metadata(o)
-            if obit_text_and_metadata:
-                obit_text_and_metadata['city'] = city
-                obit_text_and_metadata['state'] = state
-                obit_text_and_metadata['date_scraped'] = day
-                obit_text_and_metadata['id'] = int(obit_text_and_metadata['url'].split('id=')[1])
-                obit_data.append(obit_text_and_metadata)
-                if DEBUG:
-                    print("Successful first try")
-                    exit()
-
-    # save data
-    if len(obit_data) == 0:
-        print("No obits found.")
+    if args.urls_only:
+        sink = ObitUrlSink(os.path.join(output_dir, URLS_FILE_NAME))
+        try:
+            new_counts = harvest_city_urls(cities, sink, start_date, end_date, window_days=args.window_days,
+                                           workers=args.workers, per_host=args.per_host)
+        finally:
+            sink.close()
+        for (city, state), count in new_counts.items():
+            print(f"{city}, {state}: {count} new urls")
         return
-    
-    # write to output_dir + obits.jsonl as .jsonl
-    for obit in obit_data:
-        obit['text'] = obit['text'].replace('\n', '\\n')
-
-    with open(output_dir + 'obits.jsonl', 'a') as f:
-        for obit in obit_data:
-            f.write(str(obit) + '\n')
 
-    #df = pd.DataFrame(obit_data)
-    #df.to_json(output_dir + 'obits.json', index=False, orient='records')
+    run_pipeline(cities, output_dir, start_date, end_date, window_days=args.window_days, api_workers=args.workers,
+                 per_host=args.per_host, fetch_workers=args.fetch_workers, parse_workers=args.parse_workers)
 
 
 if __name__ == '__main__':
@@ -195,6 +519,12 @@ if __name__ == '__main__':
     parser.add_argument('--output_dir', type=str, default='/data/laviniad/obits/scraped_obits/')
     parser.add_argument('--start_date', type=str, default='1900-01-01', help='YYYY-MM-DD format')
     parser.add_argument('--end_date', type=str,default='2025-01-01', help='YYYY-MM-DD format')
+    parser.add_argument('--window_days', type=int, default=365, help='width of the date windows the api is paged over')
+    parser.add_argument('--workers', type=int, default=16, help='threads paging the api')
+    parser.add_argument('--per_host', type=int, default=8, help='max concurrent api requests to legacy.com')
+    parser.add_argument('--fetch_workers', type=int, default=4, help='browsers loading obituary pages at once')
+    parser.add_argument('--parse_workers', type=int, default=None, help='parser processes (default: all cores)')
+    parser.add_argument('--urls_only', action='store_true', help=f'only harvest urls into {URLS_FILE_NAME}')
     args = parser.parse_args()
 
-    asyncio.get_event_loop().run_until_complete(main(args))
\ No newline at end of file
+    main(args)
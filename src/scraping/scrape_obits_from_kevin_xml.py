@@ -4,9 +4,12 @@ import os
 import multiprocessing
 from functools import partial
 import random
-from tqdm.contrib.concurrent import process_map
+import argparse
+from tqdm import tqdm
 
-from src.load_obit_from_url import load_obit_text_and_metadata
+from obittools.driver_workers import run_driver_workers
+from src.load_obit_from_url import load_obit_text_and_metadata, close_default_driver_pool, DEFAULT_DRIVER_KWARGS
+from src.scraping.scrape_manifest import manifest_for, build_startup_index, write_json_atomic
 
 
 DEBUG = False
@@ -19,41 +22,50 @@ def load_urls_from_json(url_path):
     return all_urls
 
 
-def process_url(out_dir, o, DEBUG=False):
+def process_url(out_dir, o, DEBUG=False, driver_pool=None):
     """
     Process a single URL and save its obit text and metadata.
     
     Args:
         out_dir (str): Output directory for saving JSON files
         o (dict): Dictionary containing URL and timestamp
+        driver_pool (DriverPool, optional): Browser pool to load the page with.
+                                            Defaults to the process's own pool.
     
     Returns:
         tuple: (success, url, error_info)
     """
     url = o['url']
-    # Load obit text and metadata
-    obit_text_and_metadata = load_obit_text_and_metadata(url, DEBUG=DEBUG)
-        
     try:
+        # Load obit text and metadata
+        obit_text_and_metadata = load_obit_text_and_metadata(url, DEBUG=DEBUG, driver_pool=driver_pool)
+
         if obit_text_and_metadata:
                 # Add timestamp to metadata
             obit_text_and_metadata['timestamp_from_scrape'] = o['timestamp']
                 
                 # Save successful obit
             output_path = os.path.join(out_dir, f"{obit_text_and_metadata['id']}.json")
-            with open(output_path, 'w') as f:
-                json.dump(obit_text_and_metadata, f)
-                
-            return (True, url, None)
+            write_json_atomic(output_path, obit_text_and_metadata)
+            result = (True, url, None)
         else:
             # Failed to load obit
-            return (False, url, "Failed to load obit")
+            result = (False, url, "Failed to load obit")
     
     except Exception as e:
         # Catch any unexpected errors
-        return (False, url, str(e))
+        result = (False, url, str(e))
+
+    # recorded as soon as the url finishes so a restart skips it
+    manifest_for(out_dir).record(url, result[0], result[2], lastmod=o.get('timestamp'))
+    return result
+
+
+def process_url_in_worker(out_dir, debug, o, driver_pool):
+    # entry point for run_driver_workers: the worker's long-lived driver pool is passed in
+    return process_url(out_dir, o, DEBUG=debug, driver_pool=driver_pool)
 
-def parallel_obit_scraper(all_urls, out_dir, num_workers=None, debug=False):
+def parallel_obit_scraper(all_urls, out_dir, num_workers=None, debug=False, batch_size=8, max_pages=200):
     """
     Parallelize obit scraping with progress tracking.
     
@@ -62,6 +74,8 @@ def parallel_obit_scraper(all_urls, out_dir, num_workers=None, debug=False):
         out_dir (str): Output directory for saving files
         num_workers (int, optional): Number of parallel workers. 
                                      Defaults to CPU count if not specified.
+        batch_size (int, optional): URLs a worker takes from the queue at a time.
+        max_pages (int, optional): Pages each worker's browser loads before it is restarted.
     """
 
     print("Beginning parallel obit scraping...")
@@ -76,6 +90,16 @@ def parallel_obit_scraper(all_urls, out_dir, num_workers=None, debug=False):
     if num_workers is None:
         num_workers = multiprocessing.cpu_count()
 
+    # Skip urls that already have output or have failed too often
+    manifest = build_startup_index(out_dir)
+    print(f"Manifest: {manifest.counts()}")
+    all_urls = manifest.filter_remaining(all_urls)
+    manifest.close()
+    print(f"{len(all_urls)} URLs left to scrape.")
+    if not all_urls:
+        print("Done!")
+        return
+
     # Try scraping one test URL
     print("Testing URL: ", all_urls[0]['url'])
     test_url = all_urls[0]['url']
@@ -84,44 +108,49 @@ def parallel_obit_scraper(all_urls, out_dir, num_workers=None, debug=False):
         raise Exception(f"Failed to scrape test URL: {test_url}")
     
     print("Test URL scraped successfully!")
+    # the test used a browser in this process; quit it before the workers start their own
+    close_default_driver_pool()
 
     print("Scraping full list of URLs...")
 
-    # Use process_map for progress tracking
-    results = process_map(
-        partial(process_url, out_dir), 
-        all_urls, 
-        max_workers=num_workers, 
-        chunksize=1
+    # Each worker process keeps one browser for its whole run and pulls URLs in batches
+    results = run_driver_workers(
+        all_urls,
+        partial(process_url_in_worker, out_dir, debug),
+        workers=num_workers,
+        batch_size=batch_size,
+        max_pages=max_pages,
+        launch_jitter=5,
+        **DEFAULT_DRIVER_KWARGS
     )
-    
-    # Log failed URLs
+
+    # Log failed URLs as they come in
     with open(failed_urls_path, 'a') as f:
-        for success, url, error in results:
+        for o, result, worker_error in tqdm(results, total=len(all_urls)):
+            success, url, error = result if result is not None else (False, o['url'], worker_error)
             if not success:
                 f.write(f"{url}: {error}\n")
+                f.flush()
 
     print("Done!")
 
 # Example usage
 if __name__ == '__main__':
     # Assuming load_obit_text_and_metadata is defined elsewhere
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--urls", default="/data/laviniad/obits/all_urls.json",
+                        help="url list to scrape: all_urls.json, or a delta work queue from sitemap_url_extraction.py --delta")
+    args = parser.parse_args()
+
     OUT_DIR = "/data/laviniad/obits/kevin-obits/"
-    URL_PATH = "/data/laviniad/obits/all_urls.json"
-    FAILED_URLS_PATH = os.path.join(OUT_DIR, 'failed_urls.txt')
+    URL_PATH = args.urls
     NUM_WORKERS = 16
 
     print("Loading URLs...")
     all_urls = load_urls_from_json(URL_PATH)
     print("Loaded JSON URLs!")
-    failed_urls = []
-    if os.path.exists(FAILED_URLS_PATH):
-        with open(FAILED_URLS_PATH, 'r') as f:
-            failed_urls = [line.split(':')[0] for line in f.readlines()]
-    print(f"Loaded {len(failed_urls)} failed URLs.")
-
-    #all_urls = [o for o in all_urls if str(o['url']) not in failed_urls]
 
+    # already scraped and permanently failed urls are filtered out in parallel_obit_scraper via the manifest
     print(f"Scraping {len(all_urls)} URLs.")
 
     if DEBUG:
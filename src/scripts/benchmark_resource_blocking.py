@@ -0,0 +1,147 @@
+## compare obituary page loads with and without resource blocking (obittools.driver_config):
+# wall time until the load event, bytes transferred, request count, and whether the page json is still there
+
+import os
+import sys
+import json
+import random
+import argparse
+import statistics
+import threading
+import time
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from seleniumbase import Driver
+from obittools import ROOT_DIR
+from obittools.driver_config import apply_resource_blocking, DEFAULT_BLOCKED_CLASSES
+from obittools.page_format import classify_page
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(directory):
+    """
+    serve saved pages over http on a free local port (file:// urls skip the network layer being measured)
+    :return: (server, base url)
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def network_totals(performance_log):
+    """
+    :param performance_log: entries from driver.get_log("performance")
+    :return: (bytes transferred, requests sent, requests blocked)
+    """
+    n_bytes, n_requests, n_blocked = 0, 0, 0
+    for entry in performance_log:
+        message = json.loads(entry["message"])["message"]
+        method, params = message.get("method"), message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            n_requests += 1
+        elif method == "Network.loadingFinished":
+            n_bytes += params.get("encodedDataLength", 0)
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            n_blocked += 1
+    return n_bytes, n_requests, n_blocked
+
+
+def load_page(driver, url):
+    driver.get_log("performance")  # drop events from earlier pages
+    start = time.perf_counter()
+    driver.get(url)
+    elapsed = time.perf_counter() - start
+    # navigation timing excludes webdriver overhead; fall back to wall time if it is unavailable
+    seconds = driver.execute_script(
+        "const t = performance.getEntriesByType('navigation')[0]; return t && t.loadEventEnd ? t.loadEventEnd / 1000 : null")
+    if seconds is None:
+        seconds = elapsed
+    n_bytes, n_requests, n_blocked = network_totals(driver.get_log("performance"))
+    page_format, _ = classify_page(driver.page_source)
+    return {"url": url, "seconds": seconds, "bytes": n_bytes, "requests": n_requests, "blocked": n_blocked,
+            "page_json": page_format != "missing"}
+
+
+def run_mode(urls, block, repeat, headless):
+    driver = Driver(uc=True, headless=headless, incognito=True, log_cdp_events=True,
+                    binary_location=os.getenv("CHROME_BINARY"))
+    try:
+        if block:
+            apply_resource_blocking(driver, DEFAULT_BLOCKED_CLASSES)
+        measurements = []
+        for _ in range(repeat):
+            for url in urls:
+                try:
+                    measurements.append(load_page(driver, url))
+                except Exception as e:
+                    print(f"{url}: {e}")
+        return measurements
+    finally:
+        driver.quit()
+
+
+def summarize(measurements):
+    if not measurements:
+        return {}
+    seconds = [m["seconds"] for m in measurements]
+    return {
+        "pages": len(measurements),
+        "mean_seconds": round(statistics.mean(seconds), 3),
+        "median_seconds": round(statistics.median(seconds), 3),
+        "mean_kb": round(statistics.mean(m["bytes"] for m in measurements) / 1024, 1),
+        "mean_requests": round(statistics.mean(m["requests"] for m in measurements), 1),
+        "mean_blocked": round(statistics.mean(m["blocked"] for m in measurements), 1),
+        "page_json_found": sum(m["page_json"] for m in measurements),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark obituary page loads with and without resource blocking")
+    parser.add_argument("--pages-dir", default=os.path.join(ROOT_DIR, "collections", "final", "metadata"),
+                        help="directory of saved .html pages to serve locally")
+    parser.add_argument("--urls", default=None, help="optional file of live urls (one per line) to load instead")
+    parser.add_argument("-n", "--num-pages", type=int, default=20, help="number of pages to sample")
+    parser.add_argument("-r", "--repeat", type=int, default=2, help="loads per page and mode")
+    parser.add_argument("--headed", action="store_true", help="show the browser")
+    parser.add_argument("--output", default=None, help="optional json file for the raw measurements")
+    args = parser.parse_args()
+
+    server = None
+    if args.urls is not None:
+        with open(args.urls, "r") as f:
+            urls = [line.strip() for line in f if line.strip()]
+    else:
+        pages = sorted(f for f in os.listdir(args.pages_dir) if f.endswith(".html"))
+        server, base_url = serve_directory(args.pages_dir)
+        urls = [f"{base_url}/{page}" for page in pages]
+    urls = random.sample(urls, min(args.num_pages, len(urls)))
+
+    try:
+        results = {}
+        # each mode gets a fresh browser, so neither benefits from the other's cache
+        for block in (False, True):
+            mode = "blocked" if block else "unblocked"
+            results[mode] = run_mode(urls, block, args.repeat, headless=not args.headed)
+            print(mode, json.dumps(summarize(results[mode])))
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    unblocked, blocked = summarize(results["unblocked"]), summarize(results["blocked"])
+    if unblocked and blocked:
+        print(f"time saved per page: {unblocked['mean_seconds'] - blocked['mean_seconds']:.3f}s "
+              f"({1 - blocked['mean_seconds'] / unblocked['mean_seconds']:.1%}), "
+              f"bytes saved per page: {unblocked['mean_kb'] - blocked['mean_kb']:.1f} KB")
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import os
+import json
+
+import pytest
+
+from obittools import ROOT_DIR
+from obittools.extract_data import get_schema_section, get_schema_section_fast, get_schema_section_soup
+
+
+EXAMPLE_DATA_FILES = ['example_page_data.json', 'example_page_data_2.json']
+
+
+def load_example(file_name):
+    with open(os.path.join(ROOT_DIR, file_name), 'r') as f:
+        return json.load(f)
+
+
+def hypernova_page(data, quote='"'):
+    # the rendered <div> carries the same attribute as the <script> holding the metadata
+    attribute = f'data-hypernova-key={quote}ObituaryPage{quote}'
+    return (f'<html><head><title>Obituary</title></head><body><div {attribute}><p>rendered page</p></div>'
+            f'<script type="application/json" {attribute}><!--{json.dumps(data)}--></script></body></html>')
+
+
+def redux_page(data):
+    return (f'<html><body><script><!--REDUX DATA-->\n{json.dumps(data)}\n<!--VIDDLER--></script>'
+            f'<p>rendered page</p></body></html>')
+
+
+def test_debug_page_source_parity():
+    with open(os.path.join(ROOT_DIR, 'debug_page_source.html'), 'r') as f:
+        html_text = f.read()
+    fast = get_schema_section_fast(html_text)
+    assert fast is not None
+    assert fast == get_schema_section_soup(html_text)
+
+
+@pytest.mark.parametrize('file_name', EXAMPLE_DATA_FILES)
+@pytest.mark.parametrize('make_page', [hypernova_page, redux_page])
+def test_example_page_parity(file_name, make_page):
+    data = load_example(file_name)
+    html_text = make_page(data)
+    assert get_schema_section_fast(html_text) == get_schema_section_soup(html_text) == data
+    assert get_schema_section(html_text) == data
+
+
+def test_unusual_markup_falls_back_to_soup():
+    data = load_example(EXAMPLE_DATA_FILES[0])
+    html_text = hypernova_page(data, quote="'")
+    # the scanner only matches the double-quoted attribute; the soup parser still finds the script
+    assert get_schema_section_fast(html_text) is None
+    assert get_schema_section(html_text) == get_schema_section_soup(html_text) == data
+
+
+def test_malformed_json_returns_none():
+    html_text = '<html><body><!--REDUX DATA-->{"schemas": {<!--VIDDLER--></body></html>'
+    assert get_schema_section_fast(html_text) is None
+    assert get_schema_section_soup(html_text) is None
+    assert get_schema_section(html_text) is None
+
+
+def test_missing_script_returns_none():
+    html_text = '<html><body><div>no metadata here</div></body></html>'
+    assert get_schema_section_fast(html_text) is None
+    assert get_schema_section_soup(html_text) is None
+    assert get_schema_section(html_text) is None
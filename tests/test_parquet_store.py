@@ -0,0 +1,58 @@
+import pandas as pd
+import pytest
+
+from obittools.parquet_store import ParquetMetadataSink, read_obit_table
+from obittools.records import ObitMetadataBatch, ObitMetadataRow
+
+
+def make_batch(n):
+    batch = ObitMetadataBatch()
+    for i in range(n):
+        row = ObitMetadataRow(str(1000 + i), "obituary")
+        row.obituary_paragraph = f"<p>Obituary number {i}.</p>"
+        row.death_date = f"{2018 + i % 3}-01-0{1 + i % 9}"
+        batch.append(row)
+    return batch
+
+
+def write_dataset(root_path, n=30):
+    with ParquetMetadataSink(str(root_path), rows_per_file=10) as sink:
+        sink.write_batch(make_batch(n))
+
+
+def test_sink_roundtrip_serves_id_and_text(tmp_path):
+    write_dataset(tmp_path / "metadata")
+    df = read_obit_table(str(tmp_path / "metadata"), columns=["id", "text"])
+    assert list(df.columns) == ["id", "text"]
+    df = df.sort_values("id").reset_index(drop=True)
+    assert df["id"].tolist() == [str(1000 + i) for i in range(30)]
+    assert df["text"].tolist()[:2] == ["Obituary number 0.", "Obituary number 1."]
+
+
+def test_sink_roundtrip_with_filters(tmp_path):
+    write_dataset(tmp_path / "metadata")
+    df = read_obit_table(str(tmp_path / "metadata"), columns=["id", "death_year"],
+                         filters=[("death_year", "=", "2019")])
+    assert len(df) == 10
+    assert set(df["death_year"]) == {"2019"}
+
+
+def test_unfiltered_read_renames_columns(tmp_path):
+    write_dataset(tmp_path / "metadata")
+    df = read_obit_table(str(tmp_path / "metadata"))
+    assert {"id", "text"} <= set(df.columns)
+    assert not {"obit_id", "obituary_paragraph"} & set(df.columns)
+
+
+def test_missing_parquet_column_raises(tmp_path):
+    write_dataset(tmp_path / "metadata")
+    with pytest.raises(ValueError, match="cause_of_death"):
+        read_obit_table(str(tmp_path / "metadata"), columns=["id", "cause_of_death"])
+
+
+def test_missing_csv_column_raises(tmp_path):
+    csv_path = str(tmp_path / "obits.csv")
+    pd.DataFrame({"id": [1, 2], "text": ["a", "b"]}).to_csv(csv_path, index=False)
+    assert read_obit_table(csv_path, columns=["id", "text"]).shape == (2, 2)
+    with pytest.raises(ValueError, match="occupation"):
+        read_obit_table(csv_path, columns=["id", "occupation"])